@@ -0,0 +1,273 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Microbenchmarks of the per-frame hot paths of Frames.
+# Run from the repository root:
+#   python3 benchmarks/bench_frames.py [--save] [--check] [--tolerance 20] [--filter hash]
+#   micropython benchmarks/bench_frames.py [--save] [--scale 0.2]
+# Reports ns/op (fastest of --repeat runs) and bytes allocated per op and compares them to
+# the baseline of the implementation (benchmarks/baseline_<implementation>.json).
+# The times are compared relative to hash/16 of the same run, so the baseline of another
+# machine still applies. --check exits with 1 if a benchmark got slower than the tolerance
+# (percent) or allocates more than in the baseline, a slower benchmark is measured again
+# first.
+# --save stores the results as the new baseline, --scale multiplies the iterations.
+
+import sys
+import gc
+import time
+import json
+
+_MPY = sys.implementation.name == "micropython"
+if not _MPY:
+    import os
+    import tracemalloc
+
+    _root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, _root)
+    sys.path.insert(0, os.path.join(_root, "benchmarks", "stubs"))
+    _t0 = time.perf_counter_ns()
+    time.ticks_us = lambda: ((time.perf_counter_ns() - _t0) // 1000) & 0x3FFFFFFF
+    time.ticks_ms = lambda: ((time.perf_counter_ns() - _t0) // 1000000) & 0x3FFFFFFF
+    time.ticks_diff = lambda a, b: ((a - b + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+    _BASE = os.path.join(_root, "benchmarks")
+else:
+    _BASE = sys.argv[0].rsplit("/", 1)[0] if "/" in sys.argv[0] else "."
+    sys.path.append(_BASE + "/..")
+
+from wlan_link_libs.frames import Frames, hash, hash_update, _LEN_HEADER, _RESP_TRUE
+from wlan_link_libs.schema import Schema
+from wlan_link_libs import header
+
+
+class _Comm:
+    """Link replaying the last written frame, so it can be read back"""
+
+    def __init__(self):
+        self._buf = bytearray(1100)
+        self._w = 0
+        self._r = 0
+
+    def reset(self):
+        self._w = 0
+
+    def rewind(self):
+        self._r = 1  # skip start byte
+
+    def write_byte(self, b):
+        self._buf[self._w] = b
+        self._w += 1
+
+    def write(self, buf):
+        n = len(buf)
+        self._buf[self._w:self._w + n] = buf
+        self._w += n
+
+    def read_frame(self, buffer, length, timeout=10):
+        buffer[:length] = memoryview(self._buf)[self._r:self._r + length]
+        self._r += length
+
+
+_ARGS = {
+    "none": (),
+    "int": (12345,),
+    "bytes32": (b"x" * 32,),
+    "mixed4": (42, "hostname.local", True, b"y" * 128),
+    "bytes400": (b"z" * 400,),
+    "params8": (1, 2, 3, 4, b"a", b"bb", b"ccc", False),
+}
+
+
+def _timer():
+    if _MPY:
+        return time.ticks_us()
+    return time.perf_counter_ns()
+
+
+def _elapsed_ns(st):
+    if _MPY:
+        return time.ticks_diff(time.ticks_us(), st) * 1000
+    return time.perf_counter_ns() - st
+
+
+_REF = "hash/16"  # reference for the relative times
+_RETRIES = 2  # measurements again of a benchmark slower than the tolerance
+
+
+def _run(f, n):
+    st = _timer()
+    for _ in range(n):
+        f()
+    return _elapsed_ns(st)
+
+
+def measure(f, n, repeat=5, ref=None):
+    """Returns the fastest ns/op of repeat runs, bytes allocated per op of calling f() n times
+    and the time relative to ref (function, iterations) run before every run, so the load
+    of the machine changing during the benchmarks doesn't matter. Noise only ever adds
+    time, so the fastest run is the most stable estimate."""
+    f()  # warm up, e.g. caches
+    t = r = None
+    alloc = 0
+    for _ in range(repeat):
+        gc.collect()
+        if ref:
+            rt = _run(ref[0], ref[1]) / ref[1]
+            r = rt if r is None else min(r, rt)
+        if _MPY:
+            gc.disable()
+            a = gc.mem_alloc()
+            tt = _run(f, n)
+            alloc = gc.mem_alloc() - a
+            gc.enable()
+        else:
+            tt = _run(f, n)
+        t = tt if t is None else min(t, tt)
+    if not _MPY:
+        # peak of a single call, CPython frees most objects immediately
+        tracemalloc.start()
+        b = tracemalloc.get_traced_memory()[0]
+        f()
+        alloc = (tracemalloc.get_traced_memory()[1] - b) * n
+        tracemalloc.stop()
+    return t // n, alloc // n, t / n / r if r else 1
+
+
+def benchmarks():
+    """Generator of (name, function, iterations)"""
+    comm = _Comm()
+    fr = Frames(comm, 500, 500)
+    for size in (16, 128, 400):
+        buf = bytes(range(256)) * 2
+        buf = memoryview(buf)[:size]
+        yield "hash/{}".format(size), lambda buf=buf: hash(buf[:7], (buf[7:],)), 1000
+        yield "hash_update/{}".format(size), lambda buf=buf: hash_update(0xceed, buf), 1000
+    for name in ("none", "int", "bytes32", "mixed4", "bytes400", "params8"):
+        args = _ARGS[name]
+
+        def create(args=args):
+            return fr._create_packet(30, len(args), None, args)
+
+        yield "_create_packet/" + name, create, 2500
+        num = create()
+        if num:
+            types = fr._types
+            params = fr._params
+            yield "_create_param_header/" + name, lambda num=num, params=params, \
+                types=types: fr._create_param_header(params, types, num), 10000
+        comm.reset()
+        fr._write_packet(num)
+        frame = bytes(memoryview(comm._buf)[:comm._w])
+
+        def read(frame=frame):
+            comm._buf[:len(frame)] = frame
+            comm.rewind()
+            return fr._read_packet()
+
+        yield "_read_packet/" + name, read, 2500
+        if num:
+            read()  # not run by main if filtered out
+            rb = fr._readmv
+            head = bytes(rb[_LEN_HEADER:_LEN_HEADER + num * 2])
+            body = bytes(rb[_LEN_HEADER + num * 2:(rb[1] & 0x03) << 8 | rb[2]])
+            head = memoryview(head)
+            body = memoryview(body)
+            yield "_transform_from_payload/" + name, lambda head=head, \
+                body=body: fr._transform_from_payload(head, body), 5000
+    schema = Schema((int, bytes, int, int, bool))
+    buf = bytearray(500)
+    args = (1, b"192.168.178.10", 8883, 1, True)
+    data = [None]
+    yield "schema_encode/connect", lambda: schema.encode(buf, _LEN_HEADER, args, 0, data), 5000
+    l = schema.encode(buf, _LEN_HEADER, args, 0, data)
+    buf[_LEN_HEADER + schema.size:_LEN_HEADER + l] = data[0]
+    mv = memoryview(buf)
+    yield "schema_decode/connect", lambda: schema.decode(mv, _LEN_HEADER, _LEN_HEADER + l), 5000
+
+    def answer():
+        return fr._create_packet(30, 1, _RESP_TRUE, (True, 400), 1, True)
+
+    yield "_create_packet/answer_int", answer, 5000
+    # bit packing only, viper on MicroPython ports with the viper emitter
+    yield "_create_header", lambda: fr._create_header(30, 2, 300, _RESP_TRUE, 5, True), 10000
+    yield "_read_header", fr._read_header, 10000
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except OSError:
+        return None
+
+
+def main(argv):
+    save = "--save" in argv
+    check = "--check" in argv
+    tolerance = 20
+    flt = None
+    scale = 1
+    repeat = 5
+    for i, a in enumerate(argv):
+        if a == "--tolerance":
+            tolerance = int(argv[i + 1])
+        elif a == "--filter":
+            flt = argv[i + 1]
+        elif a == "--scale":  # more (or less, e.g. 0.2 on slow boards) iterations
+            scale = float(argv[i + 1])
+        elif a == "--repeat":
+            repeat = int(argv[i + 1])
+    path = "{}/baseline_{}.json".format(_BASE, sys.implementation.name)
+    baseline = _load(path)
+    if baseline is not None and _REF not in baseline:
+        baseline = None
+    results = {}
+    failed = []
+    print("header implementation:", header.IMPLEMENTATION)
+    print("{:<36}{:>10}{:>10}{:>14}".format("benchmark", "ns/op", "B/op", "vs baseline"))
+    ref = None
+    for name, f, n in benchmarks():
+        n = max(int(n * scale), 1)
+        if name == _REF:
+            ref = (f, n)
+        if flt and flt not in name:
+            continue
+        ns, alloc, r = measure(f, n, repeat, ref)
+        cmp = ""
+        if name == _REF:
+            cmp = "reference"
+        elif baseline and name in baseline:
+            bns, balloc = baseline[name]
+            br = bns / baseline[_REF][0]
+            d = int((r - br) * 100 / br) if br else 0
+            for _ in range(_RETRIES):  # a real regression stays, a disturbed run doesn't
+                if d <= tolerance:
+                    break
+                ns2, alloc, r = measure(f, n, repeat, ref)
+                ns = min(ns, ns2)
+                d = min(d, int((r - br) * 100 / br))
+            cmp = "{:+d}%".format(d)
+            if d > tolerance or alloc > balloc:
+                failed.append(name)
+                cmp += " REGRESSION"
+        results[name] = [ns, alloc]
+        print("{:<36}{:>10}{:>10}{:>14}".format(name, ns, alloc, cmp))
+    if save:
+        with open(path, "w") as f:
+            json.dump(results, f)
+        print("Saved baseline", path)
+    elif baseline is None:
+        print("No baseline for {}, create it with --save".format(sys.implementation.name))
+    if failed and not save:
+        print("Regressions:", ", ".join(failed))
+        if check:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
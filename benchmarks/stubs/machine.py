@@ -0,0 +1,16 @@
+# Minimal stand-in so the benchmarks run on CPython. Only used if not on MicroPython.
+
+
+class UART:
+    pass
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+
+def idle():
+    pass
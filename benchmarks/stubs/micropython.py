@@ -0,0 +1,12 @@
+# Minimal stand-ins so the benchmarks run on CPython. Only used if not on MicroPython.
+
+
+def const(x):
+    return x
+
+
+def native(f):
+    return f
+
+
+viper = native
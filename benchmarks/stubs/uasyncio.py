@@ -0,0 +1,8 @@
+# Minimal stand-in so the benchmarks run on CPython. Only used if not on MicroPython.
+
+from asyncio import *
+
+
+class StreamReader:
+    def __init__(self, s):
+        self.s = s
@@ -0,0 +1,3 @@
+# Minimal stand-in so the tests run on CPython. Only used if not on MicroPython.
+
+from socket import *
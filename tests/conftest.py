@@ -0,0 +1,27 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+# Runs the tests on CPython: the MicroPython modules imported by wlan_link_libs
+# (micropython, machine, uasyncio, usocket) are taken from the stubs of the benchmarks and time
+# gets the ticks functions. Imported by pytest and by the tests when run as script.
+
+import os
+import sys
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _root not in sys.path:
+    sys.path.insert(0, _root)
+try:
+    import micropython
+except ImportError:
+    sys.path.append(os.path.join(_root, "benchmarks", "stubs"))
+
+if not hasattr(time, "ticks_us"):
+    _t0 = time.perf_counter_ns()
+    time.ticks_us = lambda: ((time.perf_counter_ns() - _t0) // 1000) & 0x3FFFFFFF
+    time.ticks_ms = lambda: ((time.perf_counter_ns() - _t0) // 1000000) & 0x3FFFFFFF
+    time.ticks_add = lambda a, b: (a + b) & 0x3FFFFFFF
+    time.ticks_diff = lambda a, b: ((a - b + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
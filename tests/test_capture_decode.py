@@ -0,0 +1,60 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Decoding and request/answer pairing of tools/capture_decode.py, CPython only.
+
+if __name__ == "__main__":
+    import conftest  # run as script, sets up the imports like for pytest
+
+from tools.capture_decode import Frame, analyse, crc, CAP_TX, CAP_DATA, FLAG_NO_REPLY, \
+    REPLY_FLAG
+
+
+def _raw(head, payload=b""):
+    raw = bytearray(head + b"\x00\x00" + payload)
+    c = crc(raw)
+    raw[5] = c >> 8
+    raw[6] = c & 0xFF
+    return bytes(raw)
+
+
+def _cmd(t, cmd, tx=False, flags=0, resp=0):
+    return Frame(t, CAP_TX if tx else 0, _raw(bytes((cmd, flags, 0, resp << 4, 0))))
+
+
+def _data(t, op, socknum, length, tx=False):
+    return Frame(t, CAP_DATA | (CAP_TX if tx else 0),
+                 _raw(bytes((op, socknum >> 8, socknum & 0xFF, length >> 8, length & 0xFF))))
+
+
+def test_send_nr():
+    fr = _data(0, 6, 3, 120)
+    assert fr.crc_ok and fr.name == "DATA_SEND_NR"
+    assert fr.describe() == "DATA_SEND_NR sock=3 len=120"
+    frames = [fr, _data(100, 1, 3, 20), _data(250, 1 | 0x80, 3, 20, tx=True)]
+    stats, gaps, crc_errors = analyse(frames)
+    assert stats[("data", 6)]["latency"] == []
+    assert stats[("data", 1)]["latency"] == [150]
+    assert not crc_errors
+
+
+def test_no_reply_command():
+    close_nr = _cmd(0, 25, flags=FLAG_NO_REPLY)
+    assert close_nr.no_reply and "no_reply" in close_nr.describe()
+    answer = _cmd(1100, 25 | REPLY_FLAG, tx=True, flags=FLAG_NO_REPLY, resp=1)
+    assert not answer.no_reply  # bit 7 of byte 1 only counts in requests
+    frames = [close_nr, _cmd(1000, 25), answer]
+    stats, gaps, crc_errors = analyse(frames)
+    # paired with the answered close, not with the one without reply
+    assert stats[("cmd", 25)]["latency"] == [100]
+    assert stats[("cmd", 25)]["rx"] == 2 and stats[("cmd", 25)]["tx"] == 1
+
+
+if __name__ == "__main__":
+    for name in sorted(k for k in globals() if k.startswith("test_")):
+        globals()[name]()
+        print(name, "ok")
@@ -0,0 +1,134 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.2"
+
+# Parity of wlan_link_libs.header with the reference bit packing of the frame format.
+# Tests the implementation selected at import: the pure Python one on CPython (pytest) and
+# the viper one on MicroPython ports with the viper emitter (run the file as a script).
+
+import sys
+
+if __name__ == "__main__" and sys.implementation.name != "micropython":
+    import conftest  # run as script on CPython, sets up the imports like for pytest
+
+from wlan_link_libs import header
+import array
+
+_FLAGS = (0, 0x40, 0x80, 0xC0)
+
+
+def _rand(seed=12345):
+    """Portable LCG, MicroPython's random module differs between ports"""
+    x = seed
+    while True:
+        x = (x * 1103515245 + 12345) & 0x7FFFFFFF
+        yield x >> 8
+
+
+def _ref_header(cmd, flags, num_params, len_packet, response_code, payload):
+    return bytes((cmd, flags | ((num_params << 2) & 0x3C) | ((len_packet >> 8) & 0x03),
+                  len_packet & 0xFF, (response_code << 4) & 0xF0, payload))
+
+
+def _ref_unpack(buf):
+    return (buf[0], (buf[1] & 0x3C) >> 2, (buf[1] & 0x03) << 8 | buf[2], buf[3] >> 4, buf[4],
+            buf[5] << 8 | buf[6])
+
+
+def test_pack_header():
+    buf = bytearray(7)
+    mv = memoryview(buf)
+    rnd = _rand()
+    for cmd in range(256):
+        for flags in _FLAGS:
+            num_params = next(rnd) % 16
+            len_packet = next(rnd) % 1024
+            response_code = next(rnd) % 16
+            payload = next(rnd) % 256
+            assert header.pack_header(mv, cmd | flags << 8, num_params, len_packet) == 0
+            assert header.pack_response(mv, response_code, payload) == 0
+            assert bytes(buf[:5]) == _ref_header(cmd, flags, num_params, len_packet,
+                                                 response_code, payload)
+    for len_packet in (0, 1, 255, 256, 511, 512, 1022, 1023):
+        assert header.pack_header(mv, 30, 15, len_packet) == 0
+        assert bytes(buf[:3]) == _ref_header(30, 0, 15, len_packet, 0, 0)[:3]
+
+
+def test_pack_out_of_range():
+    buf = bytearray(b"\xAA" * 7)
+    mv = memoryview(buf)
+    assert header.pack_header(mv, 256, 0, 7) == 255
+    assert header.pack_header(mv, 0x1FF | 0x4000, 0, 7) == 255
+    assert header.pack_header(mv, -1, 0, 7) == 255
+    assert header.pack_header(mv, 0x10000, 0, 7) == 255
+    assert header.pack_header(mv, 1, 16, 7) == 15
+    assert header.pack_header(mv, 1, -1, 7) == 15
+    assert header.pack_header(mv, 1, 0, 1024) == 1023
+    assert header.pack_header(mv, 1, 0, -1) == 1023
+    assert header.pack_response(mv, 16, 0) == 15
+    assert header.pack_response(mv, -1, 0) == 15
+    assert header.pack_response(mv, 0, 256) == 255
+    assert header.pack_response(mv, 0, -1) == 255
+    assert buf == b"\xAA" * 7  # nothing written
+
+
+def test_unpack_header():
+    buf = bytearray(7)
+    rnd = _rand(1)
+    for _ in range(2000):
+        for i in range(7):
+            buf[i] = next(rnd) & 0xFF
+        assert tuple(header.unpack_header(memoryview(buf))) == _ref_unpack(buf)
+        assert tuple(header.unpack_header(buf)) == _ref_unpack(buf)
+
+
+def test_param_header():
+    buf = bytearray(7 + 30)
+    mv = memoryview(buf)
+    rnd = _rand(2)
+    types = bytearray(15)
+    lengths = array.array("H", bytes(30))
+    rtypes = bytearray(15)
+    for _ in range(200):
+        n = next(rnd) % 16
+        params = [b"x" * (next(rnd) % 1024) for _ in range(n)]
+        for i in range(n):
+            types[i] = next(rnd) % 5
+        assert header.pack_param_header(mv, params, types, n) == n * 2
+        for i in range(n):
+            l = len(params[i])
+            assert buf[7 + i * 2] == (types[i] << 2) | (l >> 8)
+            assert buf[8 + i * 2] == l & 0xFF
+        assert header.unpack_param_header(mv[7:7 + n * 2], lengths, rtypes) == n
+        for i in range(n):
+            assert lengths[i] == len(params[i])
+            assert rtypes[i] == types[i]
+
+
+def test_frames_roundtrip():
+    from wlan_link_libs.frames import Frames
+    fr = Frames(None, 500, 500)
+    args = (42, b"y" * 300, "host", True, None, 1.5)
+    num = fr._create_packet(30, len(args), None, args)
+    l = fr._len_head + sum(len(fr._params[i]) for i in range(num))
+    fr._readmv[:fr._len_head] = fr._sendmv[:fr._len_head]
+    p = fr._len_head
+    for i in range(num):
+        fr._readmv[p:p + len(fr._params[i])] = fr._params[i]
+        p += len(fr._params[i])
+    cmd, num_params, len_packet, response_code, payload, crc = fr._read_header()
+    assert (cmd, num_params, len_packet, response_code, payload) == (30, 6, l, 0, 0)
+    fr._check_frame()
+    params = fr._transform_from_payload(fr._readmv[7:7 + num * 2], fr._readmv[7 + num * 2:l])
+    assert params[0] == 42 and bytes(params[1]) == b"y" * 300 and bytes(params[2]) == b"host"
+    assert params[3] is True and params[4] is None and params[5] == 1.5
+
+
+if __name__ == "__main__":
+    print("implementation", header.IMPLEMENTATION)
+    for name in sorted(k for k in globals() if k.startswith("test_")):
+        globals()[name]()
+        print(name, "ok")
@@ -0,0 +1,146 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Reading response bodies with wlan_host.http._Body from a non-blocking fake socket, CPython only.
+
+if __name__ == "__main__":
+    import conftest  # run as script, sets up the imports like for pytest
+
+import errno
+from wlan_host.http import _Body
+
+
+class _Sock:
+    """readinto returns the pieces in order, None for no data available and 0 at EOF"""
+
+    def __init__(self, *pieces):
+        self._pieces = list(pieces)
+        self.reads = 0
+
+    def readinto(self, buf):
+        self.reads += 1
+        if not self._pieces:
+            return 0
+        p = self._pieces[0]
+        if p is None:
+            self._pieces.pop(0)
+            return None
+        n = min(len(buf), len(p))
+        buf[:n] = p[:n]
+        if n == len(p):
+            self._pieces.pop(0)
+        else:
+            self._pieces[0] = p[n:]
+        return n
+
+    def unread(self) -> bytes:
+        return b"".join(p for p in self._pieces if p is not None)
+
+
+def _read(body, size=7):
+    """Body until EOF and the number of readinto calls without data"""
+    data = bytearray()
+    buf = bytearray(size)
+    empty = 0
+    for _ in range(1000):
+        n = body.readinto(buf)
+        if n is None:
+            empty += 1
+        elif n == 0:
+            assert body.readinto(buf) == 0  # stays at EOF
+            return bytes(data), empty
+        else:
+            data += buf[:n]
+    raise AssertionError("no EOF")
+
+
+def _reset(body, size=7):
+    try:
+        _read(body, size)
+    except OSError as e:
+        assert e.args[0] == errno.ECONNRESET
+    else:
+        raise AssertionError("closed within the body")
+
+
+_CHUNKED = b"5\r\nhello\r\n6;name=value\r\n world\r\n0\r\n\r\n"
+
+
+def test_chunked():
+    s = _Sock(_CHUNKED + b"HTTP/1.1")
+    assert _read(_Body(s, None, True)) == (b"hello world", 0)
+    assert s.unread() == b"HTTP/1.1"  # nothing read past the final CRLF
+
+
+def test_chunked_split_reads():
+    # every byte in its own read with no data in between
+    pieces = []
+    for i in range(len(_CHUNKED)):
+        pieces += [_CHUNKED[i:i + 1], None]
+    s = _Sock(*pieces)
+    # the no data after the final LF doesn't get read
+    assert _read(_Body(s, None, True), 3) == (b"hello world", len(_CHUNKED) - 1)
+    assert s.unread() == b""
+    # framing lines, chunk data and the final CRLF split across reads
+    s = _Sock(b"5\r", None, b"\nhel", None, b"lo\r", None, b"\n6;na", None, b"me=value\r\n w",
+              b"orld", None, b"\r\n0\r", None, b"\n\r", None, b"\n")
+    assert _read(_Body(s, None, True)) == (b"hello world", 7)
+    assert s.unread() == b""
+
+
+def test_chunked_hex_and_long_extension():
+    s = _Sock(b"1A;" + b"x" * 50 + b"\r\n", b"a" * 26, b"\r\n0\r\n\r\n")
+    assert _read(_Body(s, None, True), 400) == (b"a" * 26, 0)
+
+
+def test_chunked_trailer():
+    s = _Sock(b"3\r\nabc\r\n0\r\nExpires: never\r\nX-Sum: 1\r\n\r\n", None, b"next")
+    assert _read(_Body(s, None, True)) == (b"abc", 0)
+    assert s.unread() == b"next"
+
+
+def test_chunked_closed_early():
+    _reset(_Body(_Sock(b"5\r\nhel"), None, True))
+    _reset(_Body(_Sock(b"5\r\nhello\r\n"), None, True))  # no last chunk
+    _reset(_Body(_Sock(b"5\r\nhello\r\n0\r\n"), None, True))  # no final CRLF
+
+
+def test_content_length():
+    s = _Sock(b"hello", None, b" wor", None, b"ldHTTP/1.1")
+    assert _read(_Body(s, 11, False)) == (b"hello world", 2)
+    assert s.unread() == b"HTTP/1.1"
+    s = _Sock(b"next")
+    assert _read(_Body(s, 0, False)) == (b"", 0)
+    assert s.reads == 0 and s.unread() == b"next"
+
+
+def test_content_length_closed_early():
+    _reset(_Body(_Sock(b"hello", None, b" wo"), 11, False))
+
+
+def test_until_eof():
+    s = _Sock(b"hello", None, b" world", None, None, b"!")
+    assert _read(_Body(s, None, False)) == (b"hello world!", 3)
+    assert _read(_Body(_Sock(), None, False)) == (b"", 0)
+
+
+def test_recv():
+    body = _Body(_Sock(b"3\r\nabc\r\n", None, b"0\r\n\r\n"), None, True)
+    assert bytes(body.recv(10)) == b"abc"
+    try:
+        body.recv(10)
+    except OSError as e:
+        assert e.args[0] == errno.EAGAIN
+    else:
+        raise AssertionError("no data available")
+    assert bytes(body.recv(10)) == b""
+
+
+if __name__ == "__main__":
+    for name in sorted(k for k in globals() if k.startswith("test_")):
+        globals()[name]()
+        print(name, "ok")
@@ -1,20 +1,103 @@
 # Author: Kevin Köck
 # Copyright Kevin Köck 2021 Released under the MIT license
-# Created on 2021-03-14 
+# Created on 2021-03-14
 
-__updated__ = "2021-03-14"
-__version__ = "0.1"
+__updated__ = "2026-10-19"
+__version__ = "0.2"
+
+import sys
+
+if __name__ == "__main__" and sys.implementation.name != "micropython":
+    import conftest  # run as script on CPython, sets up the imports like for pytest
 
 from wlan_link_libs.ringbuf import Ringbuf
 
-r = Ringbuf(15)
-print(r._free())
-m = b"0123456789"
-print(r.append(m))
-print(r.append(m))
-print(r._buf)
-print(r.get(5))
-print(r.append(m))
-print(r._buf)
-print(r.append(m))
-print(r.get())
+_M = b"0123456789"
+
+
+def test_empty():
+    r = Ringbuf(15)
+    assert r.any() == 0 and r.space() == 15
+    assert r.get() == b"" and r.get(5) == b""
+    a, b = r.get_mmview(5)
+    assert len(a) == 0 and len(b) == 0
+    assert r._p_read == r._p_add == 0
+
+
+def test_full():
+    r = Ringbuf(15)
+    assert r.append(b"abcde" * 3)
+    assert r.any() == 15 and r.space() == 0
+    assert not r.append(b"x")
+    assert r.get() == b"abcde" * 3
+    assert r.any() == 0 and r.space() == 15
+    assert not r.append(b"x" * 16)
+
+
+def test_full_wrapped():
+    r = Ringbuf(15)
+    r.append(_M)
+    r.get(7)
+    assert r.append(_M + b"ab")  # 3 + 12 bytes, full after wrapping
+    assert r.space() == 0 and not r.append(b"x")
+    assert r.get() == b"789" + _M + b"ab"
+
+
+def test_wrap_at_length():
+    r = Ringbuf(15)
+    r.append(_M)
+    assert r.get() == _M
+    assert r.append(b"abcdef")  # ends exactly at _length
+    assert r._p_add == 0
+    assert r.any() == 6 and r.space() == 9
+    assert r.get() == b"abcdef"
+    assert r._p_read == 0 and r.any() == 0
+    assert r.append(_M) and r.get() == _M
+
+
+def test_wrap_split():
+    r = Ringbuf(15)
+    r.append(_M)
+    r.get(10)
+    assert r.append(_M)  # 6 bytes at the end, 4 at the start
+    a, b = r.get_mmview()
+    assert bytes(a) == b"012345" and bytes(b) == b"6789"
+    assert r.any() == 10  # get_mmview doesn't advance
+    assert r.get(8) == b"01234567"
+    assert r.get() == b"89"
+
+
+def test_get_past_written_data():
+    r = Ringbuf(15)
+    r.append(b"abc")
+    assert r.get(10) == b"abc"
+    assert r.any() == 0 and r._p_read == r._p_add
+    assert r.append(_M) and r.get(3) == b"012"
+    assert r.append(b"abcdef")  # wraps
+    assert r.get(20) == b"3456789abcdef"
+    assert r.any() == 0 and r._p_read == r._p_add
+    assert r.append(_M) and r.get() == _M
+
+
+def test_blocking_timeout():
+    r = Ringbuf(15)
+    r.append(b"ab")
+    assert r.get(5, blocking=True, timeout=5) is False
+    assert r.any() == 2
+    assert r.get(2, blocking=True, timeout=5) == b"ab"
+
+
+def test_sequence():
+    r = Ringbuf(15)
+    assert r.append(_M)
+    assert not r.append(_M)
+    assert r.get(5) == b"01234"
+    assert r.append(_M)
+    assert not r.append(_M)
+    assert r.get() == b"56789" + _M
+
+
+if __name__ == "__main__":
+    for name in sorted(k for k in globals() if k.startswith("test_")):
+        globals()[name]()
+        print(name, "ok")
@@ -0,0 +1,126 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Round trips of wlan_link_libs.schema and of schema frames through Frames, including
+# frames whose bytes params don't fit into the send buffer.
+
+import sys
+
+if __name__ == "__main__" and sys.implementation.name != "micropython":
+    import conftest  # run as script on CPython, sets up the imports like for pytest
+
+from wlan_link_libs.schema import Schema
+from wlan_link_libs.frames import Frames
+
+_LEN_HEADER = 7
+
+
+class _Comm:
+    """Link replaying the written frames"""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self._r = 0
+
+    def write_byte(self, b):
+        self.buf.append(b)
+
+    def write(self, buf):
+        self.buf += buf
+
+    def read_frame(self, buffer, length, timeout=10):
+        buffer[:length] = self.buf[self._r:self._r + length]
+        self._r += length
+
+    def start(self):
+        self._r = 1  # skip start byte
+
+
+def _roundtrip(schema, args):
+    buf = bytearray(500)
+    data = [None] * schema.num_var
+    l = schema.encode(buf, _LEN_HEADER, args, 0, data)
+    p = _LEN_HEADER + schema.size
+    for d in data:
+        buf[p:p + len(d)] = d
+        p += len(d)
+    assert p == _LEN_HEADER + l
+    return schema.decode(memoryview(buf), _LEN_HEADER, p)
+
+
+def test_roundtrip():
+    s = Schema((int, bytes, int, int, bool))
+    r = _roundtrip(s, (1, b"192.168.178.10", 8883, -1, True))
+    assert r[0] == 1 and bytes(r[1]) == b"192.168.178.10" and r[2] == 8883 and r[3] == -1
+    assert r[4] is True
+    r = _roundtrip(s, (0, b"", 0, 0, False))
+    assert bytes(r[1]) == b"" and r[4] is False
+    s = Schema((str, float, bytes, bytes))
+    r = _roundtrip(s, ("host", 1.5, b"a" * 300, bytearray(b"bc")))
+    assert bytes(r[0]) == b"host" and r[1] == 1.5
+    assert bytes(r[2]) == b"a" * 300 and bytes(r[3]) == b"bc"
+
+
+def test_encode_keeps_bytes_params():
+    s = Schema((int, bytes))
+    buf = bytearray(_LEN_HEADER + s.size)  # only the fixed size part has to fit
+    data = [None]
+    payload = b"x" * 900
+    assert s.encode(buf, _LEN_HEADER, (3, payload), 0, data) == s.size + 900
+    assert data[0] is payload
+    try:
+        s.encode(bytearray(_LEN_HEADER + s.size - 1), _LEN_HEADER, (3, payload), 0, data)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("fixed size part doesn't fit")
+
+
+def _frames(cmd, signature):
+    comm = _Comm()
+    fr = Frames(comm, 400, 1100)
+    fr.register_schema(cmd, signature)
+    return comm, fr
+
+
+def test_frame_bigger_than_send_buffer():
+    comm, fr = _frames(24, (int, bytes))
+    for n in (0, 1, 392, 400, 1023 - _LEN_HEADER - 6):
+        comm.buf = bytearray()
+        payload = bytes(i & 0xFF for i in range(n))
+        num = fr._create_packet_from(24, None, (3, payload), 0, False)
+        assert num == 1
+        fr._write_packet(num)
+        assert len(comm.buf) == 1 + _LEN_HEADER + 6 + n
+        comm.start()
+        cmd, response_code, params = fr.read_message()
+        assert cmd == 24 and params[0] == 3 and bytes(params[1]) == payload
+        assert fr._params[0] is None  # no reference to the application data kept
+
+
+def test_frame_too_long():
+    comm, fr = _frames(24, (int, bytes))
+    try:
+        fr._create_packet_from(24, None, (3, b"x" * (1024 - _LEN_HEADER - 6)), 0, False)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("frame longer than 1023 bytes")
+
+
+def test_no_reply_schema_frame():
+    comm, fr = _frames(25, (int, int, bool))
+    fr.send_cmd_no_reply(25, (7, 400, True))
+    comm.start()
+    cmd, response_code, params = fr.read_message()
+    assert cmd == 25 and fr.no_reply and params == [7, 400, True]
+
+
+if __name__ == "__main__":
+    for name in sorted(k for k in globals() if k.startswith("test_")):
+        globals()[name]()
+        print(name, "ok")
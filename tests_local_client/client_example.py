@@ -18,8 +18,10 @@ from wlan_client.wclient import WlanClient
 from machine import Pin
 
 uart = machine.UART(1, tx=17, rx=16, baudrate=460800)  # 115200)
-wuart = WUart(uart, debug=0)
+wuart = WUart(uart, debug=0, irq=True, irq_pin=Pin(16))  # wake on RX instead of polling
 wl = WlanClient(wuart, Pin(19), Pin(21), debug=1)
+# A second host board on another UART, new sockets get distributed across both hosts:
+# wl2 = WlanClient(WUart(machine.UART(2, tx=4, rx=5, baudrate=460800)), Pin(22), Pin(23))
 
 from wlan_link_libs.profiler import Profiler
 
@@ -27,4 +29,10 @@ Profiler.active = False
 
 from wlan_client import socket as rsocket
 
+# WiFi of the host, connecting doesn't block the link:
+# from wlan_client.wifi import WLAN
+# sta = WLAN()
+# print(sta.scan(max_age=60000))
+# sta.connect("SSID", "PW", block=True)
+
 # Now use rsocket to connect e.g. to an echo server running on your PC.
@@ -7,6 +7,7 @@ __version__ = "0.1"
 
 import network
 
+# Optional, the client can also connect with wlan_client.wifi.WLAN().connect(ssid, key)
 st = network.WLAN(network.STA_IF)
 st.active(True)
 st.connect("SSID", "PW")
@@ -21,16 +22,20 @@ import machine
 
 DEBUG = 3
 
-uart = machine.UART(1, tx=17, rx=16, baudrate=460800)  # 115200)
+# clients pipelining sends (socket.pipeline) need rxbuf >= window * 410 bytes
+uart = machine.UART(1, tx=17, rx=16, baudrate=460800, rxbuf=2048)  # 115200)
 wuart = WUart(uart, debug=DEBUG)
 
 wl = WlanHost(wuart, Pin(33), debug=DEBUG)
+# Every further client board gets its own UART and ready pin, the hosts share the memory:
+# wl2 = WlanHost(WUart(machine.UART(2, tx=4, rx=5, baudrate=460800)), Pin(32), debug=DEBUG)
 
 import wlan_host.socket
+import wlan_host.http  # optional, HTTP requests executed on the host
+import wlan_host.mqtt  # optional, MQTT session kept by the host (needs umqtt.simple)
+import wlan_host.wifi  # optional, WiFi scan/connect by the client
 
 loop = asyncio.get_event_loop()
 loop.run_forever()
 
 # You may configure a webrepl to see what's going on or connect to the UART.
-# Library doesn't yet support controlling the host wifi from the client so you need to set
-# the SSID and PW in this file for now.
@@ -0,0 +1,220 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.2"
+
+# Decoder for link captures (see wlan_link_libs/capture.py), runs on CPython:
+#   python3 tools/capture_decode.py capture.bin [--timeline] [--ticks-bits 30]
+# Prints a timeline of all frames, statistics per command, request/answer latencies,
+# gaps between frames and frames with wrong checksums.
+
+import argparse
+import struct
+import sys
+
+MAGIC = b"WLCAP\x01"
+CAP_TX = 1
+CAP_DATA = 2
+CAP_BAD = 4
+CAP_TRUNC = 8
+
+LEN_HEADER = 7
+REPLY_FLAG = 1 << 7
+FLAG_SCHEMA = 1 << 6
+FLAG_NO_REPLY = 1 << 7  # in header byte 1, command is not answered
+DATA_OP = 0x0F
+DATA_PAYLOAD = 1 << 5
+DATA_ERROR = 1 << 6
+DATA_REPLY = 1 << 7
+DATA_OPS = {1: "SEND", 2: "RECV", 3: "STREAM", 4: "CREDIT", 5: "STREAM_END", 6: "SEND_NR"}
+# data ops answered by the host without a request per frame or not at all
+DATA_UNANSWERED = (3, 4, 5, 6)
+
+
+def read_records(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a capture file")
+    while True:
+        h = f.read(7)
+        if len(h) < 7:
+            return
+        t, kind, n = struct.unpack("<IBH", h)
+        yield t, kind, f.read(n)
+
+
+def crc(frame):
+    """hash_update of wlan_link_libs.frames over the frame with the crc bytes zeroed"""
+    result = 0xceed
+    for i, c in enumerate(frame):
+        result = (result * 73 ^ (0 if i in (5, 6) else c)) & 0xffff
+    return result
+
+
+class Frame:
+    def __init__(self, t, kind, raw):
+        self.t = t  # us since the first record
+        self.tx = bool(kind & CAP_TX)
+        self.data = bool(kind & CAP_DATA)
+        self.bad = bool(kind & CAP_BAD)
+        self.truncated = bool(kind & CAP_TRUNC)
+        self.raw = raw
+        self.crc_ok = None
+        self.no_reply = False
+        if len(raw) < LEN_HEADER:
+            self.key = None
+            self.reply = False
+            self.length = len(raw)
+            return
+        self.crc_ok = None if self.truncated else crc(raw) == (raw[5] << 8 | raw[6])
+        if self.data:
+            op = raw[0]
+            self.reply = bool(op & DATA_REPLY)
+            self.socknum = raw[1] << 8 | raw[2]
+            self.length = raw[3] << 8 | raw[4]
+            self.error = bool(op & DATA_ERROR)
+            self.key = ("data", op & DATA_OP)
+            self.name = "DATA_" + DATA_OPS.get(op & DATA_OP, str(op & DATA_OP))
+        else:
+            cmd = raw[0]
+            self.reply = bool(cmd & REPLY_FLAG)
+            self.socknum = None
+            self.length = (raw[1] & 0x03) << 8 | raw[2]
+            self.num_params = (raw[1] & 0x3C) >> 2
+            self.schema = bool(raw[1] & FLAG_SCHEMA)
+            self.no_reply = not self.reply and bool(raw[1] & FLAG_NO_REPLY)
+            self.resp = raw[3] >> 4
+            self.error = self.reply and self.resp in (2, 3)
+            self.key = ("cmd", cmd & 0x7F)
+            self.name = "CMD_{}".format(cmd & 0x7F)
+
+    def describe(self):
+        if self.key is None:
+            return "short frame ({} bytes)".format(len(self.raw))
+        s = "{}{}".format(self.name, " reply" if self.reply else "")
+        if self.data:
+            s += " sock={} len={}".format(self.socknum, self.length)
+        else:
+            s += " params={} len={}{}{}".format(self.num_params, self.length,
+                                                " schema" if self.schema else "",
+                                                " no_reply" if self.no_reply else "")
+            if self.reply:
+                s += " resp={}".format(self.resp)
+        if self.error:
+            s += " ERROR"
+        if self.bad:
+            s += " BROKEN"
+        if self.crc_ok is False:
+            s += " CRC_WRONG"
+        if self.truncated:
+            s += " truncated"
+        return s
+
+
+def load(path, ticks_bits=30):
+    """Read a capture, timestamps are unwrapped to us since the first record"""
+    period = 1 << ticks_bits
+    frames = []
+    first = last = None
+    offset = 0
+    with open(path, "rb") as f:
+        for t, kind, raw in read_records(f):
+            if first is None:
+                first = t
+            elif t < last:  # ticks_us wrapped
+                offset += period
+            last = t
+            frames.append(Frame(t + offset - first, kind, raw))
+    return frames
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def analyse(frames):
+    stats = {}
+    pending = {}  # request key -> timestamps of unanswered requests
+    gaps = []
+    crc_errors = []
+    for i, fr in enumerate(frames):
+        if i:
+            gaps.append((fr.t - frames[i - 1].t, i))
+        if fr.bad or fr.crc_ok is False:
+            crc_errors.append(fr)
+        if fr.key is None:
+            continue
+        st = stats.setdefault(fr.key, {"name": fr.name, "rx": 0, "tx": 0, "bytes": 0,
+                                       "errors": 0, "latency": []})
+        st["tx" if fr.tx else "rx"] += 1
+        st["bytes"] += len(fr.raw)
+        if fr.error:
+            st["errors"] += 1
+        if fr.data and fr.key[1] in DATA_UNANSWERED or fr.no_reply:
+            continue
+        key = (fr.key, fr.socknum)
+        if not fr.reply:
+            pending.setdefault(key, []).append((fr.t, fr.tx))
+        elif pending.get(key):
+            t, tx = pending[key].pop(0)
+            if tx != fr.tx:  # request and answer go in opposite directions
+                st["latency"].append(fr.t - t)
+    return stats, gaps, crc_errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode a wlan link capture")
+    parser.add_argument("capture")
+    parser.add_argument("--timeline", action="store_true", help="print every frame")
+    parser.add_argument("--ticks-bits", type=int, default=30,
+                        help="bits of ticks_us on the capturing port (default 30)")
+    parser.add_argument("--gaps", type=int, default=5, help="number of largest gaps to show")
+    args = parser.parse_args(argv)
+    frames = load(args.capture, args.ticks_bits)
+    if not frames:
+        print("Capture is empty")
+        return 0
+    if args.timeline:
+        for fr in frames:
+            print("{:>12.3f} ms {} {}".format(fr.t / 1000, "TX" if fr.tx else "RX",
+                                              fr.describe()))
+        print()
+    stats, gaps, crc_errors = analyse(frames)
+    print("{} frames in {:.3f} ms".format(len(frames), frames[-1].t / 1000))
+    print()
+    print("{:<16}{:>7}{:>7}{:>9}{:>7}{:>10}{:>10}{:>10}{:>10}".format(
+        "command", "rx", "tx", "bytes", "errors", "lat min", "lat avg", "lat p95", "lat max"))
+    for key in sorted(stats):
+        st = stats[key]
+        lat = st["latency"]
+        if lat:
+            l = "{:>10}{:>10}{:>10}{:>10}".format(min(lat), sum(lat) // len(lat),
+                                                  percentile(lat, 95), max(lat))
+        else:
+            l = "{:>10}{:>10}{:>10}{:>10}".format("-", "-", "-", "-")
+        print("{:<16}{:>7}{:>7}{:>9}{:>7}".format(st["name"], st["rx"], st["tx"], st["bytes"],
+                                                  st["errors"]) + l)
+    print("(latencies in us between a request and its answer)")
+    if gaps:
+        g = [x[0] for x in gaps]
+        print()
+        print("gaps between frames: avg {} us, p95 {} us, max {} us".format(
+            sum(g) // len(g), percentile(g, 95), max(g)))
+        for gap, i in sorted(gaps, reverse=True)[:args.gaps]:
+            print("  {:>10} us before frame {} at {:.3f} ms: {}".format(
+                gap, i, frames[i].t / 1000, frames[i].describe()))
+    print()
+    if crc_errors:
+        print("{} broken frames or checksum errors:".format(len(crc_errors)))
+        for fr in crc_errors:
+            print("  {:.3f} ms {} {} raw={}".format(fr.t / 1000, "TX" if fr.tx else "RX",
+                                                   fr.describe(), fr.raw[:16].hex()))
+    else:
+        print("no broken frames or checksum errors")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
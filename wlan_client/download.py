@@ -0,0 +1,65 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Stream large downloads (e.g. OTA images) into a file or flash partition.
+# The host pushes the data in large frames without a request per chunk, see
+# WlanClient.stream_into.
+
+from .socket import socket
+
+
+def download(sock: socket, f, length=None, chunk=None, window=None, timeout=10000) -> int:
+    """Stream length bytes (None: until EOF) of a connected socket into f.
+    f can be anything with a write(buf) method. Returns the amount of bytes written."""
+    sock._check_closed()
+    n = sock._wl.stream_into(sock._socknum, f, length, chunk, window, timeout)
+    sock.bytes_in += n
+    return n
+
+
+def download_http(url: str, f, chunk=None, window=None, timeout=10000) -> int:
+    """HTTP GET url and stream the body into f. The host sends the request, follows
+    redirects and parses the header, see http.request. Returns the amount of bytes written."""
+    from .http import request  # http imports this module
+    r = request("GET", url, timeout=timeout)
+    if r.status_code != 200:
+        r.close()
+        raise OSError("HTTP status {}".format(r.status_code))
+    return r.save(f, chunk, window, timeout)
+
+
+class PartitionWriter:
+    """File-like writer for an esp32.Partition, e.g. Partition(Partition.RUNNING).get_next_update()
+    Collects data into blocks, writeblocks erases each block before writing it."""
+
+    def __init__(self, partition, block_size=4096):
+        self._part = partition
+        self._buf = bytearray(block_size)
+        self._pos = 0
+        self._block = 0
+
+    def write(self, data) -> int:
+        mv = memoryview(data)
+        buf = self._buf
+        while len(mv):
+            n = min(len(mv), len(buf) - self._pos)
+            buf[self._pos:self._pos + n] = mv[:n]
+            self._pos += n
+            mv = mv[n:]
+            if self._pos == len(buf):
+                self._part.writeblocks(self._block, buf)
+                self._block += 1
+                self._pos = 0
+        return len(data)
+
+    def close(self):
+        if self._pos:
+            for i in range(self._pos, len(self._buf)):
+                self._buf[i] = 0xFF
+            self._part.writeblocks(self._block, self._buf)
+            self._block += 1
+            self._pos = 0
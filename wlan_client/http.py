@@ -0,0 +1,124 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# HTTP requests executed on the host (similar to urequests). The host connects, sends the
+# request, follows redirects and parses the response header, the client only gets the
+# status, the selected headers and a socket to read the body from.
+# Method, url, headers and body have to fit into one frame.
+
+from micropython import const
+from .wclient import select_clients, register_schema
+from wlan_link_libs.uart import CommError
+from .socket import socket
+from .download import download
+
+_CMD_HTTP_REQUEST = const(30)
+
+# same signature as registered on the host
+register_schema(_CMD_HTTP_REQUEST, (bytes, bytes, bytes, bytes, bytes, int, int),
+                (int, int, int, bytes))
+
+
+class Response:
+    def __init__(self, wl, status, socknum, length, headers):
+        self.status_code = status
+        self.content_length = None if length < 0 else length
+        self.headers = {}
+        for line in bytes(headers).split(b"\r\n"):
+            if line:
+                name, value = line.split(b": ", 1)
+                self.headers[name.decode()] = value.decode()
+        self.raw = socket(socknum=socknum, client=wl)
+        self._content = None
+
+    def close(self):
+        self.raw.close()
+
+    def read(self, bufsize=400) -> bytes:
+        """Read the next part of the body, returns b'' at the end of the body"""
+        return self.raw.recv(bufsize)
+
+    def readinto(self, buf, nbytes=0) -> int:
+        """Read the next part of the body into buf without allocating it, returns 0 at the end
+        of the body"""
+        return self.raw.recv_into(buf, nbytes)
+
+    def save(self, f, chunk=None, window=None, timeout=10000) -> int:
+        """Stream the body into f and close the response. Returns the amount of bytes written."""
+        try:
+            return download(self.raw, f, self.content_length, chunk, window, timeout)
+        finally:
+            self.close()
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            import io
+            f = io.BytesIO()
+            self.save(f)
+            self._content = f.getvalue()
+        return self._content
+
+    @property
+    def text(self) -> str:
+        return str(self.content, "utf-8")
+
+    def json(self):
+        import json
+        return json.loads(self.content)
+
+
+def request(method, url, data=None, json=None, headers=None, select=(), max_redirects=3,
+            timeout=30000) -> Response:
+    """
+    Execute an HTTP request on the host. Redirects are followed up to max_redirects times.
+    select: names of the response headers to return in Response.headers,
+    e.g. ("content-type", "etag"). Only those are transferred over the link.
+    """
+    h = ""
+    if json is not None:
+        import json as _json
+        data = _json.dumps(json)
+        h = "Content-Type: application/json\r\n"
+    if headers:
+        for k in headers:
+            h += "{}: {}\r\n".format(k, headers[k])
+    err = None
+    for wl in select_clients():
+        try:
+            r = wl.send_cmd_wait_answer(
+                _CMD_HTTP_REQUEST,
+                (method, url, h, data or b"", ",".join(select).lower(), max_redirects, timeout),
+                timeout=timeout + 1000)
+            return Response(wl, *r)
+        except CommError as e:  # host not reachable, try the next one
+            err = e
+    raise err
+
+
+def head(url, **kw):
+    return request("HEAD", url, **kw)
+
+
+def get(url, **kw):
+    return request("GET", url, **kw)
+
+
+def post(url, **kw):
+    return request("POST", url, **kw)
+
+
+def put(url, **kw):
+    return request("PUT", url, **kw)
+
+
+def patch(url, **kw):
+    return request("PATCH", url, **kw)
+
+
+def delete(url, **kw):
+    return request("DELETE", url, **kw)
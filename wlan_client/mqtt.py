@@ -0,0 +1,99 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# MQTT client with an API similar to umqtt.simple but the session is owned by the host.
+# Keep-alive pings, QoS 1 acks and retries never cross the link, received messages are
+# fetched in batches with check_msg.
+# Topic and message of a received message have to fit into one frame (~375 bytes).
+
+from micropython import const
+from .wclient import get_client, register_schema
+import struct
+import time
+
+_CMD_MQTT_CONNECT = const(40)
+_CMD_MQTT_PUBLISH = const(41)
+_CMD_MQTT_SUBSCRIBE = const(42)
+_CMD_MQTT_POLL = const(43)
+_CMD_MQTT_DISCONNECT = const(44)
+
+# same signatures as registered on the host
+register_schema(_CMD_MQTT_CONNECT, (bytes, bytes, int, bytes, bytes, int, bool, bool))
+register_schema(_CMD_MQTT_PUBLISH, (bytes, bytes, bool, int))
+register_schema(_CMD_MQTT_SUBSCRIBE, (bytes, int))
+register_schema(_CMD_MQTT_POLL, None, (bool, int, int, bytes))
+
+
+class MQTTClient:
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
+                 ssl=False):
+        self.client_id = client_id
+        self.server = server
+        self.port = port or (8883 if ssl else 1883)
+        self.user = user
+        self.pswd = password
+        self.keepalive = keepalive
+        self.ssl = ssl
+        self.cb = None
+        self.connected = False  # state of the host session at the last poll
+        self.dropped = 0  # messages dropped by the host because they weren't polled in time
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def connect(self, clean_session=True):
+        get_client().send_cmd_wait_answer(
+            _CMD_MQTT_CONNECT,
+            (self.client_id, self.server, self.port, self.user or b"", self.pswd or b"",
+             self.keepalive, clean_session, self.ssl), timeout=30000)
+        self.connected = True
+        return False
+
+    def disconnect(self):
+        get_client().send_cmd_wait_answer(_CMD_MQTT_DISCONNECT)
+        self.connected = False
+
+    def ping(self):
+        pass  # the host keeps the connection alive
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        """QoS 1 publications are acknowledged when the host queued them, the host retries
+        them until the broker acknowledged them, also across reconnects."""
+        if qos not in (0, 1):
+            raise ValueError("Only QoS 0 and 1 supported")
+        get_client().send_cmd_wait_answer(_CMD_MQTT_PUBLISH, (topic, msg, retain, qos),
+                                          timeout=10000)
+
+    def subscribe(self, topic, qos=0):
+        get_client().send_cmd_wait_answer(_CMD_MQTT_SUBSCRIBE, (topic, qos), timeout=10000)
+
+    def check_msg(self):
+        """Fetch all received messages from the host and call the callback for each one.
+        Returns the number of messages received."""
+        cnt = 0
+        while True:
+            self.connected, left, self.dropped, batch = get_client().send_cmd_wait_answer(
+                _CMD_MQTT_POLL)
+            batch = bytes(batch)  # the frame buffer is reused by the next command
+            p = 0
+            while p < len(batch):
+                lt, lm = struct.unpack_from("<HH", batch, p)
+                p += 4
+                topic = batch[p:p + lt]
+                p += lt
+                msg = batch[p:p + lm]
+                p += lm
+                cnt += 1
+                if self.cb is not None:
+                    self.cb(topic, msg)
+            if not left:
+                return cnt
+
+    def wait_msg(self, interval=50):
+        """Poll until at least one message was received"""
+        while not self.check_msg():
+            time.sleep_ms(interval)
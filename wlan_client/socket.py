@@ -2,18 +2,24 @@
 # Copyright Kevin Köck 2021 Released under the MIT license
 # Created on 2021-02-10 
 
-__updated__ = "2021-02-10"
+__updated__ = "2026-10-19"
 __version__ = "0.1"
 
 # Module based on usocket
 
 from micropython import const
-from .wclient import get_client, WlanClient
+from .wclient import get_client, select_clients, WlanClient, register_schema
 import errno
+import struct
+import time
 from wlan_link_libs.profiler import Profiler
+from wlan_link_libs.frames import _DATA_SEND, _DATA_RECV, _DATA_BLOCK, _DATA_SEND_NR
+from wlan_link_libs.uart import CommError
 
 SOCK_STREAM = const(1)
 AF_INET = const(2)
+IPPROTO_TCP = const(6)
+TCP_NODELAY = const(1)
 
 _MAX_LEN_PAYLOAD = const(400)
 
@@ -25,6 +31,12 @@ _CMD_SEND_SOCKET = const(24)
 _CMD_RECV_SOCKET = const(25)
 
 _SOCKET_TCP_MODE = const(1)
+_COALESCE_DEADLINE = const(20)  # ms buffered sends may wait for more data
+
+# same signatures as registered on the host
+register_schema(_CMD_CONNECT_SOCKET, (int, bytes, int, int, bool))
+register_schema(_CMD_SEND_SOCKET, (int, bytes), (int,))
+register_schema(_CMD_RECV_SOCKET, (int, int, bool))
 
 
 def getaddrinfo(host: str, port: int, family=0, socktype=0, proto=0, flags=0):
@@ -32,9 +44,17 @@ def getaddrinfo(host: str, port: int, family=0, socktype=0, proto=0, flags=0):
     compatible list of tuples. Honestly, we ignore anything but host & port"""
     if not isinstance(port, int):
         raise TypeError("Port must be an integer")
-    ipaddr = get_client().send_cmd_wait_answer(_CMD_GETADDRINFO, (host, port))
+    err = None
+    for wl in select_clients():
+        try:
+            ipaddr = wl.send_cmd_wait_answer(_CMD_GETADDRINFO, (host, port))
+            break
+        except CommError as e:  # host not reachable, ask the next one
+            err = e
+    else:
+        raise err
     # print("getaddr", ipaddr)
-    ipaddr = WlanClient.transform_args(ipaddr, str)
+    ipaddr = bytes(ipaddr).decode()
     return [(AF_INET, socktype, proto, "", (ipaddr, port))]
 
 
@@ -43,78 +63,287 @@ def getaddrinfo(host: str, port: int, family=0, socktype=0, proto=0, flags=0):
 
 class socket:
     def __init__(self, family=AF_INET, type=SOCK_STREAM, proto=0,
-                 fileno=None, socknum=None):
+                 fileno=None, socknum=None, reconnect=False, client: WlanClient = None):
+        """reconnect: connect again transparently if the host got reset. Data in flight
+        during the reset is lost, so only use it for protocols that can handle that.
+        client: host of an existing socknum. New sockets are created on the host chosen by
+        select_clients and fail over to the next host if it fails."""
         if family != AF_INET:
             raise TypeError("Only AF_INET family supported")
         if type != SOCK_STREAM:
             raise TypeError("Only SOCK_STREAM type supported")
         self._buffer = b""
-        self._socknum = socknum if socknum else get_client().send_cmd_wait_answer(_CMD_GET_SOCKET)
+        self._closed = True  # until the host created the socket, e.g. no OSError(ENOMEM)
+        if socknum:
+            self._wl = client or get_client()
+            self._socknum = socknum
+        else:
+            self._create()
+        self._wl.sockets += 1
         self._timeout = None  # None=blocking without timeout, 0=non-blocking
         self._blocking = True
         self._closed = False
+        self._reconnect = reconnect
+        self._address = None
+        self._conntype = None
+        self._resets = self._wl.host_resets()  # host resets when the socket got created
+        self._tbuf = bytearray(6)  # recv bufsize and timeout sent to the host
+        self._wbuf = None  # coalesced sends, see coalesce
+        self._wlen = 0
+        self._deadline = 0  # ticks_ms when the buffered data has to be sent
+        self._max_delay = 0
+        self._error = None  # error of a deferred flush, raised by the next call
+        self._window = 0  # sends without answer, see pipeline
+        self._unacked = 0  # sends without answer since the last answer
+        self._host_free = 0  # free space of the host send queue reported by the last answer
+        self.bytes_in = 0
+        self.bytes_out = 0
         # print(self._socknum)
 
+    def _create(self):
+        err = None
+        for wl in select_clients():
+            try:
+                self._socknum = wl.send_cmd_wait_answer(_CMD_GET_SOCKET)
+                self._wl = wl
+                return
+            except OSError as e:  # host not reachable or out of sockets/memory
+                err = e
+        raise err
+
     def _check_closed(self):
         if self._closed:
             raise OSError(errno.EBADF)
+        if self._error is not None:
+            e = self._error
+            self._error = None
+            raise e
+        if self._resets != self._wl.host_resets():
+            self._host_reset()
+
+    def _host_reset(self):
+        """The host got reset since the socket got created, its host socket is gone"""
+        self._resets = self._wl.host_resets()
+        if self._address is not None and not self._reconnect:
+            self._mark_closed()
+            raise OSError(errno.ECONNRESET)
+        self._socknum = self._wl.send_cmd_wait_answer(_CMD_GET_SOCKET)
+        if self._address is not None:
+            self._connect()
 
     def close(self):
+        """The host closes the socket without answering, an error of the close only shows
+        up in WlanClient.status()["deferred_errors"]"""
         if not self._closed:
-            get_client().send_cmd_wait_answer(_CMD_CLOSE_SOCKET, self._socknum)
-            self._closed = True
+            if self._wlen and self._error is None:
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+            self._mark_closed()
+            if self._resets == self._wl.host_resets():  # otherwise host socket is gone
+                self._wl.send_cmd_no_reply(_CMD_CLOSE_SOCKET, self._socknum)
+
+    def _mark_closed(self):
+        self._uncoalesce()
+        self._closed = True
+        self._wl.sockets -= 1  # for balancing new sockets
 
     def setblocking(self, blocking: bool):
         self._blocking = blocking
+        self._timeout = None if blocking else 0
+
+    def settimeout(self, value):
+        """Timeout in seconds of recv, None: blocking, 0: non-blocking.
+        The host holds the recv until data arrives, it costs one round trip."""
+        self._timeout = value
+        self._blocking = value != 0
 
     def connect(self, address, conntype=None):
         """Connect the socket to the 'address' (which can be 32bit packed IP or
         a hostname string). 'conntype' is an extra that may indicate SSL or not,
         depending on the underlying interface"""
         self._check_closed()
-        host, port = address
         if conntype is None:
             conntype = _SOCKET_TCP_MODE
+        self._address = address
+        self._conntype = conntype
         try:
-            get_client().send_cmd_wait_answer(_CMD_CONNECT_SOCKET,
-                                              (
-                                                  self._socknum, host, port, conntype,
-                                                  self._blocking),
-                                              timeout=30000 if self._blocking else 1000)
+            self._connect()
         except Exception as e:
             self.close()
             raise e
+
+    def _connect(self):
+        host, port = self._address
+        self._wl.send_cmd_wait_answer(_CMD_CONNECT_SOCKET,
+                                      (self._socknum, host, port, self._conntype,
+                                       self._blocking),
+                                      timeout=30000 if self._blocking else 1000)
         self._buffer = b""
 
+    def setsockopt(self, level, optname, value):
+        """Only TCP_NODELAY is supported: 0 enables coalescing with the default settings"""
+        if level != IPPROTO_TCP or optname != TCP_NODELAY:
+            raise OSError(errno.EOPNOTSUPP)
+        if value:
+            self.coalesce(0)
+        else:
+            self.coalesce()
+
+    def coalesce(self, threshold=_MAX_LEN_PAYLOAD, max_delay=_COALESCE_DEADLINE):
+        """
+        Buffer small sends and send them in one frame when threshold bytes are buffered,
+        max_delay ms passed since the first buffered send (checked on the next exchange of the
+        client, see WlanClient.flush_due), on flush() or before a recv.
+        threshold=0 disables it. Errors of a deferred send are raised by the next call.
+        """
+        self._check_closed()
+        if threshold > _MAX_LEN_PAYLOAD:
+            raise ValueError("threshold can't be bigger than {}".format(_MAX_LEN_PAYLOAD))
+        self.flush()
+        self._wbuf = bytearray(threshold) if threshold else None
+        self._max_delay = max_delay
+
+    def pipeline(self, window=4):
+        """
+        Send without waiting for the answer of the host, only every window-th send waits.
+        Throughput then doesn't depend on the round trip time. A failed send is raised by a
+        later send or recv, send returns the length of the data even if it got lost. If the
+        host socket is gone (e.g. closed after an error), the failure only shows up in
+        WlanClient.status()["deferred_errors"].
+        The host has to buffer window frames, so its UART needs a big enough rxbuf. Sends
+        without answer are only used while the data fits into the send queue of the host
+        socket, the free space is reported by every answered send.
+        window=0 disables it.
+        """
+        self._check_closed()
+        self._window = window
+        self._unacked = 0
+
+    def _send_frame(self, data) -> int:
+        """Send one frame, returns the bytes accepted by the host"""
+        if self._unacked + 1 < self._window and len(data) <= self._host_free:
+            self._wl.send_data_no_reply(_DATA_SEND_NR, self._socknum, len(data), data)
+            self._unacked += 1
+            self._host_free -= len(data)  # the host may have sent some, so it's a lower bound
+            self.bytes_out += len(data)
+            return len(data)
+        cnt, d = self._wl.send_data_wait_answer(_DATA_SEND, self._socknum, len(data), data)
+        if d is not None:  # accepted bytes and free space of the send queue
+            cnt, self._host_free = struct.unpack_from("<HH", d, 0)
+        self._unacked = 0
+        self.bytes_out += cnt
+        return cnt
+
+    def _uncoalesce(self):
+        if self in self._wl._coalesced:
+            self._wl._coalesced.remove(self)
+
+    def _due(self) -> bool:
+        return time.ticks_diff(time.ticks_ms(), self._deadline) >= 0
+
+    def flush(self):
+        """Send the buffered data"""
+        if not self._wlen:
+            return
+        n = self._wlen
+        mv = memoryview(self._wbuf)
+        p = 0
+        self._uncoalesce()  # not flushed again by the exchanges below
+        try:
+            while p < n:
+                cnt = self._send_frame(mv[p:n])
+                if not cnt:
+                    break
+                p += cnt
+        finally:
+            if p < n:  # keep the rest for the next flush
+                self._wbuf[:n - p] = bytes(mv[p:n])
+            self._wlen = n - p
+            if self._wlen:
+                self._wl._coalesced.append(self)
+
+    def _flush_deferred(self):
+        try:
+            self.flush()
+        except OSError as e:
+            self._error = e
+            self._uncoalesce()
+
     @Profiler.measure
     def send(self, data) -> int:
         """Send some data to the socket"""
         self._check_closed()
         if len(data) > _MAX_LEN_PAYLOAD:
             raise ValueError("Payload too long")  # could split it up but good for now.
-        if len(data) > 1023:  # limited to 255 because of 10 bit for param length in param header
-            d = [self._socknum]
-            c = 0
-            if type(data) != memoryview:
-                data = memoryview(data)
-            while c < len(data):
-                d.append(data[c:c + 1023])
-                c += 1023
-        else:
-            d = (self._socknum, data)
-        return get_client().send_cmd_wait_answer(_CMD_SEND_SOCKET, d)
+        if type(data) == str:
+            data = data.encode()
+        buf = self._wbuf
+        if buf is not None and len(data):
+            if self._wlen + len(data) > len(buf):
+                self.flush()
+            if self._wlen or len(data) < len(buf):  # the rest of a partial flush comes first
+                n = min(len(data), len(buf) - self._wlen)
+                if not self._wlen:
+                    self._deadline = time.ticks_add(time.ticks_ms(), self._max_delay)
+                    self._wl._coalesced.append(self)
+                buf[self._wlen:self._wlen + n] = data[:n]
+                self._wlen += n
+                if self._wlen == len(buf):
+                    self._flush_deferred()  # data is accepted, errors come with the next call
+                return n
+        return self._send_frame(data)
+
+    def _recv(self, bufsize) -> memoryview:
+        """Returns the received data, a memoryview of the read buffer of the client that is only
+        valid until the next frame"""
+        self._check_closed()
+        if self._wlen:
+            self.flush()  # e.g. the request the answer is received for
+        if bufsize > _MAX_LEN_PAYLOAD:
+            bufsize = _MAX_LEN_PAYLOAD  # let application handle shorter reads.
+        if self._timeout == 0:
+            _, d = self._wl.send_data_wait_answer(_DATA_RECV, self._socknum, bufsize)
+        else:  # long-poll, the host answers when data arrives or the timeout is over
+            t = None if self._timeout is None else int(self._timeout * 1000)
+            struct.pack_into("<HI", self._tbuf, 0, bufsize, 0xFFFFFFFF if t is None else t)
+            _, d = self._wl.send_data_wait_answer(
+                _DATA_RECV | _DATA_BLOCK, self._socknum, len(self._tbuf), self._tbuf,
+                timeout=None if t is None else t + 1000)
+        self._unacked = 0
+        self.bytes_in += len(d)
+        return d
 
     @Profiler.measure
     def recv(self, bufsize=0):
-        self._check_closed()
         if bufsize == 0:
+            self._check_closed()
             return b''
-        elif bufsize > _MAX_LEN_PAYLOAD:
-            bufsize = _MAX_LEN_PAYLOAD  # let application handle shorter reads.
-        d = get_client().send_cmd_wait_answer(_CMD_RECV_SOCKET,
-                                              (self._socknum, bufsize, self._blocking),
-                                              timeout=None if self._blocking else 1000)
-        return bytes(d)  # can't return memoryview as this is the client's buffer
+        return bytes(self._recv(bufsize))  # can't return memoryview as this is the client's buffer
+
+    @Profiler.measure
+    def recv_into(self, buf, nbytes=0) -> int:
+        """Receive up to nbytes (0: len(buf)) into buf, copied directly from the read buffer
+        without allocating the data. Returns the number of bytes received, 0 on EOF."""
+        if not nbytes or nbytes > len(buf):
+            nbytes = len(buf)
+        if nbytes == 0:
+            self._check_closed()
+            return 0
+        d = self._recv(nbytes)
+        n = len(d)
+        buf[:n] = d
+        return n
+
+    def readinto(self, buf, nbytes=0):
+        """Like recv_into but returns None if no data is available on a non-blocking socket"""
+        try:
+            return self.recv_into(buf, nbytes)
+        except OSError as e:
+            if e.args[0] == errno.EAGAIN:
+                return None
+            raise
 
     def __del__(self):
         """Just in case?"""
@@ -2,21 +2,29 @@
 # Copyright Kevin Köck 2021 Released under the MIT license
 # Created on 2021-02-09 
 
-__updated__ = "2021-02-10"
+__updated__ = "2026-10-19"
 __version__ = "0.2"
 
-import gc
 import time
 from machine import Pin
 from micropython import const
-from wlan_link_libs.frames import Frames
-from wlan_link_libs.uart import WUart
+from wlan_link_libs.frames import Frames, _DATA_STREAM, _DATA_CREDIT, _DATA_STREAM_END, \
+    _DATA_REPLY, _DATA_ERROR, _DATA_OP, _LEN_HEADER, adler32
+from wlan_link_libs.gcpolicy import GCPolicy
+from wlan_link_libs.stats import LinkStats
+from wlan_link_libs.schema import Schema
+from wlan_link_libs.scheduler import PRIO_BULK
+from wlan_link_libs.uart import WUart, CommError
 from wlan_link_libs.profiler import Profiler
 import json
+import struct
+import uasyncio as asyncio
+import errno
 
 Profiler.active = True
 
-_wlan_client = None
+_clients = []  # attached hosts, the first one is the default client
+_schemas = {}  # command schemas shared by all clients, see register_schema
 
 _MAX_LEN_PAYLOAD = const(400)
 _MAX_LEN_PACKET = const(500)
@@ -24,69 +32,214 @@ _MAX_LEN_PACKET = const(500)
 _CMD_HOST_AVAILABLE = const(1)
 _CMD_HOST_STATUS = const(2)
 _CMD_HOST_START = const(3)
+_CMD_HOST_STATS = const(4)
+
+_READY_POLL = const(20)  # ms between pings while the ready pin is high
+_PING_INTERVAL = const(500)  # ms between pings if the ready pin stays low
+
+BALANCE_ROUND_ROBIN = const(0)
+BALANCE_LOAD = const(1)  # host with the fewest open sockets
+_balancing = BALANCE_LOAD
+_rr = 0
 
 
 class WlanClient:
     """A class that will control the Wlan of a host board"""
 
-    def __init__(self, commlink: WUart, reset_pin: Pin, ready_pin: Pin, debug: int = 0):
-        self._frames = Frames(commlink, _MAX_LEN_PAYLOAD, _MAX_LEN_PACKET, debug=debug)
+    def __init__(self, commlink: WUart, reset_pin: Pin, ready_pin: Pin, debug: int = 0,
+                 gc_policy: GCPolicy = None, auto_reset=True, heartbeat_ms=1000, max_failures=3):
+        self._frames = Frames(commlink, _MAX_LEN_PAYLOAD, _MAX_LEN_PACKET, debug=debug,
+                              schemas=_schemas)
         self._comm = commlink
         self._debug = debug
         self._preset = reset_pin
-        global _wlan_client
-        _wlan_client = self
+        _clients.append(self)
         reset_pin.init(mode=Pin.OUT, value=1)
         self._pready = ready_pin
         ready_pin.init(mode=Pin.IN)
+        self._ready_flag = False  # rising edge of the ready pin, host is listening
+        try:
+            ready_pin.irq(handler=self._host_ready, trigger=Pin.IRQ_RISING)
+        except (AttributeError, ValueError, OSError):  # pin without irq, level is polled
+            pass
+        self.startup = None  # ms the last start or recovery waited for the host
         self._host_reset_count = -1  # to keep track of broken sockets so not all reset the host
-        # ready_pin.irq(handler=self._host_ready,trigger=Pin.IRQ_RISING, hard=True)
+        self.gc_policy = gc_policy or GCPolicy()
+        # failure detection
+        self.auto_reset = auto_reset  # reset host after max_failures failed pings in a row
+        self.heartbeat_ms = heartbeat_ms  # ping host if no exchange succeeded for this long
+        self.heartbeat_timeout = 100  # ms, host answers pings within a few ms
+        self.max_failures = max_failures
+        self._failures = 0
+        self._last_ok = time.ticks_ms()
+        self._recovering = False
+        self._busy_until = None  # ticks_ms until the host may not answer, see expect_busy
+        self._start_args = None  # config of last start() for restarting after a reset
+        self._streams = {}  # socknum -> active _Stream
+        self.rxbuf = 1024  # bytes of the UART rx buffer, limits the frames a stream has in flight
+        self.sockets = 0  # open sockets on this host, for balancing new sockets
+        self._coalesced = []  # sockets with buffered sends, see flush_due
+        self._flushing = False
+
+    def _host_ready(self, pin):
+        self._ready_flag = True
 
     def _reset_host(self):
         self._host_reset_count += 1
         self._preset(0)  # reset host board, not done due to debugging
-        time.sleep_ms(100)
+        time.sleep_ms(10)
+        self._ready_flag = False
         self._preset(1)
-        time.sleep(1)
 
     def _wait_host_up(self, timeout=10):
+        """
+        Wait for the host to listen. The host raises the ready pin when it is listening, so
+        a ping is sent on the rising edge (or every _READY_POLL ms while the pin is high).
+        If the pin isn't wired, the host is pinged every _PING_INTERVAL ms.
+        """
         st = time.ticks_ms()
+        last = None
         while time.ticks_diff(time.ticks_ms(), st) < timeout * 1000:
-            time.sleep_ms(500)  # host board booting up
-            if self.connected():
-                if self._debug >= 1:
-                    print("Resetting host and connecting took {}s".format(
-                        time.ticks_diff(time.ticks_ms(), st) / 1000))
-                return True
+            now = time.ticks_ms()
+            since = _PING_INTERVAL if last is None else time.ticks_diff(now, last)
+            if self._ready_flag or (self._pready() and since >= _READY_POLL) or \
+                    since >= _PING_INTERVAL:
+                self._ready_flag = False
+                last = now
+                # short ping timeout so the host is found as soon as it finished booting
+                if self.connected(self.heartbeat_timeout):
+                    self.startup = time.ticks_diff(time.ticks_ms(), st)
+                    if self._debug >= 1:
+                        print("Waiting for the host took {} ms".format(self.startup))
+                    return True
+            time.sleep_ms(1)
         raise OSError("WlanHost not connected")
 
     def start(self, ftp_active=False, max_sockets=5, socket_buf_len=_MAX_LEN_PAYLOAD,
               max_payload_len=_MAX_LEN_PAYLOAD, debug=0, timeout=10):
         # self._reset_host()
-        self._wait_host_up(timeout)
         if socket_buf_len > _MAX_LEN_PAYLOAD:
             raise ValueError("socket_buf_len can't be bigger than {}".format(_MAX_LEN_PAYLOAD))
         if max_payload_len > _MAX_LEN_PAYLOAD:
             raise ValueError("max_payload_len can't be bigger than {}".format(_MAX_LEN_PAYLOAD))
+        self._wait_host_up(timeout)
+        # replayed by recover, so only a valid config
+        self._start_args = (ftp_active, max_sockets, socket_buf_len, max_payload_len, debug)
         return self.send_cmd_wait_answer(_CMD_HOST_START, (
             ftp_active, max_sockets, socket_buf_len, max_payload_len, debug), timeout=5000)
 
     @Profiler.measure
-    def connected(self) -> bool:
+    def connected(self, timeout=1000) -> bool:
+        self.gc_policy.frame_start()
         try:
-            self._frames.send_cmd_wait_answer(_CMD_HOST_AVAILABLE)
+            self._frames.send_cmd_wait_answer(_CMD_HOST_AVAILABLE, timeout=timeout)
             # resp can only be true, otherwise module is not reachable -> OSError in Communication
         except OSError as e:
             if self._debug >= 1:
                 print("Connection issue", e)
             return False
+        except ValueError:  # late answer of an exchange that timed out, the host is up
+            pass
         finally:
-            gc.collect()
+            self.gc_policy.frame_end()
+        self._failures = 0
+        self._last_ok = time.ticks_ms()
         return True
 
+    def host_resets(self) -> int:
+        """Number of host resets, sockets compare it to detect a reset host"""
+        return self._host_reset_count
+
+    def expect_busy(self, ms):
+        """The host may not answer for up to ms (e.g. during a WiFi scan). Failed exchanges
+        and heartbeats don't count as failures meanwhile."""
+        self._busy_until = time.ticks_add(time.ticks_ms(), ms)
+
+    def _busy(self) -> bool:
+        if self._busy_until is None:
+            return False
+        if time.ticks_diff(self._busy_until, time.ticks_ms()) > 0:
+            return True
+        self._busy_until = None
+        return False
+
+    def healthy(self) -> bool:
+        """False while the host doesn't answer or gets recovered"""
+        return not self._failures and not self._recovering
+
+    def heartbeat(self) -> bool:
+        """
+        Ping the host if no exchange succeeded within heartbeat_ms. After max_failures failed
+        pings in a row the host counts as failed (see healthy()) and gets reset and restarted
+        if auto_reset is enabled. Returns True if the host is up.
+        """
+        if self._coalesced:
+            self.flush_due()
+        if time.ticks_diff(time.ticks_ms(), self._last_ok) < self.heartbeat_ms or self._busy():
+            return True
+        for _ in range(self.max_failures):
+            if self.connected(self.heartbeat_timeout):  # resets _failures
+                return True
+        self._failures += 1  # also without auto_reset, so select_clients skips the host
+        if self.auto_reset:
+            if self._debug >= 1:
+                print("Host not responding, resetting host")
+            self.recover()
+            return True
+        return False
+
+    async def heartbeat_task(self):
+        """Run heartbeat() periodically if the application uses uasyncio"""
+        import uasyncio as asyncio
+        while True:
+            await asyncio.sleep_ms(self.heartbeat_ms)
+            try:
+                self.heartbeat()
+            except OSError as e:
+                if self._debug >= 1:
+                    print("Heartbeat failed", e)
+
+    def recover(self, timeout=10):
+        """Reset the host and restart it with the config of the last start().
+        Sockets notice the reset on their next call and reconnect if they are reconnectable."""
+        if self._recovering:
+            return
+        self._recovering = True
+        st = time.ticks_ms()
+        try:
+            self._reset_host()
+            self._wait_host_up(timeout)
+            if self._start_args is not None:
+                self._frames.send_cmd_wait_answer(_CMD_HOST_START, self._start_args,
+                                                  timeout=5000)
+            self._failures = 0
+        finally:
+            self._recovering = False
+        if self._debug >= 1:
+            print("Host recovered in", time.ticks_diff(time.ticks_ms(), st), "ms")
+
+    def _exchange_ok(self):
+        self._failures = 0
+        self._last_ok = time.ticks_ms()
+
+    def _exchange_failed(self):
+        """The timeout of an exchange may be one the caller chose too short (e.g. a slow
+        connect), so the host only gets reset if the pings of the heartbeat fail too"""
+        if self._busy():
+            return
+        self._failures += 1
+        if self.auto_reset and not self._recovering:
+            self._last_ok = time.ticks_add(time.ticks_ms(), -self.heartbeat_ms)  # ping now
+            try:
+                self.heartbeat()
+            except OSError as e:
+                if self._debug >= 1:
+                    print("Recovering host failed", e)
+
     @Profiler.measure
     def status(self, key=None):
         """returns multiple information about #sockets, mem_free, wifi status ..."""
+        self.gc_policy.frame_start()
         try:
             payload = self._frames.send_cmd_wait_answer(_CMD_HOST_STATUS)
         except OSError as e:
@@ -94,22 +247,279 @@ class WlanClient:
                 print("Connection issue", e)
             raise
         finally:
-            gc.collect()
-        st = json.loads(payload)
+            self.gc_policy.frame_end()
+        st = json.loads(bytes(payload))
         if key:
             return st[key]
         else:
             return st
 
+    def stats(self) -> dict:
+        """returns link counters and per command latency histograms of the host"""
+        st = None
+        nxt = 0
+        while True:
+            payload = self.send_cmd_wait_answer(_CMD_HOST_STATS, nxt)
+            st, nxt = LinkStats.unpack(payload, st)
+            if not nxt:
+                return st
+
+    def link_stats(self) -> dict:
+        """returns the link counters and round trip time histograms of the client"""
+        buf = bytearray(_MAX_LEN_PAYLOAD)
+        st = None
+        nxt = 0
+        while True:
+            self._frames.stats.pack_into(buf, nxt, self._comm.resyncs)
+            st, nxt = LinkStats.unpack(buf, st)
+            if not nxt:
+                st["wake"] = self._comm.wake_stats()
+                st["startup_ms"] = self.startup
+                return st
+
+    def flush_due(self, force=False):
+        """Send the buffered data of sockets whose coalescing deadline passed (all if force).
+        Called before every exchange and by the heartbeat. Errors are raised by the next
+        call of the socket."""
+        if self._flushing:
+            return
+        self._flushing = True
+        try:
+            for sock in self._coalesced[:]:
+                if force or sock._due():
+                    sock._flush_deferred()
+        finally:
+            self._flushing = False
+
     def send_cmd_wait_answer(self, cmd, params: list or tuple = (), timeout=1000) -> (
             int, list or tuple):
         """API for client extensions"""
+        if self._coalesced:
+            self.flush_due()
         # params can actually be a single string too, Frames.create_and_send_packet turns
         # it into a list
         if timeout is None:
             timeout = 100000000  # 100k seconds
-        return self._frames.send_cmd_wait_answer(cmd, params, timeout)
+        self.gc_policy.frame_start()
+        try:
+            r = self._frames.send_cmd_wait_answer(cmd, params, timeout)
+        except CommError:
+            self._exchange_failed()
+            raise
+        except OSError:  # error answer of the host
+            self._exchange_ok()
+            raise
+        finally:
+            self.gc_policy.frame_end()
+        self._exchange_ok()
+        return r
+
+    def send_data_wait_answer(self, op, socknum, length, payload=None, timeout=1000) -> (
+            int, memoryview):
+        """API for data plane frames, returns length and payload of the answer"""
+        if self._coalesced:
+            self.flush_due()
+        if timeout is None:
+            timeout = 100000000  # 100k seconds
+        self.gc_policy.frame_start()
+        try:
+            r = self._frames.send_data_wait_answer(op, socknum, length, payload, timeout)
+        except CommError:
+            self._exchange_failed()
+            raise
+        except OSError:  # error answer of the host
+            self._exchange_ok()
+            raise
+        finally:
+            self.gc_policy.frame_end()
+        self._exchange_ok()
+        return r
+
+    def send_cmd_no_reply(self, cmd, params: list or tuple = ()):
+        """Send a command without waiting for an answer, the host doesn't send one.
+        Errors are only counted by the host (see status)."""
+        if self._coalesced:
+            self.flush_due()
+        self._frames.send_cmd_no_reply(cmd, params)
+
+    def send_data_no_reply(self, op, socknum, length, payload=None):
+        """Send a data plane frame the host doesn't answer, e.g. _DATA_SEND_NR"""
+        if self._coalesced:
+            self.flush_due()
+        self._frames.send_data(op, socknum, length, payload)
+
+    def start_stream(self, socknum, f, length=None, chunk=None, window=None, timeout=10000,
+                     prio=PRIO_BULK):
+        """
+        Let the host stream length bytes (None: until EOF) of socket socknum in frames of
+        chunk bytes (None: max payload), written to f.write() directly from the frame buffer.
+        The client only sends a credit every window frames, so window frames have to fit
+        into the UART rx buffer, window=None derives it from rxbuf. The whole transfer is
+        verified with adler32.
+        Stream frames are processed whenever the client waits for a frame, so other
+        commands can be used meanwhile. The host sends frames of higher priority classes
+        and answers to commands first. Returns the stream, see poll_stream.
+        """
+        if chunk is None:
+            chunk = _MAX_LEN_PAYLOAD
+        if window is None:
+            window = max(1, self.rxbuf // (chunk + _LEN_HEADER))
+        if not 16 <= chunk <= 4096:
+            raise ValueError("chunk has to be between 16 and 4096")
+        if socknum in self._streams:
+            raise OSError(errno.EALREADY)
+        frames = self._frames
+        if chunk + _LEN_HEADER > _MAX_LEN_PACKET and (
+                frames.data_buf is None or len(frames.data_buf) < chunk + _LEN_HEADER):
+            frames.data_buf = memoryview(bytearray(chunk + _LEN_HEADER))
+        req = bytearray(13)
+        struct.pack_into("<IIHHB", req, 0, 0xFFFFFFFF if length is None else length, timeout,
+                         window, chunk, prio)
+        st = _Stream(socknum, f, length, window, timeout)
+        self._streams[socknum] = st
+        frames.data_handler = self._stream_frame
+        try:
+            frames.send_data(_DATA_STREAM, socknum, len(req), req)
+        except CommError:
+            self._end_stream(st)
+            self._exchange_failed()
+            raise
+        return st
+
+    def _end_stream(self, st):
+        st.done = True
+        del self._streams[st.socknum]
+        if not self._streams:
+            self._frames.data_handler = None
+            self._frames.data_buf = None
+
+    def _stream_frame(self, op, socknum, l, payload) -> bool:
+        """data_handler of Frames, processes frames of active streams"""
+        st = self._streams.get(socknum)
+        if st is None or not op & _DATA_REPLY or op & _DATA_OP not in (_DATA_STREAM,
+                                                                       _DATA_STREAM_END):
+            return False
+        st.last = time.ticks_ms()
+        if op & _DATA_ERROR:
+            st.error = OSError(l)
+            self._end_stream(st)
+        elif op & _DATA_OP == _DATA_STREAM:
+            st.total += l
+            st.cnt += 1
+            if st.cnt == st.window and (st.length is None or st.total < st.length):
+                self._frames.send_data(_DATA_CREDIT, socknum, st.window)  # host sends next
+                st.cnt = 0                                                # while writing
+            st.f.write(payload)
+            st.csum = adler32(payload, st.csum)
+        else:
+            t, c = struct.unpack_from("<II", payload, 0)
+            if t != st.total or c != st.csum:
+                if self._debug >= 1:
+                    print("Stream corrupted", t, st.total, c, st.csum)
+                st.error = OSError(errno.EIO)
+            self._end_stream(st)
+        return True
+
+    def poll_stream(self, st, block=True) -> bool:
+        """
+        Process received stream frames until st is finished. Without block only the frames
+        already received are processed. Returns True if the stream finished, raises the
+        error of the stream.
+        """
+        self.gc_policy.frame_start()
+        try:
+            while not st.done:
+                if time.ticks_diff(time.ticks_ms(), st.last) > st.timeout + 1000:
+                    raise CommError(errno.ETIMEDOUT)
+                if not block and not self._comm.any():
+                    return False
+                self._frames.wait_dispatch(None, st.timeout + 1000)
+        except CommError:
+            if not st.done:
+                self._end_stream(st)
+            self._exchange_failed()
+            raise
+        finally:
+            self.gc_policy.frame_end()
+        if st.error is not None:
+            raise st.error
+        self._exchange_ok()
+        return True
+
+    def stream_into(self, socknum, f, length=None, chunk=None, window=None, timeout=10000,
+                    prio=PRIO_BULK) -> int:
+        """Stream a socket into f and wait until it finished, see start_stream.
+        Returns the amount of bytes received."""
+        st = self.start_stream(socknum, f, length, chunk, window, timeout, prio)
+        self.poll_stream(st)
+        return st.total
+
+    async def stream_into_async(self, socknum, f, length=None, chunk=None, window=None,
+                                timeout=10000, prio=PRIO_BULK) -> int:
+        """Like stream_into but lets other tasks run (and use the link) between frames"""
+        st = self.start_stream(socknum, f, length, chunk, window, timeout, prio)
+        while not self.poll_stream(st, False):
+            await asyncio.sleep_ms(1)
+        return st.total
+
+    def gc_idle(self):
+        """Call while the application is idle to collect garbage according to the gc_policy"""
+        return self.gc_policy.idle()
+
+
+class _Stream:
+    def __init__(self, socknum, f, length, window, timeout):
+        self.socknum = socknum
+        self.f = f
+        self.length = length
+        self.window = window
+        self.timeout = timeout
+        self.last = time.ticks_ms()  # last frame received
+        self.total = 0
+        self.csum = 1
+        self.cnt = 0
+        self.done = False
+        self.error = None
 
 
 def get_client() -> WlanClient:
-    return _wlan_client
+    """Returns the default client (the first one attached)"""
+    return _clients[0] if _clients else None
+
+
+def get_clients() -> list:
+    return _clients
+
+
+def set_balancing(mode):
+    """How new sockets are distributed across the attached hosts"""
+    global _balancing
+    if mode not in (BALANCE_ROUND_ROBIN, BALANCE_LOAD):
+        raise ValueError("Unknown balancing mode {}".format(mode))
+    _balancing = mode
+
+
+def select_clients() -> list:
+    """
+    Attached clients in the order a new socket should try them. Hosts that failed their
+    last exchange come last, so new sockets fail over to the hosts that are up.
+    """
+    global _rr
+    if len(_clients) == 1:
+        return _clients
+    _rr = (_rr + 1) % len(_clients)
+    order = _clients[_rr:] + _clients[:_rr]  # rotation breaks ties of BALANCE_LOAD
+    if _balancing == BALANCE_LOAD:
+        order.sort(key=lambda c: c.sockets)
+    return [c for c in order if c.healthy()] + [c for c in order if not c.healthy()]
+
+
+def register_schema(cmd, signature: tuple = None, reply: tuple = None):
+    """
+    Register a fixed signature for the params of cmd and its answer (see Schema).
+    Has to match the signature registered on the host with wlanHandler.register.
+    """
+    if signature is not None:
+        _schemas[cmd] = Schema(signature)
+    if reply is not None:
+        _schemas[cmd | 0x80] = Schema(reply)
@@ -0,0 +1,160 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# WiFi of the host, similar to network.WLAN. Connecting doesn't block the link, the outcome
+# is delivered as an event (see events, wait_event). Scan results are cached by the host.
+
+from micropython import const
+from .wclient import get_client, register_schema
+import struct
+import time
+import errno
+
+_CMD_WIFI_SCAN = const(50)
+_CMD_WIFI_CONNECT = const(51)
+_CMD_WIFI_DISCONNECT = const(52)
+_CMD_WIFI_STATUS = const(53)
+_CMD_WIFI_EVENTS = const(54)
+
+WIFI_CONNECTED = const(1)
+WIFI_CONNECT_FAILED = const(2)  # arg: status of the WLAN interface or ETIMEDOUT
+WIFI_DISCONNECTED = const(3)  # connection lost, arg: 1 if requested by the client
+WIFI_SCAN_DONE = const(4)  # arg: number of networks found
+
+_SCAN_DURATION = const(5000)  # ms the host may not answer while scanning
+_POLL_INTERVAL = const(50)
+
+# same signatures as registered on the host
+register_schema(_CMD_WIFI_SCAN, (int,), (bool, int, int, bytes))
+register_schema(_CMD_WIFI_CONNECT, (bytes, bytes, bytes, int), (int,))
+register_schema(_CMD_WIFI_STATUS, None, (bool, int, int, int, bytes))
+register_schema(_CMD_WIFI_EVENTS, (int,), (bytes,))
+
+
+def _unpack_results(buf) -> list:
+    """Results as returned by network.WLAN.scan, strongest network first"""
+    nets = []
+    p = 0
+    while p < len(buf):
+        l = buf[p]
+        ssid = bytes(buf[p + 1:p + 1 + l])
+        p += 1 + l
+        channel, rssi, authmode, hidden = struct.unpack_from("<BbBB", buf, p + 6)
+        nets.append((ssid, bytes(buf[p:p + 6]), channel, rssi, authmode, bool(hidden)))
+        p += 10
+    return nets
+
+
+class WLAN:
+    def __init__(self, client=None):
+        self._wl = client or get_client()
+        self._seq = 0  # last event received
+        self._pending = []  # (seq, event, arg) not yet returned by events()
+        self.callback = None  # called with (event, arg) for every event by events()
+
+    def scan(self, max_age=30000, block=True) -> list:
+        """
+        Returns the cached scan results of the host if they are not older than max_age ms.
+        Otherwise the host scans in the background and doesn't answer during the scan:
+        block=True waits for the new results, block=False returns the old results (or an
+        empty list) immediately, WIFI_SCAN_DONE signals the new results. Other commands
+        sent during the scan time out.
+        """
+        # a scan started before may still be running
+        fresh, age, seq, results = self._wl.send_cmd_wait_answer(_CMD_WIFI_SCAN, max_age,
+                                                                 _SCAN_DURATION)
+        if fresh:
+            return _unpack_results(results)
+        self._wl.expect_busy(_SCAN_DURATION)
+        if not block:
+            return _unpack_results(results)
+        self.wait_event((WIFI_SCAN_DONE,), _SCAN_DURATION * 2, seq)
+        fresh, age, seq, results = self._wl.send_cmd_wait_answer(_CMD_WIFI_SCAN, 0x7FFFFFFF)
+        return _unpack_results(results)
+
+    def connect(self, ssid, key=None, bssid=None, timeout=15000, block=False):
+        """
+        Start connecting, the host reports WIFI_CONNECTED or WIFI_CONNECT_FAILED.
+        block=True waits for the outcome and raises OSError if connecting failed.
+        """
+        seq = self._wl.send_cmd_wait_answer(_CMD_WIFI_CONNECT,
+                                            (ssid, key or b"", bssid or b"", timeout))
+        if block:
+            event, arg = self.wait_event((WIFI_CONNECTED, WIFI_CONNECT_FAILED), timeout + 1000,
+                                         seq)
+            if event == WIFI_CONNECT_FAILED:
+                raise OSError(arg)
+
+    def disconnect(self):
+        self._wl.send_cmd_wait_answer(_CMD_WIFI_DISCONNECT)
+
+    def _status(self):
+        return self._wl.send_cmd_wait_answer(_CMD_WIFI_STATUS)
+
+    def isconnected(self) -> bool:
+        return self._status()[0]
+
+    def status(self, param=None):
+        """Status of the interface, status("rssi") the signal strength of the connection"""
+        st = self._status()
+        if param == "rssi":
+            return st[2]
+        if param is not None:
+            raise ValueError("Unknown status param")
+        return st[1]
+
+    def ifconfig(self) -> tuple:
+        return tuple(bytes(self._status()[4]).decode().split(","))
+
+    def _fetch(self, timeout):
+        buf = self._wl.send_cmd_wait_answer(_CMD_WIFI_EVENTS, self._seq, timeout)
+        for p in range(0, len(buf), 9):
+            ev = struct.unpack_from("<iBi", buf, p)
+            self._seq = ev[0]
+            self._pending.append(ev)
+
+    def events(self, timeout=1000) -> list:
+        """Returns the new events as (event, arg) and calls the callback for each one"""
+        self._fetch(timeout)
+        evs = [(event, arg) for seq, event, arg in self._pending]
+        self._pending.clear()
+        if self.callback is not None:
+            for event, arg in evs:
+                self.callback(event, arg)
+        return evs
+
+    def _find(self, events, since, st, timeout):
+        """Returns the first of events after seq since, the others stay for events()"""
+        # the host answers late while it scans
+        self._fetch(max(timeout - time.ticks_diff(time.ticks_ms(), st), 1000))
+        for ev in self._pending:
+            if ev[0] > since and ev[1] in events:
+                self._pending.remove(ev)
+                return ev[1], ev[2]
+        return None
+
+    def wait_event(self, events: tuple, timeout=15000, since=0) -> tuple:
+        """Wait for one of the events recorded after seq since, returns (event, arg).
+        Raises OSError(ETIMEDOUT)."""
+        st = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), st) < timeout:
+            found = self._find(events, since, st, timeout)
+            if found is not None:
+                return found
+            time.sleep_ms(_POLL_INTERVAL)
+        raise OSError(errno.ETIMEDOUT)
+
+    async def await_event(self, events: tuple, timeout=15000, since=0) -> tuple:
+        """Like wait_event but lets other coroutines run while waiting"""
+        import uasyncio as asyncio
+        st = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), st) < timeout:
+            found = self._find(events, since, st, timeout)
+            if found is not None:
+                return found
+            await asyncio.sleep_ms(_POLL_INTERVAL)
+        raise OSError(errno.ETIMEDOUT)
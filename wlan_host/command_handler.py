@@ -2,18 +2,40 @@
 # Copyright Kevin Köck 2021 Released under the MIT license
 # Created on 2021-02-07 
 
-__updated__ = "2021-02-07"
+__updated__ = "2026-10-19"
 __version__ = "0.1"
 
+from wlan_link_libs.schema import Schema
+
 
 class CommandHandler:
     def __init__(self, amount_commands=127):
         self._table = [None] * amount_commands
+        self.schemas = {}  # command_id (|0x80 for answers) -> Schema, shared with Frames
+        self._data = [None] * 16  # data plane handlers by op
+        self._limits = bytearray(amount_commands)  # concurrent coroutines per command
+        self._running = bytearray(amount_commands)
 
-    def register(self, command_id):
-        """Wrapper to register a function with command com_id"""
+    def register(self, command_id, signature: tuple = None, reply: tuple = None, limit=2):
+        """
+        Wrapper to register a function with command com_id.
+        Optionally a fixed signature of the params (e.g. (int, bytes, bool)) and of the
+        answer params (without the leading True/False) can be given, which get encoded
+        with a single struct format. The client has to register the same signatures.
+        Bool params are received as True/False, bytes params as memoryview.
+        A function can return a coroutine for slow operations. The host runs it as a task
+        and sends its return value as answer, other frames are served meanwhile. At most
+        limit coroutines of the command run at the same time (on all links), further requests
+        get OSError(EAGAIN). The params are only valid until the function returns, so
+        convert them before creating the coroutine.
+        """
         if self._table[command_id] is not None:
             raise ValueError("Command_id {} already registered".format(command_id))
+        self._limits[command_id] = limit
+        if signature is not None:
+            self.schemas[command_id] = Schema(signature)
+        if reply is not None:
+            self.schemas[command_id | 0x80] = Schema(reply)
 
         def wrapper(f):
             # print("Setting", f.__name__, "at", command_id)
@@ -25,5 +47,34 @@ class CommandHandler:
     def get(self, command_id):
         return self._table[command_id]
 
+    def acquire(self, command_id) -> bool:
+        """Returns False if the limit of running coroutines of command_id is reached"""
+        if self._running[command_id] >= self._limits[command_id]:
+            return False
+        self._running[command_id] += 1
+        return True
+
+    def release(self, command_id):
+        self._running[command_id] -= 1
+
+    def register_data(self, op):
+        """
+        Wrapper to register a data plane handler for op.
+        It gets called with (wl, op, socknum, length, payload) and returns the length for an
+        answer without payload, a buffer to send as payload, an OSError or None if the handler
+        answered itself or no answer is needed.
+        """
+        if self._data[op] is not None:
+            raise ValueError("Data op {} already registered".format(op))
+
+        def wrapper(f):
+            self._data[op] = f
+            return f
+
+        return wrapper
+
+    def get_data(self, op):
+        return self._data[op]
+
 
 wlanHandler = CommandHandler(128)
@@ -0,0 +1,263 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.2"
+
+# HTTP requests executed entirely on the host. The client sends method, url, headers and
+# body in one command and gets the status, the selected headers and a socket number.
+# The body is read from that socket (recv or stream) like from any other socket, chunked
+# transfer encoding is already removed by the host.
+
+from micropython import const
+from .command_handler import wlanHandler
+from wlan_host.whost import WlanHost
+from .socket import Sockets
+from . import nbsocket
+import usocket
+import errno
+import time
+import sys
+
+_CMD_HTTP_REQUEST = const(30)
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+
+# framing of a chunked body read by _Body
+_CHUNK_SIZE = const(0)  # chunk size line
+_CHUNK_END = const(1)  # CRLF after the chunk data
+_TRAILER = const(2)
+_MAX_LINE = const(32)  # stored bytes of a framing line, chunk extensions get cut off
+
+
+class _Body:
+    """usocket-like reader of a response body. Stops at Content-Length and decodes chunked
+    transfer encoding so the client reads EOF at the end of the body.
+    Like a socket it can be non-blocking, readinto then returns None if no data is available,
+    the state of the chunk framing is kept between the calls."""
+
+    def __init__(self, sock, length, chunked):
+        self._sock = sock
+        self._left = length  # None: until the connection closes
+        self._chunked = chunked
+        self._chunk_left = 0
+        self._state = _CHUNK_SIZE
+        self._line = bytearray(_MAX_LINE)
+        self._lpos = 0  # length of the framing line read so far
+        self._b1 = bytearray(1)
+        self._done = False
+
+    def settimeout(self, timeout):
+        try:
+            self._sock.settimeout(timeout)
+        except AttributeError:  # ssl socket
+            pass
+
+    def setblocking(self, blocking):
+        try:
+            self._sock.setblocking(blocking)
+        except AttributeError:  # ssl socket, read with the timeout of the request
+            pass
+
+    def close(self):
+        self._sock.close()
+
+    def send(self, data):
+        raise OSError(errno.EBADF)
+
+    def recv(self, bufsize):
+        buf = bytearray(bufsize)
+        n = self.readinto(buf, bufsize)
+        if n is None:
+            raise OSError(errno.EAGAIN)
+        return memoryview(buf)[:n]
+
+    def _readline(self) -> bool:
+        """Read the next framing line into _line, returns False if it isn't complete yet"""
+        b = self._b1
+        while True:
+            n = self._sock.readinto(b)
+            if n is None:
+                return False
+            if not n:
+                raise OSError(errno.ECONNRESET)  # connection closed within the body
+            if self._lpos < _MAX_LINE:
+                self._line[self._lpos] = b[0]
+            self._lpos += 1
+            if b[0] == 0x0A:
+                return True
+
+    def _next_chunk(self):
+        """Read the framing up to the next chunk data, returns False if it isn't complete
+        yet. Sets _done at the end of the body."""
+        while self._chunk_left == 0 and not self._done:
+            if not self._readline():
+                return False
+            l = self._lpos
+            self._lpos = 0
+            if self._state == _CHUNK_END:
+                self._state = _CHUNK_SIZE
+            elif self._state == _TRAILER:
+                if l <= 2:  # empty line
+                    self._done = True
+            else:
+                line = bytes(self._line[:min(l, _MAX_LINE)])
+                size = int(line.split(b";")[0].strip(), 16)
+                if size == 0:
+                    self._state = _TRAILER
+                else:
+                    self._chunk_left = size
+        return True
+
+    def readinto(self, buf, nbytes=None):
+        if self._done:
+            return 0
+        if nbytes is None:
+            nbytes = len(buf)
+        if self._chunked:
+            if not self._next_chunk():
+                return None
+            if self._done:
+                return 0
+            nbytes = min(nbytes, self._chunk_left)
+        elif self._left is not None:
+            nbytes = min(nbytes, self._left)
+            if nbytes == 0:
+                self._done = True
+                return 0
+        n = self._sock.readinto(memoryview(buf)[:nbytes])
+        if n is None:
+            return None  # no data available
+        if not n:
+            self._done = True
+            if self._chunked or self._left:
+                raise OSError(errno.ECONNRESET)  # connection closed within the body
+            return 0
+        if self._chunked:
+            self._chunk_left -= n
+            if self._chunk_left == 0:
+                self._state = _CHUNK_END
+        elif self._left is not None:
+            self._left -= n
+        return n
+
+
+async def _request(method, url, headers, body, select_hdrs, deadline):
+    """Send the request and read the response header. Only getaddrinfo and the TLS
+    handshake block, the host serves other frames meanwhile.
+    Returns (sock, status, selected headers, location, content length, chunked)"""
+    parts = url.split("/", 3)
+    proto, host = parts[0], parts[2]
+    path = parts[3] if len(parts) > 3 else ""
+    if proto == "http:":
+        port = 80
+    elif proto == "https:":
+        port = 443
+    else:
+        raise ValueError("Unsupported protocol: " + proto)
+    if ":" in host:
+        host, port = host.split(":", 1)
+        port = int(port)
+    ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)[0]
+    s = usocket.socket(ai[0], ai[1], ai[2])
+    try:
+        s.setblocking(False)
+        await nbsocket.connect(s, ai[-1], deadline)
+        if proto == "https:":
+            import ussl
+            s.settimeout(nbsocket.remaining(deadline))  # the handshake blocks
+            s = ussl.wrap_socket(s, server_hostname=host)
+            try:
+                s.setblocking(False)
+            except AttributeError:  # old ussl, reads block with the timeout
+                pass
+        req = "{} /{} HTTP/1.1\r\nHost: {}\r\nConnection: close\r\n".format(
+            method, path, host).encode()
+        if len(body):
+            req += "Content-Length: {}\r\n".format(len(body)).encode()
+        await nbsocket.write(s, req + headers + b"\r\n", deadline)
+        if len(body):
+            await nbsocket.write(s, body, deadline)
+        l = await nbsocket.readline(s, deadline)
+        status = int(l.split(None, 2)[1])
+        hdrs = b""
+        location = None
+        length = None
+        chunked = False
+        while True:
+            l = await nbsocket.readline(s, deadline)
+            if not l or l == b"\r\n":
+                break
+            name, value = l.split(b":", 1)
+            name = name.strip().lower()
+            value = value.strip()
+            if name == b"content-length":
+                length = int(value)
+            elif name == b"transfer-encoding":
+                chunked = b"chunked" in value.lower()
+            elif name == b"location":
+                location = value.decode()
+            if name in select_hdrs:
+                hdrs += name + b": " + value + b"\r\n"
+        if method == "HEAD" or status in (204, 304):
+            length = 0
+            chunked = False
+    except Exception:
+        s.close()
+        raise
+    return s, status, hdrs, location, length, chunked
+
+
+@wlanHandler.register(_CMD_HTTP_REQUEST, (bytes, bytes, bytes, bytes, bytes, int, int),
+                      (int, int, int, bytes))
+def http_request(wl: WlanHost, method, url, headers, body, select, max_redirects: int,
+                 timeout: int):
+    """
+    Execute an HTTP request and follow redirects.
+    headers: additional request header lines, each ending with CRLF.
+    select: comma separated lower case names of the response headers to return.
+    Returns status, socknum of the body, content length (-1 if unknown) and the selected
+    response header lines.
+    """
+    if wl.sockets.active_sockets >= wl.sockets.max_sockets:
+        return OSError(23)
+    method = bytes(method).decode()
+    url = bytes(url).decode()
+    select_hdrs = bytes(select).split(b",") if len(select) else ()
+    if wl._debug >= 3:
+        print("http", method, url)
+    try:
+        wl.memory.admit()
+    except OSError as e:
+        return e
+    # the params are only valid until the handler returns
+    return _http_request(wl, method, url, bytes(headers), bytes(body), select_hdrs,
+                         max_redirects, time.ticks_add(time.ticks_ms(), timeout))
+
+
+async def _http_request(wl, method, url, headers, body, select_hdrs, max_redirects, deadline):
+    try:
+        while True:
+            s, status, hdrs, location, length, chunked = await _request(
+                method, url, headers, body, select_hdrs, deadline)
+            if status not in _REDIRECTS or location is None or max_redirects <= 0:
+                break
+            s.close()
+            max_redirects -= 1
+            if location.startswith("/"):
+                url = "/".join(url.split("/", 3)[:3]) + location
+            else:
+                url = location
+            if status == 303:
+                method = "GET"
+                body = b""
+    except Exception as e:
+        if wl._debug >= 1:
+            sys.print_exception(e)
+        return e
+    if wl.sockets.active_sockets >= wl.sockets.max_sockets:  # taken while connecting
+        s.close()
+        return OSError(23)
+    socknum = wl.sockets._add_socket(_Body(s, length, chunked))
+    return True, status, socknum, -1 if length is None else length, hdrs
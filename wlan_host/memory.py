@@ -0,0 +1,112 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.2"
+
+# Memory budget of the host. Socket data is read into a fixed pool of buffers allocated
+# once at startup instead of a buffer per socket and a new bytes object per recv.
+# New sockets are only admitted if enough memory is free, so the host fails with
+# OSError(ENOMEM) under load instead of crashing because of heap fragmentation.
+
+import gc
+import errno
+
+
+class MemoryManager:
+    def __init__(self, num_buffers=4, buffer_size=400, min_free=20000):
+        """
+        num_buffers: buffers in the pool, a recv holds one until its answer is sent.
+        Hosts serving several links share the pool, so give it more buffers.
+        buffer_size: size of each buffer, limits the bytes per recv.
+        min_free: free heap needed to admit a new socket (a socket with lwip/ssl state
+        needs several kB).
+        """
+        self.min_free = min_free
+        self.buffer_size = buffer_size
+        self._bufs = [bytearray(buffer_size) for _ in range(num_buffers)]
+        self._free = list(self._bufs)
+        self._leased = []  # buffers released after the current frame got answered
+        self.max_in_use = 0
+        self.exhausted = 0  # requests that found no free buffer
+        self.refused = 0  # sockets refused by admission control
+        self.hosts = 0  # WlanHosts using this manager
+
+    def configure(self, num_buffers=None, buffer_size=None):
+        """Replace the pool, only possible while no buffer is in use"""
+        if len(self._free) != len(self._bufs):
+            raise OSError(errno.EBUSY)
+        num_buffers = num_buffers or len(self._bufs)
+        buffer_size = buffer_size or self.buffer_size
+        if num_buffers != len(self._bufs) or buffer_size != self.buffer_size:
+            self._bufs = self._free = None
+            gc.collect()
+            self.buffer_size = buffer_size
+            self._bufs = [bytearray(buffer_size) for _ in range(num_buffers)]
+            self._free = list(self._bufs)
+
+    def grow(self, buffer_size):
+        """Enlarge the buffers while other links may use some of them, the free buffers
+        are replaced now and the ones in use when they get released"""
+        if buffer_size <= self.buffer_size:
+            return
+        self.buffer_size = buffer_size
+        for buf in self._free:
+            self._bufs[self._index(buf)] = None
+        self._free = None
+        gc.collect()
+        self._free = []
+        for i, buf in enumerate(self._bufs):
+            if buf is None:
+                buf = self._bufs[i] = bytearray(buffer_size)
+                self._free.append(buf)
+
+    def _index(self, buf):
+        for i, b in enumerate(self._bufs):
+            if b is buf:
+                return i
+        return None
+
+    def acquire(self) -> bytearray:
+        """Take a buffer from the pool, has to be returned with release"""
+        if not self._free:
+            self.exhausted += 1
+            raise OSError(errno.ENOMEM)
+        buf = self._free.pop()
+        n = len(self._bufs) - len(self._free)
+        if n > self.max_in_use:
+            self.max_in_use = n
+        return buf
+
+    def release(self, buf):
+        """Return a buffer of the pool, other buffers are ignored"""
+        i = self._index(buf)
+        if i is None:
+            return
+        if len(buf) < self.buffer_size:  # pool grew while it was in use
+            buf = self._bufs[i] = bytearray(self.buffer_size)
+        self._free.append(buf)
+
+    def lease(self) -> bytearray:
+        """Take a buffer that is returned automatically after the current frame"""
+        buf = self.acquire()
+        self._leased.append(buf)
+        return buf
+
+    def release_leases(self):
+        while self._leased:
+            self.release(self._leased.pop())
+
+    def admit(self):
+        """Raises OSError(ENOMEM) if there isn't enough free memory for a new socket"""
+        if gc.mem_free() < self.min_free:
+            gc.collect()
+            if gc.mem_free() < self.min_free:
+                self.refused += 1
+                raise OSError(errno.ENOMEM)
+
+    def status(self) -> dict:
+        return {"buffers": len(self._bufs), "buffer_size": self.buffer_size,
+                "in_use": len(self._bufs) - len(self._free), "max_in_use": self.max_in_use,
+                "exhausted": self.exhausted, "refused": self.refused, "hosts": self.hosts}
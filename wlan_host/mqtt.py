@@ -0,0 +1,367 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.2"
+
+# Persistent MQTT session owned by the host, based on umqtt.simple.
+# The host connects, sends keep-alive pings, subscribes again after a reconnect and
+# retries QoS 1 publications until they are acknowledged. The client only sends
+# publications and polls received messages, which are delivered in batches.
+# QoS 1 publications are written without waiting for the PUBACK like umqtt does, the
+# PUBACKs are handled when received, so the event loop of the host never blocks on them.
+# The connection is made by the host with a non-blocking socket within _CONNECT_TIMEOUT and
+# subscriptions don't wait for the SUBACK either, umqtt only parses the received packets.
+
+from micropython import const
+import uasyncio as asyncio
+from .command_handler import wlanHandler
+from wlan_host.whost import WlanHost
+from . import nbsocket
+import usocket
+import struct
+import time
+import errno
+import sys
+
+_CMD_MQTT_CONNECT = const(40)
+_CMD_MQTT_PUBLISH = const(41)
+_CMD_MQTT_SUBSCRIBE = const(42)
+_CMD_MQTT_POLL = const(43)
+_CMD_MQTT_DISCONNECT = const(44)
+
+_LEN_BATCH = const(380)  # fits into an answer frame together with the other params
+_MAX_INBOX = const(32)  # received messages waiting for the client, oldest get dropped
+_MAX_PENDING = const(16)  # QoS 1 publications waiting to be acknowledged
+_POLL_INTERVAL = const(50)  # ms between checks for incoming messages
+_ACK_TIMEOUT = const(5000)  # ms until a QoS 1 publication without PUBACK is sent again
+_RECONNECT_INTERVAL = const(2000)
+_CONNECT_TIMEOUT = const(20000)  # ms, the client waits 30s for the answer of connect
+
+_sessions = {}  # WlanHost -> _Session, every link has its own session
+
+
+class _Session:
+    def __init__(self, wl, client_id, server, port, user, password, keepalive, ssl):
+        from umqtt.simple import MQTTClient
+        self._wl = wl
+        self._mqtt = MQTTClient(client_id, server, port, user, password, keepalive, ssl)
+        self._mqtt.set_callback(self._on_message)
+        self._client_id = client_id
+        self._server = server
+        self._port = port or (8883 if ssl else 1883)
+        self._user = user
+        self._password = password
+        self._ssl = ssl
+        self._keepalive = keepalive
+        self.connected = False
+        self._subs = {}  # topic -> qos, subscribed again after a reconnect
+        self._pending = []  # unacknowledged QoS 1 publications [pid, topic, msg, retain, sent]
+        self._pid = 0
+        self._hdr = bytearray(7)  # fixed header, topic length and pid of a publication
+        self._got = False  # check_msg dispatched a message
+        self._inbox = []  # received (topic, msg) for the client
+        self.dropped = 0  # received messages dropped because the inbox was full
+        self._last_tx = 0
+        self._batch = bytearray(_LEN_BATCH)
+        self._task = None
+
+    def _on_message(self, topic, msg):
+        self._got = True
+        if len(self._inbox) >= _MAX_INBOX:
+            self._inbox.pop(0)
+            self.dropped += 1
+        self._inbox.append((topic, msg))
+
+    def _connect_packet(self, clean_session) -> bytearray:
+        flags = clean_session << 1
+        payload = struct.pack("!H", len(self._client_id)) + self._client_id
+        if self._user is not None:
+            flags |= 0x80
+            payload += struct.pack("!H", len(self._user)) + self._user
+        if self._password is not None:
+            flags |= 0x40
+            payload += struct.pack("!H", len(self._password)) + self._password
+        pkt = bytearray(self._hdr[:self._fixed_header(0x10, 10 + len(payload))])
+        pkt += b"\x00\x04MQTT\x04" + struct.pack("!BH", flags, self._keepalive) + payload
+        return pkt
+
+    async def connect(self, clean_session):
+        """Connect like umqtt but without blocking the host longer than getaddrinfo and a
+        TLS handshake take"""
+        deadline = time.ticks_add(time.ticks_ms(), _CONNECT_TIMEOUT)
+        ai = usocket.getaddrinfo(self._server, self._port, 0, usocket.SOCK_STREAM)[0]
+        s = usocket.socket(ai[0], ai[1], ai[2])
+        try:
+            s.setblocking(False)
+            await nbsocket.connect(s, ai[-1], deadline)
+            if self._ssl:
+                import ussl
+                s.settimeout(nbsocket.remaining(deadline))  # the handshake blocks
+                s = ussl.wrap_socket(s, server_hostname=self._server)
+                s.setblocking(False)
+            await nbsocket.write(s, self._connect_packet(clean_session), deadline)
+            resp = bytearray(4)
+            if await nbsocket.readinto(s, resp, deadline) < 4:
+                raise OSError(errno.ECONNRESET)
+            if resp[0] != 0x20 or resp[1] != 0x02:
+                raise OSError(errno.EIO)
+            if resp[3]:  # connection refused by the broker
+                raise OSError(errno.ECONNREFUSED)
+            s.setblocking(True)  # like after umqtt.connect
+        except Exception:
+            s.close()
+            raise
+        self._mqtt.sock = s
+        self._last_tx = time.ticks_ms()
+        try:
+            for topic in self._subs:
+                self._subscribe(topic, self._subs[topic])
+            for p in self._pending:
+                self._send(p)
+        except OSError:
+            s.close()
+            raise
+        self.connected = True
+
+    def _lost(self, e):
+        if self._wl._debug >= 1:
+            print("MQTT connection lost", e)
+        self.connected = False
+        try:
+            self._mqtt.sock.close()
+        except Exception:
+            pass
+
+    def _fixed_header(self, b0, sz) -> int:
+        """Packet type and remaining length sz into _hdr, returns the length of the header.
+        Leaves room for 2 more bytes."""
+        hdr = self._hdr
+        hdr[0] = b0
+        i = 1
+        while sz > 0x7F:
+            hdr[i] = (sz & 0x7F) | 0x80
+            sz >>= 7
+            i += 1
+        hdr[i] = sz
+        return i + 1
+
+    def _next_pid(self) -> int:
+        self._pid = self._pid + 1 if self._pid < 65535 else 1
+        return self._pid
+
+    def _subscribe(self, topic, qos):
+        """Send SUBSCRIBE without waiting for the SUBACK, _receive skips it"""
+        sock = self._mqtt.sock
+        sock.write(self._hdr, self._fixed_header(0x82, 5 + len(topic)))
+        struct.pack_into("!HH", self._hdr, 0, self._next_pid(), len(topic))
+        sock.write(self._hdr, 4)
+        sock.write(topic)
+        self._hdr[0] = qos
+        sock.write(self._hdr, 1)
+        self._last_tx = time.ticks_ms()
+
+    def _send(self, p):
+        """Write the QoS 1 publication p, DUP is set if it got sent before"""
+        pid, topic, msg, retain, sent = p
+        hdr = self._hdr
+        i = self._fixed_header(0x32 | retain | (0x08 if sent is not None else 0),
+                               4 + len(topic) + len(msg))
+        struct.pack_into("!H", hdr, i, len(topic))
+        sock = self._mqtt.sock
+        sock.write(hdr, i + 2)
+        sock.write(topic)
+        struct.pack_into("!H", hdr, 0, pid)
+        sock.write(hdr, 2)
+        sock.write(msg)
+        p[4] = self._last_tx = time.ticks_ms()
+
+    def _flush(self):
+        """Send pending QoS 1 publications not sent yet or without PUBACK in time"""
+        now = time.ticks_ms()
+        for p in self._pending:
+            if p[4] is None or time.ticks_diff(now, p[4]) > _ACK_TIMEOUT:
+                self._send(p)
+
+    def _receive(self):
+        """Handle the received packets. check_msg returns None after dispatching a message
+        like when nothing got received, so _got tells them apart."""
+        mqtt = self._mqtt
+        for _ in range(_MAX_INBOX):  # other tasks get a turn during a flood
+            self._got = False
+            op = mqtt.check_msg()
+            if op is None:
+                if not self._got:
+                    return
+            elif op == 0x40:  # PUBACK
+                mqtt.sock.read(1)  # remaining length 2
+                pid = mqtt.sock.read(2)
+                pid = pid[0] << 8 | pid[1]
+                for p in self._pending:
+                    if p[0] == pid:
+                        self._pending.remove(p)
+                        break
+            else:  # not expected here, e.g. a late SUBACK
+                mqtt.sock.read(mqtt._recv_len())
+
+    def publish(self, topic, msg, retain, qos):
+        if qos == 0:
+            if not self.connected:
+                return OSError(errno.ENOTCONN)
+            try:
+                self._mqtt.publish(topic, msg, retain, 0)
+            except OSError as e:
+                self._lost(e)
+                return e
+            self._last_tx = time.ticks_ms()
+            return True
+        if len(self._pending) >= _MAX_PENDING:
+            return OSError(errno.ENOMEM)
+        self._pending.append([self._next_pid(), topic, msg, int(retain), None])
+        if self.connected:
+            try:
+                self._flush()
+            except OSError as e:
+                self._lost(e)  # retried after the reconnect
+        return True
+
+    def subscribe(self, topic, qos):
+        self._subs[topic] = qos
+        if self.connected:
+            try:
+                self._subscribe(topic, qos)
+            except OSError as e:
+                self._lost(e)  # subscribed after the reconnect
+        return True
+
+    def poll(self):
+        """Pack as many received messages as fit into the batch buffer.
+        Each message is packed as topic length, message length (2 bytes each), topic, message.
+        Returns the batch and the number of messages left in the inbox."""
+        buf = self._batch
+        p = 0
+        inbox = self._inbox
+        while inbox:
+            topic, msg = inbox[0]
+            l = 4 + len(topic) + len(msg)
+            if l > _LEN_BATCH:  # can never be delivered
+                inbox.pop(0)
+                self.dropped += 1
+                continue
+            if p + l > _LEN_BATCH:
+                break
+            struct.pack_into("<HH", buf, p, len(topic), len(msg))
+            p += 4
+            buf[p:p + len(topic)] = topic
+            p += len(topic)
+            buf[p:p + len(msg)] = msg
+            p += len(msg)
+            inbox.pop(0)
+        return memoryview(buf)[:p], len(inbox)
+
+    async def run(self, clean_session):
+        """Receive messages, keep the connection alive and reconnect if it got lost"""
+        mqtt = self._mqtt
+        while True:
+            if not self.connected:
+                await asyncio.sleep_ms(_RECONNECT_INTERVAL)
+                try:
+                    await self.connect(clean_session)
+                except OSError as e:
+                    if self._wl._debug >= 1:
+                        print("MQTT reconnect failed", e)
+                continue
+            try:
+                self._receive()
+                if self._keepalive and time.ticks_diff(time.ticks_ms(), self._last_tx) > \
+                        self._keepalive * 500:
+                    mqtt.ping()
+                    self._last_tx = time.ticks_ms()
+                self._flush()
+            except OSError as e:
+                self._lost(e)
+            await asyncio.sleep_ms(_POLL_INTERVAL)
+
+    def disconnect(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.connected:
+            try:
+                self._mqtt.disconnect()
+            except OSError:
+                pass
+            self.connected = False
+
+
+@wlanHandler.register(_CMD_MQTT_CONNECT, (bytes, bytes, int, bytes, bytes, int, bool, bool),
+                      limit=4)
+def connect(wl: WlanHost, client_id, server, port: int, user, password, keepalive: int,
+            clean_session: bool, ssl: bool):
+    """Connect to the broker and keep the session alive until disconnect, answered by
+    the coroutine when connected"""
+    if wl in _sessions:
+        _sessions.pop(wl).disconnect()
+    try:
+        s = _Session(wl, bytes(client_id), bytes(server).decode(), port,
+                     bytes(user) if len(user) else None,
+                     bytes(password) if len(password) else None, keepalive, ssl)
+    except Exception as e:
+        return e
+    return _connect(wl, s, clean_session)
+
+
+async def _connect(wl, s, clean_session):
+    try:
+        await s.connect(clean_session)
+    except Exception as e:
+        if wl._debug >= 1:
+            sys.print_exception(e)
+        return e
+    if wl in _sessions:  # connected again meanwhile
+        _sessions.pop(wl).disconnect()
+    _sessions[wl] = s
+    s._task = asyncio.create_task(s.run(clean_session))
+    return True
+
+
+def _get_session(wl):
+    if wl not in _sessions:
+        raise OSError(errno.ENOTCONN)
+    return _sessions[wl]
+
+
+@wlanHandler.register(_CMD_MQTT_PUBLISH, (bytes, bytes, bool, int))
+def publish(wl: WlanHost, topic, msg, retain: bool, qos: int):
+    """QoS 0 is sent immediately, QoS 1 is queued and retried until acknowledged"""
+    try:
+        return _get_session(wl).publish(bytes(topic), bytes(msg), retain, qos)
+    except OSError as e:
+        return e
+
+
+@wlanHandler.register(_CMD_MQTT_SUBSCRIBE, (bytes, int))
+def subscribe(wl: WlanHost, topic, qos: int):
+    try:
+        return _get_session(wl).subscribe(bytes(topic), qos)
+    except OSError as e:
+        return e
+
+
+@wlanHandler.register(_CMD_MQTT_POLL, None, (bool, int, int, bytes))
+def poll(wl: WlanHost, *args):
+    """Returns connection state, messages left, messages dropped and a batch of messages"""
+    try:
+        s = _get_session(wl)
+    except OSError as e:
+        return e
+    batch, left = s.poll()
+    return True, s.connected, left, s.dropped, batch
+
+
+@wlanHandler.register(_CMD_MQTT_DISCONNECT)
+def disconnect(wl: WlanHost, *args):
+    if wl in _sessions:
+        _sessions.pop(wl).disconnect()
+    return True
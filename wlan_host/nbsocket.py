@@ -0,0 +1,99 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Non-blocking socket operations for the coroutines of command handlers (http, mqtt).
+# They poll the socket and sleep in between, so the host serves other frames meanwhile.
+# All of them raise OSError(ETIMEDOUT) once deadline (ticks_ms) has passed.
+
+from micropython import const
+import uasyncio as asyncio
+import select
+import errno
+import time
+
+_POLL = const(10)  # ms between polls of the socket
+
+
+def expired(deadline):
+    if time.ticks_diff(time.ticks_ms(), deadline) > 0:
+        raise OSError(errno.ETIMEDOUT)
+
+
+def remaining(deadline) -> float:
+    """Seconds until deadline, e.g. for the timeout of a TLS handshake that has to block"""
+    return max(time.ticks_diff(deadline, time.ticks_ms()), 1) / 1000
+
+
+async def connect(s, addr, deadline):
+    try:
+        s.connect(addr)
+        return
+    except OSError as e:
+        if e.args[0] != errno.EINPROGRESS:
+            raise
+    p = select.poll()
+    p.register(s, select.POLLOUT)
+    while True:
+        ev = p.poll(0)
+        if ev:
+            if ev[0][1] & (select.POLLERR | select.POLLHUP):
+                raise OSError(errno.ECONNREFUSED)
+            return
+        expired(deadline)
+        await asyncio.sleep_ms(_POLL)
+
+
+async def write(s, data, deadline):
+    mv = memoryview(data)
+    while len(mv):
+        try:
+            n = s.write(mv)
+        except OSError as e:
+            if e.args[0] != errno.EAGAIN:
+                raise
+            n = None
+        if n:
+            mv = mv[n:]
+        else:
+            expired(deadline)
+            await asyncio.sleep_ms(_POLL)
+
+
+async def readinto(s, buf, deadline, line=False) -> int:
+    """Fill buf, with line only up to and including LF. Returns the bytes read, less than
+    len(buf) if the connection got closed."""
+    mv = memoryview(buf)
+    p = 0
+    while p < len(buf):
+        try:
+            n = s.readinto(mv[p:p + 1] if line else mv[p:])
+        except OSError as e:
+            if e.args[0] != errno.EAGAIN:
+                raise
+            n = None
+        if n is None:
+            expired(deadline)
+            await asyncio.sleep_ms(_POLL)
+        elif not n:
+            break
+        else:
+            p += n
+            if line and buf[p - 1] == 0x0A:
+                break
+    return p
+
+
+async def readline(s, deadline) -> bytes:
+    """Read a line byte by byte, so nothing after it is taken from the socket"""
+    line = bytearray()
+    b1 = bytearray(1)
+    while True:
+        if not await readinto(s, b1, deadline):
+            return bytes(line)
+        line.append(b1[0])
+        if b1[0] == 0x0A:
+            return bytes(line)
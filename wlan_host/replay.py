@@ -0,0 +1,49 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Feed the received frames of a capture into a new WlanHost for regression and performance
+# tests. The commands get executed again, e.g. sockets connect to the captured addresses,
+# so run it on a spare board and not next to a running WlanHost.
+
+import uasyncio as asyncio
+import time
+from wlan_link_libs.capture import ReplayUart, read_records
+from wlan_link_libs.uart import WUart
+from .whost import WlanHost
+
+
+async def replay(path, ready_pin, speed=1.0, debug=0, timeout=60) -> dict:
+    """
+    Replay the capture file at path with the timing of the capture divided by speed
+    (0: as fast as possible). Returns counters and the link stats of the host.
+    """
+    with open(path, "rb") as f:
+        uart = ReplayUart(read_records(f), speed)
+    wl = WlanHost(WUart(uart, debug=debug), ready_pin, debug=debug)
+    await asyncio.sleep_ms(20)  # host flushes the uart when it starts listening
+    uart.start()
+    st = time.ticks_ms()
+    while not uart.done() or wl.scheduler.pending():
+        if time.ticks_diff(time.ticks_ms(), st) > timeout * 1000:
+            break
+        await asyncio.sleep_ms(10)
+    await asyncio.sleep_ms(50)  # last answer
+    duration = time.ticks_diff(time.ticks_ms(), st)
+    wl._listen_task.cancel()
+    wl._gc_task.cancel()
+    from wlan_link_libs.stats import LinkStats
+    buf = bytearray(403)
+    stats = None
+    nxt = 0
+    while True:
+        wl._frames.stats.pack_into(buf, nxt)
+        stats, nxt = LinkStats.unpack(buf, stats)
+        if not nxt:
+            break
+    return {"frames_in": uart.frames_in, "frames_out": uart.frames_out,
+            "bytes_out": uart.bytes_out, "duration_ms": duration, "complete": uart.done(),
+            "stats": stats}
@@ -2,13 +2,22 @@
 # Copyright Kevin Köck 2021 Released under the MIT license
 # Created on 2021-02-10 
 
-__updated__ = "2021-02-10"
+__updated__ = "2026-10-19"
 __version__ = "0.1"
 
+# imported by WlanHost.listen, so WlanHost is only named in the annotations
+
 from micropython import const
-from .whost import get_host
 from .command_handler import wlanHandler
-from wlan_host.whost import WlanHost
+from wlan_link_libs.frames import _DATA_SEND, _DATA_RECV, _DATA_BLOCK, _DATA_STREAM, \
+    _DATA_CREDIT, _DATA_STREAM_END, _DATA_SEND_NR, _DATA_REPLY, _DATA_ERROR, _DATA_OP, adler32
+from wlan_link_libs.uart import CommError
+from wlan_link_libs.scheduler import PRIO_INTERACTIVE, PRIO_BULK
+from wlan_link_libs.ringbuf import Ringbuf
+import uasyncio as asyncio
+import select
+import struct
+import time
 import usocket
 import gc
 import errno
@@ -22,10 +31,13 @@ _CMD_SEND_SOCKET = const(24)
 _CMD_RECV_SOCKET = const(25)
 
 _SOCKET_TCP_MODE = const(1)
+_CONNECT_TIMEOUT = const(25000)  # blocking connect, the client waits 30s for the answer
+_CONNECT_POLL = const(10)
+_CLOSE_LINGER = const(5000)  # ms a closed socket may take to send its queued data
 
 
 @wlanHandler.register(_CMD_GETADDRINFO)
-def getaddrinfo(wl: WlanHost, host: str, port: int, family=0, socktype=0, proto=0, flags=0):
+def getaddrinfo(wl: "WlanHost", host: str, port: int, family=0, socktype=0, proto=0, flags=0):
     host = bytes(host).decode()
     # print("getaddrinfo", host, port, family, socktype, proto, flags)
     try:
@@ -44,66 +56,81 @@ def socknum_gen():
 
 
 class Sockets:
-    _sockets = {}
-    _newpid = socknum_gen()
-    max_sockets = 16  # ESP32 raises Exception with more than 5 sockets?
-    active_sockets = 0
-    socket_rx_buffer = 400  # rx buffer for socket object
+    """Socket namespace of one WlanHost, socket numbers are only unique per link"""
+    max_sockets = 16  # default of new hosts, additionally limited by MemoryManager.admit
     max_payload_len = 400
+    send_queue_len = 1024  # bytes a socket queues while the TCP window is full
+
+    def __init__(self, wl: "WlanHost"):
+        self._wl = wl
+        self._sockets = {}
+        self._newpid = socknum_gen()
+        self.max_sockets = Sockets.max_sockets
+        self.max_payload_len = Sockets.max_payload_len
+        self.send_queue_len = Sockets.send_queue_len
+        self._abuf = bytearray(4)  # answer of data_send
+        self.active_sockets = 0
+        self.bytes_in = 0  # bytes received by all sockets of the link
+        self.bytes_out = 0  # bytes sent by all sockets of the link
 
     @staticmethod
     @wlanHandler.register(_CMD_GET_SOCKET)
-    def create_socket(wl: WlanHost, *args):
-        if Sockets.active_sockets >= Sockets.max_sockets:
+    def create_socket(wl: "WlanHost", *args):
+        if wl.sockets.active_sockets >= wl.sockets.max_sockets:
             if wl._debug >= 1:
                 print("Maximum configured sockets reached")
             return OSError(23)
         try:
+            wl.memory.admit()
             s = usocket.socket()
         except Exception as e:
             if wl._debug >= 1:
                 sys.print_exception(e)
             return e
-        pid = next(Sockets._newpid)
-        while pid in Sockets._sockets:
-            pid = next(Sockets._newpid)
-        Sockets._sockets[pid] = socket(wl, s, pid, Sockets.socket_rx_buffer)
-        return True, pid
+        return True, wl.sockets._add_socket(s)
 
-    @staticmethod
-    def _get_socket(socknum):
-        if socknum in Sockets._sockets:
-            return Sockets._sockets[socknum]
+    def _add_socket(self, s) -> int:
+        """Register a usocket-like object s, returns its socknum"""
+        pid = next(self._newpid)
+        while pid in self._sockets:
+            pid = next(self._newpid)
+        self._sockets[pid] = socket(self._wl, s, pid)
+        self.active_sockets += 1
+        return pid
+
+    def _get_socket(self, socknum):
+        if socknum in self._sockets:
+            return self._sockets[socknum]
         else:
-            raise TypeError("Socket {} does not exist".format(socknum))
+            raise OSError(errno.EBADF)  # socket does not exist
 
-    @staticmethod
-    def _remove_socket(socknum):
-        del Sockets._sockets[socknum]
+    def _remove_socket(self, socknum):
+        del self._sockets[socknum]
+        self.active_sockets -= 1
 
     @staticmethod
-    @wlanHandler.register(_CMD_CONNECT_SOCKET)
-    def connect(wl: WlanHost, socknum: int, host: str, port: int, conntype: int, blocking: bool):
+    @wlanHandler.register(_CMD_CONNECT_SOCKET, (int, bytes, int, int, bool), limit=4)
+    def connect(wl: "WlanHost", socknum: int, host: str, port: int, conntype: int, blocking: bool):
         host = bytes(host).decode()
         if wl._debug >= 3:
             print("connect", socknum, host, port, conntype, blocking)
         try:
-            sock = Sockets._get_socket(socknum)
+            sock = wl.sockets._get_socket(socknum)
         except OSError as e:
             return e
         return sock.connect(host, port, conntype, blocking)
 
     @staticmethod
     @wlanHandler.register(_CMD_CLOSE_SOCKET)
-    def close(wl: WlanHost, socknum: int):
+    def close(wl: "WlanHost", socknum: int):
         try:
-            sock = Sockets._get_socket(socknum)
+            sock = wl.sockets._get_socket(socknum)
         except OSError as e:
             if e.args[0] == errno.EBADF:  # socket already removed
                 return True
             return e
         sock.close()
-        Sockets._remove_socket(socknum)
+        wl.sockets._remove_socket(socknum)
         del sock
         gc.collect()
         if wl._debug >= 3:
@@ -111,71 +138,280 @@ class Sockets:
         return True
 
     @staticmethod
-    @wlanHandler.register(_CMD_SEND_SOCKET)
-    def send(wl: WlanHost, socknum: int, *args):
+    @wlanHandler.register(_CMD_SEND_SOCKET, (int, bytes), (int,))
+    def send(wl: "WlanHost", socknum: int, *args):
         try:
-            sock = Sockets._get_socket(socknum)
+            sock = wl.sockets._get_socket(socknum)
         except OSError as e:
             return e
         return sock.send(*args)
 
     @staticmethod
-    @wlanHandler.register(_CMD_RECV_SOCKET)
-    def recv(wl: WlanHost, socknum: int, bufsize: int, blocking: bool):
+    @wlanHandler.register(_CMD_RECV_SOCKET, (int, int, bool))
+    def recv(wl: "WlanHost", socknum: int, bufsize: int, blocking: bool):
         try:
-            sock = Sockets._get_socket(socknum)
-        except TypeError:
+            sock = wl.sockets._get_socket(socknum)
+        except OSError as e:
             if wl._debug >= 3:
                 print("Socket doesn't exist", socknum)
-            return OSError, errno.EBADF
+            return e
         return sock.recv(bufsize, blocking)
 
+    @staticmethod
+    @wlanHandler.register_data(_DATA_SEND)
+    def data_send(wl: "WlanHost", op: int, socknum: int, length: int, payload: memoryview):
+        sock = wl.sockets._get_socket(socknum)
+        if sock._error is not None:
+            return sock.deferred_error()
+        r = sock.send(payload)
+        if isinstance(r, Exception):
+            return r
+        # accepted bytes and free space of the queue, the client doesn't send more without
+        # answer than fits
+        struct.pack_into("<HH", wl.sockets._abuf, 0, r[1], sock.queue_space())
+        return wl.sockets._abuf
+
+    @staticmethod
+    @wlanHandler.register_data(_DATA_SEND_NR)
+    def data_send_nr(wl: "WlanHost", op: int, socknum: int, length: int, payload: memoryview):
+        sock = wl.sockets._sockets.get(socknum)
+        if sock is None:
+            wl._deferred_error(_DATA_SEND_NR, OSError(errno.EBADF))
+        else:
+            sock.send_all(payload)
+        return None  # never answered, errors are returned by the next answer
+
+    @staticmethod
+    @wlanHandler.register_data(_DATA_RECV)
+    def data_recv(wl: "WlanHost", op: int, socknum: int, bufsize: int, payload):
+        sock = wl.sockets._get_socket(socknum)
+        # a client only waits for one recv per socket, a parked one got abandoned
+        # (e.g. timeout or interrupted on the client) and must not be answered anymore
+        sock.cancel_recv()
+        if sock._error is not None:
+            return sock.deferred_error()
+        timeout = 0xFFFFFFFF
+        if payload is not None:  # long-poll, payload is bufsize and timeout in ms
+            bufsize, timeout = struct.unpack_from("<HI", payload, 0)
+        r = sock.recv(bufsize, False)
+        if op & _DATA_BLOCK and isinstance(r, OSError) and r.args[0] == errno.EAGAIN:
+            # answered when data arrives, the host keeps serving other frames meanwhile
+            return sock.recv_later(bufsize, None if timeout == 0xFFFFFFFF else timeout)
+        return r if isinstance(r, Exception) else r[1]
+
+    @staticmethod
+    @wlanHandler.register_data(_DATA_STREAM)
+    def data_stream(wl: "WlanHost", op: int, socknum: int, length: int, payload: memoryview):
+        total, timeout, window, chunk, prio = struct.unpack_from("<IIHHB", payload, 0)
+        sock = wl.sockets._get_socket(socknum)
+        sock.stream(wl._frames, chunk, None if total == 0xFFFFFFFF else total, timeout, window,
+                    prio)
+
+    @staticmethod
+    @wlanHandler.register_data(_DATA_CREDIT)
+    def data_credit(wl: "WlanHost", op: int, socknum: int, length: int, payload):
+        sock = wl.sockets._sockets.get(socknum)
+        if sock is not None and sock._stream is not None:
+            sock._stream.credit()
+        return None  # credits are never answered
+
 
 class socket:
-    def __init__(self, wl: WlanHost, sock: usocket, socknum: int, len_buffer: int):
+    def __init__(self, wl: "WlanHost", sock: usocket, socknum: int):
         self._socknum = socknum
         self._sock = sock
-        self._buffer = bytearray(len_buffer)
         self._conntype = None
         self._wl = wl
+        self._stream = None  # active _Stream
+        self._poll = None  # parked _Recv
+        self._error = None  # errno of a send without answer, returned by the next answer
+        self._out = None  # Ringbuf of data waiting for the TCP window, see send
+        self._drain = None  # active _Drain
+        self.bytes_in = 0
+        self.bytes_out = 0
 
     def connect(self, host: str, port: int, conntype: int, blocking: bool):
         if self._wl._debug >= 3:
             print("Connecting")
         self._conntype = conntype
-        self._sock.setblocking(blocking)
+        self._sock.setblocking(False)  # internally we'll use non-blocking sockets
+        if blocking:  # answered when connected, the host serves other frames meanwhile
+            return self._connect((host, port))
         try:
             self._sock.connect((host, port))
-            if self._wl._debug >= 3:
-                print("Connected")
             return True
         except OSError as e:
             return e
-        finally:
-            if blocking:
-                self._sock.setblocking(False)  # internally we'll use non-blocking sockets
+
+    async def _connect(self, addr):
+        s = self._sock
+        try:
+            s.connect(addr)
+            return True
+        except OSError as e:
+            if e.args[0] != errno.EINPROGRESS:
+                return e
+        p = select.poll()
+        p.register(s, select.POLLOUT)
+        st = time.ticks_ms()
+        while True:
+            ev = p.poll(0)
+            if ev:
+                if ev[0][1] & (select.POLLERR | select.POLLHUP):
+                    return OSError(errno.ECONNREFUSED)
+                if self._wl._debug >= 3:
+                    print("Connected")
+                return True
+            if time.ticks_diff(time.ticks_ms(), st) > _CONNECT_TIMEOUT:
+                return OSError(errno.ETIMEDOUT)
+            await asyncio.sleep_ms(_CONNECT_POLL)
 
     def close(self):
+        if self._stream is not None:
+            self._wl.scheduler.remove(self._stream)
+            self._stream_finished()
+        self.cancel_recv()
+        if self._drain is not None and self._error is None:
+            self._drain.linger()  # closed by the drain when the queue is sent
+            return True
+        self._drain_finished()
         self._sock.close()
         return True
 
+    def _sent(self, n):
+        self.bytes_out += n
+        self._wl.sockets.bytes_out += n
+
+    def queue_space(self) -> int:
+        return self._wl.sockets.send_queue_len if self._out is None else self._out.space()
+
+    def _queue(self, data) -> int:
+        """Send data or queue what doesn't fit into the TCP window, returns the bytes
+        accepted. The queue is written by a _Drain as the window opens."""
+        out = self._out
+        n = 0
+        if out is None or not out.any():  # queued data has to be sent first
+            try:
+                n = self._sock.send(data)
+            except OSError as e:
+                if e.args[0] != errno.EAGAIN:
+                    raise
+            self._sent(n)
+            if n == len(data):
+                return n
+        if out is None:
+            try:
+                self._wl.memory.admit()
+                out = self._out = Ringbuf(self._wl.sockets.send_queue_len)
+            except (OSError, MemoryError):
+                return n  # the client sends the rest again
+        m = min(len(data) - n, out.space())
+        if m:
+            out.append(data[n:n + m])
+            if self._drain is None:
+                self._drain = _Drain(self)
+                self._wl.scheduler.add(self._drain, PRIO_BULK)
+        return n + m
+
+    def _drain_finished(self):
+        if self._drain is not None:
+            self._wl.scheduler.remove(self._drain)
+            self._drain = None
+        if self._out is not None:
+            self._out.advance_read(self._out.any())  # dropped
+
     def send(self, *args):
         cnt = 0
         for arg in args:
             try:
-                cnt += self._sock.send(arg)
+                n = self._queue(arg)
             except Exception as e:
                 return e
+            cnt += n
+            if n < len(arg):  # queue full
+                break
         return True, cnt
 
+    def send_all(self, data):
+        """Send or queue all of data for a sender not waiting for the result, never blocks.
+        The client only sends what fits into the send queue, data that doesn't fit anyway
+        (e.g. no memory for the queue) is dropped with ENOBUFS. Data after an error is
+        dropped until the error got returned by deferred_error."""
+        if self._error is not None:
+            return
+        try:
+            if self._queue(data) == len(data):
+                return
+            err = errno.ENOBUFS
+        except OSError as e:
+            err = e.args[0]
+        self._error = err
+        if self._wl._debug >= 1:
+            print("Send without answer failed", self._socknum, err)
+
+    def deferred_error(self) -> OSError:
+        e = OSError(self._error)
+        self._error = None
+        return e
+
+    def stream(self, frames, chunk, total, timeout, window, prio):
+        """
+        Stream total bytes (None: until EOF) to the client in frames of up to chunk bytes
+        without waiting for requests. After every window frames the client has to send a
+        credit. The stream ends with a frame containing length and adler32 of the data.
+        The frames are sent by the scheduler of the host between other frames.
+        """
+        if self._stream is not None:
+            raise OSError(errno.EALREADY)
+        mem = self._wl.memory
+        try:
+            if chunk <= mem.buffer_size:
+                buf = mem.acquire()
+            else:  # bigger than the pool buffers
+                mem.admit()
+                buf = bytearray(chunk)
+        except (OSError, MemoryError):
+            raise OSError(errno.ENOMEM)
+        self._sock.setblocking(False)
+        self._stream = _Stream(self, frames, buf, chunk, total, timeout, window)
+        self._wl.scheduler.add(self._stream, prio)
+
+    def _stream_finished(self):
+        s = self._stream
+        self._stream = None
+        self._wl.memory.release(s.buf)  # ignores a buffer bigger than the pool buffers
+        self.bytes_in += s.sent
+        self._wl.sockets.bytes_in += s.sent
+
+    def recv_later(self, bufsize, timeout):
+        """Park a recv until data, EOF or the timeout (None: no timeout) in ms, the host
+        keeps serving other frames meanwhile. Replaces a recv parked before."""
+        self.cancel_recv()
+        self._poll = _Recv(self, bufsize, timeout)
+        self._wl.scheduler.add(self._poll, PRIO_INTERACTIVE)
+        return None
+
+    def cancel_recv(self):
+        if self._poll is not None:
+            self._wl.scheduler.remove(self._poll)
+            self._poll = None
+
     def recv(self, bufsize, blocking):
         # for now blocking=True will freeze the esp32 which is not desirable.
+        # Reads into a pool buffer that is returned after the answer got sent.
         self._sock.setblocking(blocking)
         try:
-            data = self._sock.recv(bufsize)
+            buf = self._wl.memory.lease()
+            n = self._sock.readinto(buf, min(bufsize, len(buf)))
+            if n is None:
+                raise OSError(errno.EAGAIN)
         except Exception as e:
-            sys.print_exception(e)
+            if self._wl._debug >= 3:
+                sys.print_exception(e)
             return e
+        data = memoryview(buf)[:n]
+        self.bytes_in += n
+        self._wl.sockets.bytes_in += n
         if len(data) > 1023:  # limited to 1023 because of 10 bit for param length in param header
             d = [True]
             c = 0
@@ -186,3 +422,160 @@ class socket:
                 c += 1023
             return d
         return True, data
+
+
+class _Stream:
+    """Scheduler job sending the frames of a socket stream"""
+
+    def __init__(self, sock: socket, frames, buf, chunk, total, timeout, window):
+        self._s = sock
+        self._frames = frames
+        self.buf = buf
+        self._mv = memoryview(buf)
+        self._chunk = chunk
+        self._total = total
+        self._timeout = timeout
+        self._window = window
+        self._cnt = 0  # frames sent since the last credit
+        self._last = time.ticks_ms()  # last progress, for the timeout
+        self.sent = 0
+        self._csum = 1
+
+    def credit(self):
+        self._cnt = 0
+        self._last = time.ticks_ms()
+
+    def _error(self, err):
+        try:
+            self._frames.send_data(_DATA_STREAM | _DATA_REPLY | _DATA_ERROR, self._s._socknum,
+                                   err)
+        except CommError:
+            pass
+        self._s._stream_finished()
+        return False
+
+    def step(self):
+        if time.ticks_diff(time.ticks_ms(), self._last) > self._timeout:
+            return self._error(errno.ETIMEDOUT)
+        total = self._total
+        sent = self.sent
+        if self._cnt == self._window and (total is None or sent < total):
+            return None  # waiting for the credit
+        mv = self._mv
+        try:
+            if total is not None and sent == total:
+                n = 0
+            else:
+                n = self._s._sock.readinto(self.buf, self._chunk if total is None else min(
+                    self._chunk, total - sent))
+                if n is None:
+                    return None  # no data available yet
+            if not n:  # EOF
+                struct.pack_into("<II", self.buf, 0, sent, self._csum)
+                self._frames.send_data(_DATA_STREAM_END | _DATA_REPLY, self._s._socknum, 8,
+                                       mv[:8])
+                self._s._stream_finished()
+                return False
+            self._csum = adler32(mv[:n], self._csum)
+            self._frames.send_data(_DATA_STREAM | _DATA_REPLY, self._s._socknum, n, mv[:n])
+        except CommError as e:  # client gone, can't send anything
+            if self._s._wl._debug >= 1:
+                print("Stream aborted", e)
+            self._s._stream_finished()
+            return False
+        except OSError as e:
+            return self._error(e.args[0])
+        self.sent += n
+        self._cnt += 1
+        self._last = time.ticks_ms()
+        return True
+
+
+class _Drain:
+    """Scheduler job writing the send queue of a socket as the TCP window opens"""
+
+    def __init__(self, sock: socket):
+        self._s = sock
+        self._closing = None  # ticks_ms of close, the socket gets closed when sent
+
+    def linger(self):
+        self._closing = time.ticks_ms()
+
+    def _done(self):
+        s = self._s
+        s._drain = None
+        if s._out.any():
+            s._out.advance_read(s._out.any())  # dropped after an error or the linger time
+        if self._closing is not None:
+            try:
+                s._sock.close()
+            except OSError:
+                pass
+        return False
+
+    def step(self):
+        s = self._s
+        out = s._out
+        if s._error is not None or not out.any():
+            return self._done()
+        try:
+            n = s._sock.send(out.get_mmview()[0])
+        except OSError as e:
+            if e.args[0] != errno.EAGAIN:
+                s._error = e.args[0]  # returned by the next answer for the socket
+                if s._wl._debug >= 1:
+                    print("Queued send failed", s._socknum, e)
+                return self._done()
+            n = 0
+        if n:
+            out.advance_read(n)
+            s._sent(n)
+            return True if out.any() else self._done()
+        if self._closing is not None and \
+                time.ticks_diff(time.ticks_ms(), self._closing) > _CLOSE_LINGER:
+            return self._done()
+        return None  # TCP window full
+
+
+class _Recv:
+    """Scheduler job answering a parked recv"""
+
+    def __init__(self, sock: socket, bufsize, timeout):
+        self._s = sock
+        self._bufsize = bufsize
+        self._timeout = timeout
+        self._st = time.ticks_ms()
+
+    def _answer(self, length, payload=None, error=False):
+        s = self._s
+        s._poll = None
+        op = _DATA_RECV | _DATA_REPLY
+        try:
+            s._wl._frames.send_data(op | _DATA_ERROR if error else op, s._socknum, length,
+                                    payload)
+        except CommError as e:  # client gone
+            if s._wl._debug >= 1:
+                print("recv answer failed", e)
+        return False
+
+    def step(self):
+        s = self._s
+        mem = s._wl.memory
+        try:
+            buf = mem.acquire()
+        except OSError:
+            return None  # all buffers in use, try again later
+        try:
+            n = s._sock.readinto(buf, min(self._bufsize, len(buf)))
+            if n is None:
+                if self._timeout is not None and \
+                        time.ticks_diff(time.ticks_ms(), self._st) > self._timeout:
+                    return self._answer(errno.ETIMEDOUT, error=True)
+                return None
+            s.bytes_in += n
+            s._wl.sockets.bytes_in += n
+            return self._answer(n, memoryview(buf)[:n])  # n == 0: EOF
+        except OSError as e:
+            return self._answer(e.args[0], error=True)
+        finally:
+            mem.release(buf)
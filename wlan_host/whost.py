@@ -2,24 +2,29 @@
 # Copyright Kevin Köck 2021 Released under the MIT license
 # Created on 2021-02-06 
 
-__updated__ = "2021-02-10"
+__updated__ = "2026-10-19"
 __version__ = "0.3"
 
 import gc
 from micropython import const
 import uasyncio as asyncio
-from wlan_link_libs.frames import Frames
+from wlan_link_libs.frames import Frames, _RESP_TRUE, _RESP_FALSE, _START_DATA, _DATA_OP, \
+    _DATA_REPLY, _DATA_ERROR, _STATS_DATA
+from wlan_link_libs.gcpolicy import GCPolicy, GC_IDLE
+from .memory import MemoryManager
+from wlan_link_libs.scheduler import Scheduler
 from wlan_link_libs.uart import WUart
 import time
 from machine import Pin
-from wlan_link_libs.profiler import Profiler
 from .command_handler import wlanHandler
-import json
-import network
+import errno
 
-Profiler.active = False
+# json, network and the sockets (usocket, select, Ringbuf) are only imported when needed, so
+# the host listens as early as possible
+_t_import = time.ticks_ms()  # ms since boot when the host got imported
 
-_wlan_host = None
+_hosts = []  # one WlanHost per link
+_memory = None  # MemoryManager shared by all hosts
 
 _MAX_LEN_PAYLOAD = const(400)
 _MAX_LEN_PACKET = const(500)
@@ -27,33 +32,86 @@ _MAX_LEN_PACKET = const(500)
 _CMD_HOST_AVAILABLE = const(1)
 _CMD_HOST_STATUS = const(2)
 _CMD_HOST_START = const(3)
+_CMD_HOST_STATS = const(4)
+
+_LEN_STATS_BUF = const(403)  # global counters and 10 commands per stats packet
+
+
+async def _coro():
+    pass
+
+
+_c = _coro()
+_CORO = type(_c)  # handlers returning this are run as a task
+_c.close()
+del _c
 
 
 class WlanHost:
-    """A class that will control a micropython board to provide WLAN to other micropython boards"""
+    """A class that will control a micropython board to provide WLAN to other micropython boards.
+    Create one WlanHost per WUart to serve several clients. Every host has its own sockets
+    and listen task, the memory (socket admission and buffer pool) is shared unless a
+    MemoryManager is given."""
 
-    def __init__(self, commlink: WUart, ready_pin: Pin, debug: int = 0):
-        self._frames = Frames(commlink, _MAX_LEN_PAYLOAD, _MAX_LEN_PACKET, debug=debug)
+    def __init__(self, commlink: WUart, ready_pin: Pin, debug: int = 0,
+                 gc_policy: GCPolicy = None, memory: MemoryManager = None):
+        self._frames = Frames(commlink, _MAX_LEN_PAYLOAD, _MAX_LEN_PACKET, debug=debug,
+                              schemas=wlanHandler.schemas)
         self._comm = commlink
         self._debug = debug
         self._pready = ready_pin
         ready_pin.init(mode=Pin.OUT, value=0)
-        global _wlan_host
-        _wlan_host = self
+        _hosts.append(self)
         self._started = False  # TODO: don't execute other functions if not started?
+        self.gc_policy = gc_policy or GCPolicy()
+        global _memory
+        if memory is None:
+            if _memory is None:
+                _memory = MemoryManager()
+            memory = _memory
+        self.memory = memory
+        memory.hosts += 1
+        self.sockets = None  # created by listen once the client got signalled
+        self.scheduler = Scheduler()  # frames sent without a request, e.g. streams
+        self._statsbuf = None
+        self._t_init = time.ticks_ms()
+        self._t_ready = None  # ms since boot when listen was ready
+        self.deferred_errors = 0  # errors of commands without reply
+        self.last_deferred = None  # (cmd, errno)
         self._listen_task = asyncio.create_task(self.listen())
+        self._gc_task = asyncio.create_task(self._idle_gc())
         # notify client on restart by signalling data available.
 
     async def listen(self):
         gc.collect()
         self._comm.get_ready()  # flushing uart
-        if self._debug >= 3:
-            print("ready to listen")
-        gc.collect()
+        self._t_ready = time.ticks_ms()
+        self._pready(1)  # client waits for this edge instead of pinging
+        if self.sockets is None:
+            from .socket import Sockets  # registers the socket commands
+            self.sockets = Sockets(self)
+        if self._debug >= 1:
+            print("ready to listen, {} ms after import, {} ms after init".format(
+                time.ticks_diff(self._t_ready, _t_import),
+                time.ticks_diff(self._t_ready, self._t_init)))
+        gcp = self.gc_policy
+        sched = self.scheduler
+        comm = self._comm
         while True:
-            print("start while")
+            if sched.pending() and not comm.any():
+                # received frames are always served first, scheduled frames in between
+                await asyncio.sleep_ms(0 if sched.step() else 1)
+                continue
+            start = await self._frames.await_start()
+            gcp.frame_start()
+            if start == _START_DATA:
+                await self._data_frame()
+                self.memory.release_leases()
+                gcp.frame_end()
+                continue
             try:
-                cmd, response_code, params = await self._frames.await_and_read_message()
+                # other tasks keep running while the frame is received
+                cmd, response_code, params = await self._frames.aread_message()
             except OSError:
                 if self._debug >= 1:
                     print("Error reading frame")
@@ -68,28 +126,23 @@ class WlanHost:
             stu = time.ticks_us()
             try:
                 resp = wlanHandler.get(cmd)(self, *params)
-                if resp is None:
-                    raise TypeError("No registered function is allowed to return None")
-                elif type(resp) not in (list, tuple):
-                    resp = (resp,)
-                if resp[0] is True:
-                    self._frames.send_true(cmd, resp[1:] if len(resp) > 1 else None)
-                elif resp[0] is False:
-                    self._frames.send_false(cmd, resp[1:] if len(resp) > 1 else None)
-                elif resp[0] == OSError:
-                    self._frames.send_oserror(cmd, resp[1])
-                elif type(resp[0]) == OSError:
-                    self._frames.send_oserror(cmd, resp[0].args[0])
-                elif isinstance(resp[0], Exception):
-                    self._frames.send_exception(cmd, resp[0])
-                else:
-                    print("Unknown format", resp[0], resp)
+                if type(resp) is _CORO:  # answered and measured by the task
+                    self._run_task(cmd, resp, self._frames.no_reply)
+                    gcp.frame_end()
+                    continue
+                self._answer(cmd, resp, self._frames.no_reply)
             except Exception as e:
                 if self._debug >= 1:
                     import sys
                     sys.print_exception(e)
+                if self._frames.no_reply:  # raised by the handler
+                    self._deferred_error(cmd, e)
+                self.memory.release_leases()
+                gcp.frame_end()
                 continue
+            self.memory.release_leases()
             etu = time.ticks_us()
+            self._frames.stats.latency(cmd, time.ticks_diff(etu, stu))
             if self._debug >= 1:
                 print("Time to answer sent", time.ticks_diff(etu, stu))
                 print("Whost got packet", cmd, response_code, params)
@@ -101,7 +154,122 @@ class WlanHost:
                             print(param)
                 except:
                     pass
-            gc.collect()
+            gcp.frame_end()
+
+    async def _data_frame(self):
+        """Fast path for data plane frames, no generic dispatch and param decoding"""
+        frames = self._frames
+        try:
+            op, socknum, length, payload = await frames.aread_data()
+        except OSError:
+            if self._debug >= 1:
+                print("Error reading data frame")
+            return
+        stu = time.ticks_us()
+        handler = wlanHandler.get_data(op & _DATA_OP)
+        try:
+            if handler is None:
+                raise OSError(errno.EINVAL)
+            r = handler(self, op, socknum, length, payload)
+        except Exception as e:
+            if self._debug >= 1:
+                import sys
+                sys.print_exception(e)
+            r = e
+        op = (op & _DATA_OP) | _DATA_REPLY
+        if r is None:  # handler answered itself or no answer needed
+            pass
+        elif isinstance(r, OSError):
+            frames.send_data(op | _DATA_ERROR, socknum, r.args[0])
+        elif isinstance(r, Exception):
+            frames.send_data(op | _DATA_ERROR, socknum, errno.EIO)
+        elif type(r) == int:
+            frames.send_data(op, socknum, r)
+        else:
+            frames.send_data(op, socknum, len(r), r)
+        frames.stats.latency(_STATS_DATA, time.ticks_diff(time.ticks_us(), stu))
+
+    def _answer(self, cmd, resp, no_reply):
+        if no_reply:
+            self._deferred_error(cmd, resp)
+        else:
+            self._send_response(cmd, resp)
+
+    def _run_task(self, cmd, coro, no_reply):
+        if wlanHandler.acquire(cmd):
+            asyncio.create_task(self._task(cmd, coro, no_reply, time.ticks_us()))
+            return
+        coro.close()
+        if self._debug >= 1:
+            print("Too many running commands", cmd)
+        self._answer(cmd, OSError(errno.EAGAIN), no_reply)
+
+    async def _task(self, cmd, coro, no_reply, stu):
+        """Answer cmd with the result of the coroutine of its handler"""
+        try:
+            resp = await coro
+        except Exception as e:
+            if self._debug >= 1:
+                import sys
+                sys.print_exception(e)
+            resp = e
+        finally:
+            wlanHandler.release(cmd)
+        try:
+            self._answer(cmd, resp, no_reply)
+        except Exception as e:  # e.g. client gone
+            if self._debug >= 1:
+                print("Answer of command", cmd, "failed", e)
+        self.memory.release_leases()
+        self._frames.stats.latency(cmd, time.ticks_diff(time.ticks_us(), stu))
+
+    def _deferred_error(self, cmd, resp):
+        """A command without reply can't report its error, it is only counted for status.
+        Errors of sends without answer to an existing socket are returned by the next answer
+        for the socket instead, see socket.send_all."""
+        first = resp[0] if type(resp) in (list, tuple) else resp
+        if first == OSError:
+            err = resp[1]
+        elif isinstance(first, OSError):
+            err = first.args[0]
+        elif isinstance(first, Exception):
+            err = errno.EIO
+        else:  # no error
+            return
+        self.deferred_errors += 1
+        self.last_deferred = (cmd, err)
+        if self._debug >= 1:
+            print("Error of command without reply", cmd, self.last_deferred[1])
+
+    def _send_response(self, cmd, resp):
+        """Send the return value of a handler. Values after resp[0] are sent without slicing
+        the response so no new tuple gets allocated."""
+        if resp is None:
+            raise TypeError("No registered function is allowed to return None")
+        if type(resp) in (list, tuple):
+            first = resp[0]
+        else:
+            first = resp
+            resp = ()
+        if first is True:
+            self._frames.send_response(cmd, _RESP_TRUE, resp, 1)
+        elif first is False:
+            self._frames.send_response(cmd, _RESP_FALSE, resp, 1)
+        elif first == OSError:
+            self._frames.send_oserror(cmd, resp[1])
+        elif isinstance(first, OSError):
+            self._frames.send_oserror(cmd, first.args[0])
+        elif isinstance(first, Exception):
+            self._frames.send_exception(cmd, first)
+        else:
+            print("Unknown format", first, resp)
+
+    async def _idle_gc(self):
+        """Collects garbage while the link is idle instead of after every frame"""
+        gcp = self.gc_policy
+        while True:
+            await asyncio.sleep_ms(gcp.idle_ms if gcp.mode == GC_IDLE else 100)
+            gcp.idle()
 
     @wlanHandler.register(_CMD_HOST_AVAILABLE)
     def available(self, wl, *args):
@@ -111,19 +279,44 @@ class WlanHost:
     @wlanHandler.register(_CMD_HOST_STATUS)
     def status(self, *args):
         """Return statistics about host, #sockets, mem_free, wifi status etc"""
+        import json
+        import network
         st = dict()
-        st["num_sockets"] = 0  # TODO: when sockets implemented
+        st["num_sockets"] = self.sockets.active_sockets
+        st["links"] = len(_hosts)
         st["mem_free"] = gc.mem_free()
+        st["pool"] = self.memory.status()
         st["wlan_connected"] = network.WLAN(network.STA_IF).isconnected()
+        # ms since boot
+        st["deferred_errors"] = self.deferred_errors
+        st["last_deferred"] = self.last_deferred
+        st["startup"] = {"import": _t_import, "init": self._t_init, "ready": self._t_ready}
         return True, json.dumps(st).encode()
 
+    @wlanHandler.register(_CMD_HOST_STATS)
+    def stats(self, start_cmd=0, *args):
+        """Return link counters and latency histograms in a compact binary format.
+        Returns the commands starting at start_cmd that fit into one packet."""
+        if self._statsbuf is None:
+            self._statsbuf = bytearray(_LEN_STATS_BUF)
+        l = self._frames.stats.pack_into(self._statsbuf, start_cmd, self._comm.resyncs,
+                                         gc.mem_free(), self.sockets.active_sockets,
+                                         self.sockets.bytes_in, self.sockets.bytes_out)
+        return True, memoryview(self._statsbuf)[:l]
+
     @wlanHandler.register(_CMD_HOST_START)
     def start(self, ftp_active: bool, max_sockets: int, socket_buf_len: int, max_payload_len: int,
               debug: int):
-        from .socket import Sockets
-        Sockets.max_sockets = max_sockets
-        Sockets.socket_rx_buffer = socket_buf_len  # TODO: does not impact Frames buffer length yet!
-        Sockets.max_payload_len = max_payload_len  # So don't make this bigger than the Frames buf
+        self.sockets.max_sockets = max_sockets
+        mem = self.memory
+        if socket_buf_len > mem.buffer_size:
+            mem.grow(socket_buf_len)  # buffers in use by other links are replaced later
+        elif mem.hosts == 1 and socket_buf_len < mem.buffer_size:
+            try:
+                mem.configure(buffer_size=socket_buf_len)
+            except OSError:  # EBUSY, keeps the bigger buffers until the next start
+                pass
+        self.sockets.max_payload_len = max_payload_len  # So don't make this bigger than the Frames buf
         self._debug = debug
         self._frames._debug = debug
         self._comm._debug = debug
@@ -134,4 +327,9 @@ class WlanHost:
 
 
 def get_host() -> WlanHost:
-    return _wlan_host
+    """Returns the most recently created host"""
+    return _hosts[-1] if _hosts else None
+
+
+def get_hosts() -> list:
+    return _hosts
@@ -0,0 +1,216 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# WiFi management of the host by the client. Scan results are cached so the client can
+# look up networks without waiting for a scan. Connecting runs in a task of the host,
+# the outcome and later connection losses are recorded as events the client polls.
+# The station interface is shared by all links, so the state is kept per module.
+
+from micropython import const
+import uasyncio as asyncio
+from .command_handler import wlanHandler
+from wlan_host.whost import WlanHost
+import network
+import struct
+import time
+import errno
+import sys
+
+_CMD_WIFI_SCAN = const(50)
+_CMD_WIFI_CONNECT = const(51)
+_CMD_WIFI_DISCONNECT = const(52)
+_CMD_WIFI_STATUS = const(53)
+_CMD_WIFI_EVENTS = const(54)
+
+WIFI_CONNECTED = const(1)
+WIFI_CONNECT_FAILED = const(2)  # arg: status of the WLAN interface or ETIMEDOUT
+WIFI_DISCONNECTED = const(3)  # connection lost, arg: 1 if requested by the client
+WIFI_SCAN_DONE = const(4)  # arg: number of networks found
+
+_LEN_RESULTS = const(380)  # fits into an answer frame together with the other params
+_MAX_EVENTS = const(8)
+_CHECK_INTERVAL = const(100)  # ms between checks of the connection state
+
+_wlan = None
+_results = None  # packed results of the last scan
+_scanned = 0  # ticks_ms of the last scan
+_scanning = False
+_connect_task = None
+_events = []  # (seq, event, arg), oldest get dropped
+_seq = 0
+_monitor = None
+_was_connected = False  # state at the last check of _watch
+
+
+def _sta():
+    global _wlan, _monitor
+    if _wlan is None:
+        _wlan = network.WLAN(network.STA_IF)
+        _wlan.active(True)
+    if _monitor is None:
+        _monitor = asyncio.create_task(_watch())
+    return _wlan
+
+
+def _event(event, arg=0):
+    global _seq
+    _seq = _seq + 1 if _seq < 0x7FFFFFFF else 1
+    if len(_events) >= _MAX_EVENTS:
+        _events.pop(0)
+    _events.append((_seq, event, arg))
+
+
+async def _watch():
+    """Records connection losses, e.g. for roaming decisions of the client"""
+    global _was_connected
+    _was_connected = _wlan.isconnected()
+    while True:
+        await asyncio.sleep_ms(_CHECK_INTERVAL * 10)
+        con = _wlan.isconnected()
+        if _was_connected and not con and _connect_task is None:
+            _event(WIFI_DISCONNECTED, 0)
+        _was_connected = con
+
+
+def _pack_results(nets):
+    """Pack the strongest networks that fit: ssid length (1 byte), ssid, bssid (6 bytes),
+    channel, rssi, authmode, hidden (1 byte each)"""
+    buf = bytearray(_LEN_RESULTS)
+    p = 0
+    for ssid, bssid, channel, rssi, authmode, hidden in sorted(nets, key=lambda n: -n[3]):
+        l = 11 + len(ssid)
+        if p + l > _LEN_RESULTS:
+            break
+        buf[p] = len(ssid)
+        buf[p + 1:p + 1 + len(ssid)] = ssid
+        p += 1 + len(ssid)
+        buf[p:p + 6] = bssid
+        struct.pack_into("<BbBB", buf, p + 6, channel, rssi, authmode, int(hidden))
+        p += 10
+    return memoryview(buf)[:p]
+
+
+async def _scan(wl):
+    global _results, _scanned, _scanning
+    await asyncio.sleep_ms(0)  # answer of the command gets sent first
+    try:
+        nets = _sta().scan()  # blocks the host for the duration of the scan
+        _results = _pack_results(nets)
+        _scanned = time.ticks_ms()
+        _event(WIFI_SCAN_DONE, len(nets))
+    except OSError as e:
+        _event(WIFI_SCAN_DONE, 0)
+        if wl._debug >= 1:
+            print("WiFi scan failed", e)
+    finally:
+        _scanning = False
+
+
+@wlanHandler.register(_CMD_WIFI_SCAN, (int,), (bool, int, int, bytes))
+def scan(wl: WlanHost, max_age: int):
+    """
+    Returns whether the results are fresh (not older than max_age ms), their age in ms,
+    the seq of the last event and the cached results. Results that are too old start a new scan in the background,
+    WIFI_SCAN_DONE is recorded when it is finished. The host doesn't answer during the scan.
+    """
+    global _scanning
+    age = time.ticks_diff(time.ticks_ms(), _scanned) if _results is not None else -1
+    fresh = 0 <= age <= max_age
+    if not fresh and not _scanning:
+        _scanning = True
+        asyncio.create_task(_scan(wl))
+    return True, fresh, age, _seq, _results if _results is not None else b""
+
+
+async def _associate(sta, ssid, key, bssid, timeout):
+    if sta.isconnected():
+        sta.disconnect()
+    if bssid:
+        sta.connect(ssid, key, bssid=bssid)
+    else:
+        sta.connect(ssid, key)
+    st = time.ticks_ms()
+    while not sta.isconnected():
+        s = sta.status()
+        if s not in (network.STAT_IDLE, network.STAT_CONNECTING):
+            return WIFI_CONNECT_FAILED, s
+        if time.ticks_diff(time.ticks_ms(), st) > timeout:
+            sta.disconnect()
+            return WIFI_CONNECT_FAILED, errno.ETIMEDOUT
+        await asyncio.sleep_ms(_CHECK_INTERVAL)
+    return WIFI_CONNECTED, 0
+
+
+async def _connect(wl, ssid, key, bssid, timeout):
+    global _connect_task, _was_connected
+    st = time.ticks_ms()
+    try:
+        event, arg = await _associate(_sta(), ssid, key, bssid, timeout)
+    except Exception as e:
+        if wl._debug >= 1:
+            sys.print_exception(e)
+        event, arg = WIFI_CONNECT_FAILED, e.args[0] if e.args and type(e.args[0]) == int else 0
+    _connect_task = None  # not reached if cancelled, then a new connect owns it
+    if event == WIFI_CONNECTED:
+        _was_connected = True
+    _event(event, arg)
+    if wl._debug >= 1:
+        print("WiFi connect", event, arg, "after", time.ticks_diff(time.ticks_ms(), st), "ms")
+
+
+@wlanHandler.register(_CMD_WIFI_CONNECT, (bytes, bytes, bytes, int), (int,))
+def connect(wl: WlanHost, ssid, key, bssid, timeout: int):
+    """Start connecting to ssid (optionally the AP bssid), the outcome is recorded as
+    WIFI_CONNECTED or WIFI_CONNECT_FAILED. Returns the seq of the last event before."""
+    global _connect_task
+    if _connect_task is not None:
+        _connect_task.cancel()
+        _connect_task = None
+    _sta()
+    _connect_task = asyncio.create_task(
+        _connect(wl, bytes(ssid).decode(), bytes(key).decode() if len(key) else None,
+                 bytes(bssid) if len(bssid) else None, timeout))
+    return True, _seq
+
+
+@wlanHandler.register(_CMD_WIFI_DISCONNECT)
+def disconnect(wl: WlanHost, *args):
+    global _connect_task, _was_connected
+    if _connect_task is not None:
+        _connect_task.cancel()
+        _connect_task = None
+    sta = _sta()
+    if sta.isconnected():
+        sta.disconnect()
+        _was_connected = False
+        _event(WIFI_DISCONNECTED, 1)
+    return True
+
+
+@wlanHandler.register(_CMD_WIFI_STATUS, None, (bool, int, int, int, bytes))
+def status(wl: WlanHost, *args):
+    """Returns connected, status of the interface, rssi (0 if not connected), seq of the
+    last event and the ifconfig as comma separated string"""
+    sta = _sta()
+    con = sta.isconnected()
+    try:
+        rssi = sta.status("rssi") if con else 0
+    except (OSError, ValueError):
+        rssi = 0
+    return True, con, sta.status(), rssi, _seq, ",".join(sta.ifconfig()).encode()
+
+
+@wlanHandler.register(_CMD_WIFI_EVENTS, (int,), (bytes,))
+def events(wl: WlanHost, since: int):
+    """Returns the events after seq since, each packed as seq, event, arg ("<iBi")"""
+    buf = bytearray(9 * _MAX_EVENTS)
+    p = 0
+    for seq, event, arg in _events:
+        if seq > since:
+            struct.pack_into("<iBi", buf, p, seq, event, arg)
+            p += 9
+    return True, memoryview(buf)[:p]
@@ -0,0 +1,209 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Capture of the raw frames on the link with ticks_us timestamps, without debug prints that
+# change the timing. Records are kept in a ring (the oldest get overwritten) or written to a
+# file. Decode a capture with tools/capture_decode.py (CPython), feed it back into a
+# WlanHost with ReplayUart.
+#
+# File: b"WLCAP" + version (1 byte), followed by the records.
+# Record: [ticks_us (4 bytes), kind (1 byte), length (2 bytes)] + frame without start byte
+# kind: CAP_TX for sent frames, CAP_DATA for data plane frames, CAP_BAD for frames that
+# couldn't be read (broken or CRC wrong), CAP_TRUNC if the frame was longer than max_frame.
+
+from micropython import const
+import struct
+import time
+import io
+
+CAP_TX = const(1)
+CAP_DATA = const(2)
+CAP_BAD = const(4)
+CAP_TRUNC = const(8)
+
+_MAGIC = b"WLCAP\x01"
+_LEN_RECORD_HEADER = const(7)
+_START_CMD = const(0xE0)
+_START_DATA = const(0xD0)
+
+
+class Capture:
+    def __init__(self, size=8192, f=None, max_frame=1031):
+        """
+        size: size of the ring buffer, unused if f is given.
+        f: file opened in binary write mode, every record is written to it.
+        max_frame: frames longer than this are truncated (e.g. large stream frames).
+        """
+        self._rec = bytearray(_LEN_RECORD_HEADER + max_frame)
+        self._p = 0  # length of the record being built
+        self._kind = 0
+        self._f = f
+        if f is not None:
+            f.write(_MAGIC)
+            self._buf = None
+        else:
+            self._buf = bytearray(size)
+        self._r = 0  # oldest record
+        self._w = 0  # next record
+        self._end = size  # end of the records before the writer wrapped around
+        self.count = 0  # records in the ring
+        self.dropped = 0  # records overwritten in the ring
+
+    def begin(self, kind):
+        self._kind = kind
+        self._p = _LEN_RECORD_HEADER
+        struct.pack_into("<I", self._rec, 0, time.ticks_us())
+
+    def add(self, data):
+        p = self._p
+        n = min(len(data), len(self._rec) - p)
+        if n < len(data):
+            self._kind |= CAP_TRUNC
+        self._rec[p:p + n] = data[:n]
+        self._p = p + n
+
+    def commit(self):
+        rec = self._rec
+        n = self._p
+        rec[4] = self._kind
+        struct.pack_into("<H", rec, 5, n - _LEN_RECORD_HEADER)
+        if self._f is not None:
+            self._f.write(memoryview(rec)[:n])
+            return
+        buf = self._buf
+        if n > len(buf):
+            return
+        if self._w + n > len(buf):  # wrap around, the records never wrap
+            while self.count and self._r >= self._w:  # oldest lap gets overwritten
+                self._evict()
+            self._end = self._w
+            self._w = 0
+        while self.count and self._r >= self._w and self._w + n > self._r:
+            self._evict()
+        buf[self._w:self._w + n] = memoryview(rec)[:n]
+        self._w += n
+        self.count += 1
+
+    def _evict(self):
+        self._r += _LEN_RECORD_HEADER + struct.unpack_from("<H", self._buf, self._r + 5)[0]
+        self.count -= 1
+        self.dropped += 1
+        if self._r >= self._end:
+            self._r = 0
+            self._end = len(self._buf)
+        if not self.count:
+            self._r = self._w
+
+    def frame(self, kind, buf, length):
+        """Record a received frame that is completely in buf"""
+        self.begin(kind)
+        self.add(buf[:length])
+        self.commit()
+
+    def dump(self, f):
+        """Write the records of the ring to file f in the capture file format"""
+        f.write(_MAGIC)
+        buf = memoryview(self._buf)
+        r = self._r
+        end = self._end
+        for _ in range(self.count):
+            n = _LEN_RECORD_HEADER + struct.unpack_from("<H", buf, r + 5)[0]
+            f.write(buf[r:r + n])
+            r += n
+            if r >= end:
+                r = 0
+                end = len(buf)
+
+    def clear(self):
+        self._r = self._w = self.count = 0
+        self._end = len(self._rec) if self._buf is None else len(self._buf)
+
+
+def read_records(f):
+    """Generator of (ticks_us, kind, frame) of a capture file"""
+    if f.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError("Not a capture file")
+    while True:
+        h = f.read(_LEN_RECORD_HEADER)
+        if len(h) < _LEN_RECORD_HEADER:
+            return
+        t, kind, n = struct.unpack("<IBH", h)
+        yield t, kind, f.read(n)
+
+
+class ReplayUart(io.IOBase):
+    """
+    UART replaying the received frames of a capture, e.g. to feed a WlanHost:
+    WlanHost(WUart(ReplayUart(records)), pin). Frames are released with the timing of the
+    capture divided by speed, speed=0 releases them as fast as possible.
+    Nothing is received before start() got called. Sent bytes are only counted.
+    """
+
+    def __init__(self, records, speed=1.0):
+        self._frames = [(t, kind, frame) for t, kind, frame in records if
+                        not kind & (CAP_TX | CAP_BAD | CAP_TRUNC)]
+        self._speed = speed
+        self._i = 0
+        self._cur = b""
+        self._p = 0
+        self._start = None
+        self._started = False
+        self.frames_in = 0
+        self.bytes_out = 0
+        self.frames_out = 0  # start bytes written
+
+    def start(self):
+        self._started = True
+
+    def _fill(self):
+        if not self._started or self._p < len(self._cur) or self._i >= len(self._frames):
+            return
+        t, kind, frame = self._frames[self._i]
+        now = time.ticks_us()
+        if self._start is None:
+            self._start = (now, t)
+        if self._speed and time.ticks_diff(now, self._start[0]) < time.ticks_diff(
+                t, self._start[1]) / self._speed:
+            return  # not yet
+        self._cur = bytes((_START_DATA if kind & CAP_DATA else _START_CMD,)) + frame
+        self._p = 0
+        self._i += 1
+        self.frames_in += 1
+
+    def done(self) -> bool:
+        return self._i >= len(self._frames) and self._p >= len(self._cur)
+
+    def any(self) -> int:
+        self._fill()
+        return len(self._cur) - self._p
+
+    def read(self, n=-1):
+        if not self.any():
+            return None
+        if n < 0:
+            n = len(self._cur) - self._p
+        d = self._cur[self._p:self._p + n]
+        self._p += len(d)
+        return d
+
+    def readinto(self, buf, n=None):
+        d = self.read(len(buf) if n is None else n)
+        if d is None:
+            return None
+        buf[:len(d)] = d
+        return len(d)
+
+    def write(self, buf):
+        if len(buf) == 1 and buf[0] in (_START_CMD, _START_DATA):
+            self.frames_out += 1
+        self.bytes_out += len(buf)
+        return len(buf)
+
+    def ioctl(self, req, arg):
+        if req == 3:  # MP_STREAM_POLL, lets uasyncio wait for received data
+            return arg & 1 if self.any() else 0
+        return 0
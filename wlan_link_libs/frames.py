@@ -2,39 +2,64 @@
 # Copyright Kevin Köck 2021 Released under the MIT license
 # Created on 2021-02-07 
 
-__updated__ = "2021-02-10"
+__updated__ = "2026-10-19"
 __version__ = "0.3"
 
 from micropython import const
 # from wlan_link_libs.crc import crc16
 import errno
 import time
-from wlan_link_libs.uart import WUart
-from .profiler import Profiler
+from wlan_link_libs.uart import WUart, CommError
+from .stats import LinkStats
+from .schema import Schema
+from .header import pack_header, pack_response, unpack_header, pack_param_header, \
+    unpack_param_header
 import struct
+import array
 import micropython
 
 
 # https://forum.micropython.org/viewtopic.php?p=54899#p54899
 
-# @Profiler.measure
 @micropython.native
-def hash(header, params=()):
-    result = 0xceed
+def hash_update(result, buf):
+    for c in buf:
+        result = (result * 73 ^ c) & 0xffff
+    return result
+
 
-    for msg in ([header], params):
-        for arg in msg:
-            for c in arg:
-                result = (result * 73 ^ c) & 0xffff
+@micropython.native
+def adler32(buf, value=1):
+    """Checksum of whole transfers spanning many frames, value is the result of the previous
+    chunk"""
+    a = value & 0xFFFF
+    b = value >> 16
+    for c in buf:
+        a = (a + c) % 65521
+        b = (b + a) % 65521
+    return (b << 16) | a
+
+
+# @Profiler.measure
+def hash(header, params=()):
+    result = hash_update(0xceed, header)
+    for arg in params:
+        result = hash_update(result, arg)
     return result
 
 
 _EXCEPTIONS = (ValueError, TypeError, AttributeError, NotImplementedError, Exception)
+_NO_PAYLOAD = (None,)
 
 _LEN_HEADER = 7
+_MAX_PARAMS = const(15)
 _START_CMD = const(0xE0)
+_START_DATA = const(0xD0)
+_STARTS = bytes((_START_CMD, _START_DATA))
 # _END_CMD = const(0xEE) # no need for _END_CMD
 _REPLY_FLAG = const(1 << 7)
+_FLAG_SCHEMA = const(1 << 6)  # in header byte 1, params encoded with a registered Schema
+_FLAG_NO_REPLY = const(1 << 7)  # in header byte 1, command is not answered
 
 # RESPONSE FLAGS (3 bits) # Every answer needs a response flag. Commands don't have one.
 _RESP_TRUE = const(1)
@@ -48,50 +73,97 @@ _RESP_EXCEPTION = const(3)
 # header structure: [CMD,#Params|len_packet->2bytes,RESP_CODE,PAYLOAD,CRC (2Byte)] -> 7 byte
 # Param header structure: [len_param_0(7bit + 3bit data type), len_param_1, ...] -> #Params bytes
 # Param frame: [param1,param2,...] -> sum(params header)
+# If _FLAG_SCHEMA is set, #Params is 0 and the params are encoded with the Schema registered
+# for CMD (or CMD|_REPLY_FLAG for answers) without a param header.
+
+# Data plane packet structure for socket send/recv, bypasses the generic command dispatch:
+# START_DATA
+# header structure: [OP|flags, SOCKNUM (2Byte), LEN (2Byte), CRC (2Byte)] -> 7 byte
+# followed by LEN bytes of raw payload if _DATA_PAYLOAD is set.
+# Without payload LEN is e.g. the bufsize of a recv, the amount of bytes sent or an errno.
+_DATA_SEND = const(1)
+_DATA_RECV = const(2)
+_DATA_STREAM = const(3)  # stream a socket to the client, answered by many frames
+_DATA_CREDIT = const(4)  # client processed a window of stream frames
+_DATA_STREAM_END = const(5)  # end of stream, payload is total length and adler32 of the data
+_DATA_SEND_NR = const(6)  # send without answer, an error is returned by the next answer
+_DATA_OP = const(0x0F)
+_DATA_BLOCK = const(1 << 4)  # recv blocking on host
+_DATA_PAYLOAD = const(1 << 5)
+_DATA_ERROR = const(1 << 6)  # answer, LEN is an errno
+_DATA_REPLY = const(1 << 7)
+_STATS_DATA = const(0)  # data frames are counted as command 0 in LinkStats
+
+# record kinds of wlan_link_libs.capture, not imported so it is only loaded when capturing
+_CAP_TX = const(1)
+_CAP_DATA = const(2)
+_CAP_BAD = const(4)
 
 class Frames:
-    def __init__(self, commlink: WUart, len_send_buf, len_read_buf, debug=0):
+    def __init__(self, commlink: WUart, len_send_buf, len_read_buf, debug=0, schemas=None):
         self._sendbuf = bytearray(len_send_buf)
         self._readbuf = bytearray(len_read_buf)
+        self._sendmv = memoryview(self._sendbuf)
+        self._readmv = memoryview(self._readbuf)
+        # outgoing params and their types, reused for every frame to not allocate new lists
+        self._params = [None] * _MAX_PARAMS
+        self._types = bytearray(_MAX_PARAMS)
+        # lengths and types of the received params, see _transform_from_payload
+        self._rlengths = array.array("H", bytes(2 * _MAX_PARAMS))
+        self._rtypes = bytearray(_MAX_PARAMS)
+        self._len_head = _LEN_HEADER  # length of the outgoing packet part in _sendbuf
+        # cmd (or cmd|_REPLY_FLAG for answers) -> Schema, can be shared with a CommandHandler
+        self._schemas = {} if schemas is None else schemas
         self._comm = commlink
         self._debug = debug
+        self.stats = LinkStats()
+        # Called with (op, socknum, length, payload) for data frames received while waiting
+        # for another frame, returns True if it consumed the frame (e.g. stream frames).
+        self.data_handler = None
+        self.data_buf = None  # buffer for those data frames if bigger than the read buffer
+        self.capture = None  # Capture of all frames
+        self.no_reply = False  # last received command must not be answered
 
     # @Profiler.measure
     def _read_header(self):
-        buf = memoryview(self._readbuf)
-        cmd = buf[0]
-        num_params = (buf[1] & 0x3C) >> 2  # 4bit -> 15 params
-        len_packet = (buf[1] & 0x03) << 8 | buf[2]  # 10 bit -> 1023
-        # --> buf[1] bit 0&1 free
-        response_code = buf[3] >> 4  # 4 bit --> 15
-        crc = buf[5] << 8 | buf[6]  # crc16
-        payload = buf[4]
-        return cmd, num_params, len_packet, response_code, payload, crc
+        """Returns cmd, num_params (4 bit), len_packet (10 bit), response_code (4 bit), payload
+        and crc16"""
+        return unpack_header(self._readmv)
 
     # @Profiler.measure
     def _check_frame(self):
         _, _, len_packet, _, _, crc = self._read_header()
-        buf = memoryview(self._readbuf)
+        buf = self._readmv
         buf[5] = 0  # reset crc16 in buffer
         buf[6] = 0
         crc_new = hash(buf[:len_packet])
         buf[5] = crc >> 8  # save old crc16 again
         buf[6] = crc & 0xFF
         if crc_new != crc:
+            self.stats.crc_errors += 1
             if self._debug >= 1:
                 print("CRC wrong, expected", crc, "got", crc_new)
             raise ValueError("CRC wrong, expected {!s} got {!s}".format(crc, crc_new))
 
+    def register_schema(self, cmd, signature: tuple, reply: tuple = None):
+        """Register a fixed signature for the params of cmd and optionally of its answer"""
+        self._schemas[cmd] = Schema(signature)
+        if reply is not None:
+            self._schemas[cmd | _REPLY_FLAG] = Schema(reply)
+
     # @Profiler.measure
-    def _set_crc(self, num_params, params):
+    def _set_crc(self, num_params):
         """
-        Calculate crc of given args (e.g. multiple memoryviews for sending).
-        Sets the crc in _sendbuf and returns it.
+        Calculate crc of the packet part in _sendbuf and the first num_params entries of
+        self._params. Sets the crc in _sendbuf.
         """
-        buf = memoryview(self._sendbuf)
+        buf = self._sendmv
+        params = self._params
         buf[5] = 0
         buf[6] = 0
-        crc = hash(buf[:_LEN_HEADER + num_params * 2], params)
+        crc = hash_update(0xceed, buf[:self._len_head])
+        for i in range(num_params):
+            crc = hash_update(crc, params[i])
         buf[5] = crc >> 8
         buf[6] = crc & 0xFF
 
@@ -103,69 +175,59 @@ class Frames:
 
     # @Profiler.measure
     def _create_header(self, cmd, num_params, len_packet, response_code=None, payload=None,
-                       is_answer=False):
+                       is_answer=False, flags=0):
         if response_code is None:
             response_code = 0x00
         if payload is None:
             payload = 0x00
         if self._debug >= 3:
             print("header", cmd, num_params, response_code, payload, is_answer)
-        self.check_param(cmd, 255)
-        self.check_param(num_params, 15)
-        self.check_param(len_packet, 1023)
-        self.check_param(response_code, 15)
-        self.check_param(payload, 255)
-        buf = memoryview(self._sendbuf)
         if is_answer:
-            buf[0] = cmd | _REPLY_FLAG  # reply to cmd
-        else:
-            buf[0] = cmd
-        buf[1] = ((num_params << 2) & 0x3C) | ((len_packet >> 8) & 0x03)
-        buf[2] = len_packet & 0xFF
-        buf[3] = buf[3] & ((response_code << 4) | 0x0F)
-        buf[4] = payload
-
-    def _create_param_header(self, params: list, types: list) -> int:
+            cmd |= _REPLY_FLAG  # reply to cmd
+        buf = self._sendmv
+        err = pack_header(buf, cmd | flags << 8, num_params, len_packet) or \
+              pack_response(buf, response_code, payload)
+        if err:
+            raise ValueError("param can't be >{!s}".format(err))
+
+    def _create_param_header(self, params: list, types, num_params: int) -> int:
         """Create a param header if more than 1 params in frame, otherwise it is not needed"""
-        if len(params) == 0:
-            return 0
-        sendbuf = memoryview(self._sendbuf)
-        for i, param in enumerate(params):
-            sendbuf[_LEN_HEADER + i * 2] = (types[i] << 2) & 0x1C | (
-                    (len(param) >> 8) & 0x03)
-            # 2 bit for length, 3 bit for data type, 3 bit empty
-            sendbuf[_LEN_HEADER + i * 2 + 1] = len(param) & 0xFF
-        return len(params) * 2
+        # 2 bit for length, 3 bit for data type, 3 bit empty
+        return pack_param_header(self._sendmv, params, types, num_params)
 
     def _transform_from_payload(self, head: memoryview, p: memoryview):
+        lengths = self._rlengths
+        types = self._rtypes
         cnt = 0
         params = []
-        for i in range(0, len(head), 2):
-            # 2 byte in param_header for type and param length
-            l = ((head[i] & 0x03) << 8) | (head[i + 1] & 0xFF)
-            t = (head[i] & 0x1C) >> 2
-            param = p[cnt:cnt + l]
-            cnt += l
+        # 2 byte in param_header for type and param length
+        for i in range(unpack_param_header(head, lengths, types)):
+            l = lengths[i]
+            t = types[i]
             try:
-                params.append(self._transform_from_bytearray(param, t))
+                if t == 0:  # data stays in the read buffer, e.g. for socket.recv_into
+                    params.append(p[cnt:cnt + l])
+                else:  # decoded in place, no slice of the payload
+                    params.append(self._transform_from_bytearray(p, t, cnt))
             except Exception as e:
                 if self._debug > 0:
                     print("Error transforming param from bytearray:", e)
-                params.append(param)  # just leaving it as bytearray
+                params.append(p[cnt:cnt + l])  # just leaving it as bytearray
+            cnt += l
         return params
 
     @staticmethod
-    def _transform_from_bytearray(param, t):
+    def _transform_from_bytearray(param, t, offset=0):
         if t == 0:  # bytearray, might become a string or other usage. Application has to decide
             return param
         elif t == 1:  # int, stored as hex in bytearray
-            return struct.unpack("i", param)[0]
+            return struct.unpack_from("i", param, offset)[0]
         elif t == 2:  # float
-            return struct.unpack("f", param)[1]
+            return struct.unpack_from("f", param, offset)[0]
         elif t == 3:  # None
             return None
         elif t == 4:  # bool
-            return True if param[0] == 0x01 else False
+            return True if param[offset] == 0x01 else False
         else:
             raise TypeError("Unknown type number {}".format(t))
 
@@ -189,16 +251,41 @@ class Frames:
     # @Profiler.measure
     def _read_packet(self):
         # TODO: handle timeouts from uart
-        readbuf = memoryview(self._readbuf)
+        readbuf = self._readmv
         self._comm.read_frame(readbuf, _LEN_HEADER)
         # will time out after 10ms which indicates an error
-        cmd, num_params, len_packet, response_code, payload, crc = self._read_header()
-        if self._debug >= 3:
-            print("Got header:", cmd, num_params, len_packet, response_code, payload, crc)
-        if num_params > 0:
+        len_packet = self._len_packet()
+        if len_packet > _LEN_HEADER:
             self._comm.read_frame(readbuf[_LEN_HEADER:], len_packet - _LEN_HEADER)
+        return self._decode_packet()
+
+    async def _aread_packet(self):
+        """Like _read_packet but other tasks keep running while the frame is received"""
+        readbuf = self._readmv
+        await self._comm.aread_frame(readbuf, _LEN_HEADER)
+        len_packet = self._len_packet()
+        if len_packet > _LEN_HEADER:
+            await self._comm.aread_frame(readbuf[_LEN_HEADER:], len_packet - _LEN_HEADER)
+        return self._decode_packet()
+
+    def _len_packet(self) -> int:
+        """Length of the frame whose header is in the read buffer"""
+        buf = self._readmv
+        if self._debug >= 3:
+            print("Got header:", *self._read_header())
+        return (buf[1] & 0x03) << 8 | buf[2]
+
+    def _decode_packet(self):
+        """Check and decode the frame in the read buffer"""
+        readbuf = self._readmv
+        cmd, num_params, len_packet, response_code, payload, crc = self._read_header()
         self._check_frame()
-        if num_params == 0:
+        if readbuf[1] & _FLAG_SCHEMA:
+            schema = self._schemas.get(cmd)
+            if schema is None:
+                raise ValueError("No schema registered for command {}".format(cmd))
+            payload = schema.decode(readbuf, _LEN_HEADER, len_packet)
+        elif num_params == 0:
             payload = [payload]  # response_code in header. might be 0x00 = None
         else:
             param_header = readbuf[_LEN_HEADER:_LEN_HEADER + num_params * 2]
@@ -218,14 +305,45 @@ class Frames:
 
     async def await_and_read_message(self):
         await self._comm.await_byte(_START_CMD)
+        return await self.aread_message()
+
+    async def await_start(self) -> int:
+        """Wait until the start of a new command or data frame got received, returns the
+        start byte"""
+        return await self._comm.await_any(_STARTS)
+
+    def read_message(self):
+        """Read a frame after its start byte got received"""
         try:
-            cmd, num_params, len_packet, response_code, payload = self._read_packet()
+            r = self._read_packet()
         except Exception as e:
-            if self._debug >= 1:
-                print("Frame broken, discarding. Connection good?", e)
-                import sys
-                sys.print_exception(e)
-            raise OSError(errno.ETIMEDOUT)
+            self._broken(e)
+        return self._received(*r)
+
+    async def aread_message(self):
+        """Like read_message but other tasks keep running while the frame is received"""
+        try:
+            r = await self._aread_packet()
+        except Exception as e:
+            self._broken(e)
+        return self._received(*r)
+
+    def _broken(self, e):
+        self.stats.broken += 1
+        if self.capture is not None:
+            buf = self._readmv
+            self.capture.frame(_CAP_BAD, buf, min((buf[1] & 0x03) << 8 | buf[2], len(buf)))
+        if self._debug >= 1:
+            print("Frame broken, discarding. Connection good?", e)
+            import sys
+            sys.print_exception(e)
+        raise CommError(errno.ETIMEDOUT)
+
+    def _received(self, cmd, num_params, len_packet, response_code, payload):
+        self.stats.rx(cmd, len_packet)
+        self.no_reply = bool(self._readbuf[1] & _FLAG_NO_REPLY)
+        if self.capture is not None:
+            self.capture.frame(0, self._readmv, len_packet)
         if self._debug >= 2:
             print("Received full frame:", cmd, num_params, len_packet, response_code, payload)
         return cmd, response_code, payload
@@ -233,61 +351,88 @@ class Frames:
     # @Profiler.measure
     def wait_and_read_message(self, timeout=1000):
         """wait for a new message until timeout in ms is reached"""
-        if not self._comm.wait_byte(_START_CMD, True, timeout=timeout):
-            raise OSError(errno.ETIMEDOUT)
+        if self.data_handler is not None:
+            self.wait_dispatch(_START_CMD, timeout)
+        elif not self._comm.wait_byte(_START_CMD, True, timeout=timeout):
+            self.stats.timeouts += 1
+            raise CommError(errno.ETIMEDOUT)
         # TODO: all uart can time out if packet breaks and will return None. No function can handle this yet!!
-        try:
-            cmd, num_params, len_packet, response_code, payload = self._read_packet()
-        except Exception as e:
-            if self._debug >= 1:
-                print("Frame broken, discarding. Connection good?", e)
-                import sys
-                sys.print_exception(e)
-            raise OSError(errno.ETIMEDOUT)
-        if self._debug >= 2:
-            print("Received full frame:", cmd, num_params, len_packet, response_code, payload)
-        return cmd, response_code, payload
+        return self.read_message()
 
     # @Profiler.measure
-    def _create_packet(self, cmd, num_params, response_code, *args, is_answer=False) -> list:
+    def _create_packet(self, cmd, num_params, response_code, args, start=0,
+                       is_answer=False) -> int:
+        """Creates the header and stores args[start:start+num_params] in self._params"""
         # num_params can be 0 with response_code and payload in header but
         # also >=1 with payload in params
         if self._debug >= 3:
-            print("cp", cmd, num_params, response_code, args, is_answer)
+            print("cp", cmd, num_params, response_code, args, start, is_answer)
         len_packet = _LEN_HEADER
-        params = []
+        if num_params > _MAX_PARAMS:
+            raise ValueError("param can't be >{!s}".format(_MAX_PARAMS))
         if num_params > 0:
-            types = []
-            for param in args:
-                param, t = self._transform_to_bytearray(param)
+            params = self._params
+            types = self._types
+            for i in range(num_params):
+                param, t = self._transform_to_bytearray(args[start + i])
                 len_packet += len(param)
-                params.append(param)
-                types.append(t)
-            len_packet += self._create_param_header(params, types)
+                params[i] = param
+                types[i] = t
+            len_packet += self._create_param_header(params, types, num_params)
         self._create_header(cmd, num_params, len_packet, response_code,
-                            args[0] if num_params == 0 and len(args) > 0 else None,  # resp_payload
+                            args[start] if num_params == 0 and len(args) > start else None,
+                            # resp_payload
                             is_answer=is_answer)
-        self._set_crc(num_params, params)
-        return params if num_params > 0 else []
+        self._len_head = _LEN_HEADER + num_params * 2
+        self._set_crc(num_params)
+        return num_params
+
+    def _create_schema_packet(self, cmd, schema, response_code, args, start, is_answer) -> int:
+        """Encodes the fixed size part of args[start:] with schema into _sendbuf after the
+        header, the bytes params are stored in self._params. Returns their number."""
+        l = _LEN_HEADER + schema.encode(self._sendmv, _LEN_HEADER, args, start, self._params)
+        self._create_header(cmd, 0, l, response_code, None, is_answer, _FLAG_SCHEMA)
+        self._len_head = _LEN_HEADER + schema.size
+        self._set_crc(schema.num_var)
+        return schema.num_var
 
     # @Profiler.measure
-    def _write_packet(self, num_params, *args):
+    def _write_packet(self, num_params):
         stu = time.ticks_us()
         self._comm.write_byte(_START_CMD)
-        sendbuf = memoryview(self._sendbuf)
-        self._comm.write(sendbuf[:_LEN_HEADER + num_params * 2])
-        for m in args:
-            self._comm.write(m)
+        self._comm.write(self._sendmv[:self._len_head])
+        params = self._params
+        cap = self.capture
+        if cap is not None:
+            cap.begin(_CAP_TX)
+            cap.add(self._sendmv[:self._len_head])
+        for i in range(num_params):
+            self._comm.write(params[i])
+            if cap is not None:
+                cap.add(params[i])
+            params[i] = None  # don't keep a reference to the application data
+        if cap is not None:
+            cap.commit()
+        buf = self._sendbuf
+        self.stats.tx(buf[0], (buf[1] & 0x03) << 8 | buf[2])
         if self._debug >= 3:
             print("writing took", time.ticks_us() - stu)
 
-    def create_packet(self, cmd, response_code: int = None, *args, is_answer=False) -> list:
-        if len(args) == 1 and type(args[0]) == int and args[0] < 256:
+    def create_packet(self, cmd, response_code: int = None, *args, is_answer=False) -> int:
+        return self._create_packet_from(cmd, response_code, args, 0, is_answer)
+
+    def _create_packet_from(self, cmd, response_code, args, start, is_answer) -> int:
+        """Create a packet with args[start:] as params without slicing args"""
+        num_params = len(args) - start
+        if response_code is None or response_code <= _RESP_TRUE:  # no schema for errors
+            schema = self._schemas.get(cmd | _REPLY_FLAG if is_answer else cmd)
+            if schema is not None and schema.num == num_params and args is not _NO_PAYLOAD:
+                return self._create_schema_packet(cmd, schema, response_code, args, start,
+                                                  is_answer)
+        if num_params == 1 and type(args[start]) == int and 0 <= args[start] < 256:
             num_params = 0
-        else:
-            num_params = len(args)
-        params = self._create_packet(cmd, num_params, response_code, *args, is_answer=is_answer)
-        return params
+        return self._create_packet(cmd, num_params, response_code, args, start,
+                                   is_answer=is_answer)
 
     def _is_answer(self, cmd, cmdr):
         if cmd | _REPLY_FLAG != cmdr:
@@ -295,26 +440,205 @@ class Frames:
                 print("not respone", cmd, cmdr)
             raise ValueError("not response")  # TODO: different error type?
 
+    def _create_data_header(self, op, socknum, length, payload=None):
+        buf = self._sendmv
+        buf[0] = op
+        buf[1] = (socknum >> 8) & 0xFF
+        buf[2] = socknum & 0xFF
+        buf[3] = (length >> 8) & 0xFF
+        buf[4] = length & 0xFF
+        buf[5] = 0
+        buf[6] = 0
+        crc = hash_update(0xceed, buf[:_LEN_HEADER])
+        if payload is not None:
+            crc = hash_update(crc, payload)
+        buf[5] = crc >> 8
+        buf[6] = crc & 0xFF
+
+    def send_data(self, op, socknum, length, payload=None):
+        """Send a data plane frame, payload is written directly from the given buffer"""
+        if length > 0xFFFF:
+            raise ValueError("param can't be >{!s}".format(0xFFFF))
+        if payload is not None:
+            op |= _DATA_PAYLOAD
+        self._create_data_header(op, socknum, length, payload)
+        self._comm.write_byte(_START_DATA)
+        self._comm.write(self._sendmv[:_LEN_HEADER])
+        if payload is not None:
+            self._comm.write(payload)
+        if self.capture is not None:
+            self.capture.begin(_CAP_TX | _CAP_DATA)
+            self.capture.add(self._sendmv[:_LEN_HEADER])
+            if payload is not None:
+                self.capture.add(payload)
+            self.capture.commit()
+        self.stats.tx(_STATS_DATA, _LEN_HEADER + (length if payload is not None else 0))
+
+    def read_data(self, buf: memoryview = None) -> (int, int, int, memoryview):
+        """Read a data plane frame after its start byte got received.
+        Returns op, socknum, length and the payload (memoryview of the read buffer or None).
+        A bigger buffer than the read buffer can be given for large frames."""
+        if buf is None:
+            buf = self._readmv
+        try:
+            self._comm.read_frame(buf, _LEN_HEADER)
+            end = self._data_end(buf)
+            if end > _LEN_HEADER:
+                # large frames take longer than the default timeout even at high baudrates
+                self._comm.read_frame(buf[_LEN_HEADER:], end - _LEN_HEADER,
+                                      10 + ((end - _LEN_HEADER) >> 3))
+            self._check_data(buf, end)
+        except Exception as e:
+            self._broken_data(buf, e)
+        return self._data_received(buf, end)
+
+    async def aread_data(self, buf: memoryview = None) -> (int, int, int, memoryview):
+        """Like read_data but other tasks keep running while the frame is received"""
+        if buf is None:
+            buf = self._readmv
+        try:
+            await self._comm.aread_frame(buf, _LEN_HEADER)
+            end = self._data_end(buf)
+            if end > _LEN_HEADER:
+                await self._comm.aread_frame(buf[_LEN_HEADER:], end - _LEN_HEADER,
+                                             10 + ((end - _LEN_HEADER) >> 3))
+            self._check_data(buf, end)
+        except Exception as e:
+            self._broken_data(buf, e)
+        return self._data_received(buf, end)
+
+    @staticmethod
+    def _data_end(buf) -> int:
+        """End of the data frame whose header is in buf"""
+        end = _LEN_HEADER
+        if buf[0] & _DATA_PAYLOAD:
+            end += buf[3] << 8 | buf[4]
+            if end > len(buf):
+                raise ValueError("Data frame too long: {}".format(end - _LEN_HEADER))
+        return end
+
+    def _check_data(self, buf, end):
+        crc = buf[5] << 8 | buf[6]
+        buf[5] = 0
+        buf[6] = 0
+        crc_new = hash_update(0xceed, buf[:end])
+        buf[5] = crc >> 8
+        buf[6] = crc & 0xFF
+        if crc_new != crc:
+            self.stats.crc_errors += 1
+            raise ValueError("CRC wrong, expected {!s} got {!s}".format(crc, crc_new))
+
+    def _broken_data(self, buf, e):
+        self.stats.broken += 1
+        if self.capture is not None:
+            l = _LEN_HEADER + (buf[3] << 8 | buf[4] if buf[0] & _DATA_PAYLOAD else 0)
+            self.capture.frame(_CAP_DATA | _CAP_BAD, buf, min(l, len(buf)))
+        if self._debug >= 1:
+            print("Data frame broken, discarding. Connection good?", e)
+        raise CommError(errno.ETIMEDOUT)
+
+    def _data_received(self, buf, end):
+        op = buf[0]
+        self.stats.rx(_STATS_DATA, end)
+        if self.capture is not None:
+            self.capture.frame(_CAP_DATA, buf, end)
+        if self._debug >= 2:
+            print("Received data frame:", op, buf[1] << 8 | buf[2], buf[3] << 8 | buf[4])
+        return op, buf[1] << 8 | buf[2], buf[3] << 8 | buf[4], \
+            buf[_LEN_HEADER:end] if op & _DATA_PAYLOAD else None
+
+    def wait_data(self, timeout=1000, buf: memoryview = None) -> (int, int, int, memoryview):
+        """wait for a data plane frame until timeout in ms is reached, see read_data"""
+        if self.data_handler is not None:
+            return self.wait_dispatch(_START_DATA, timeout, buf)
+        if not self._comm.wait_byte(_START_DATA, True, timeout=timeout):
+            self.stats.timeouts += 1
+            raise CommError(errno.ETIMEDOUT)
+        return self.read_data(buf)
+
+    def wait_dispatch(self, start=None, timeout=1000, buf=None):
+        """
+        Wait for a frame with start byte start while passing data frames to data_handler.
+        Returns the data frame for _START_DATA, None for _START_CMD (read the frame with
+        read_message). With start=None returns after the first frame data_handler consumed.
+        """
+        st = time.ticks_ms()
+        while True:
+            t = timeout - time.ticks_diff(time.ticks_ms(), st)
+            b = self._comm.wait_any(_STARTS, t) if t > 0 else None
+            if b is None:
+                self.stats.timeouts += 1
+                raise CommError(errno.ETIMEDOUT)
+            if b == _START_CMD:
+                if start == _START_CMD:
+                    return None
+                self.read_message()  # nobody waits for it, discard
+                continue
+            f = self.read_data(self.data_buf if buf is None else buf)
+            if self.data_handler(*f):
+                if start is None:
+                    return None
+            elif start == _START_DATA:
+                return f
+            elif self._debug >= 1:
+                print("Discarding unexpected data frame", f[0], f[1])
+
+    def send_data_wait_answer(self, op, socknum, length, payload=None, timeout=1000) -> (
+            int, memoryview):
+        """Send a data plane frame and wait for the answer. Returns the length and the payload
+        of the answer, raises OSError if the host answered with an error."""
+        stu = time.ticks_us()
+        self.send_data(op, socknum, length, payload)
+        opr, socknumr, lengthr, payloadr = self.wait_data(timeout)
+        self.stats.latency(_STATS_DATA, time.ticks_diff(time.ticks_us(), stu))
+        if not opr & _DATA_REPLY or opr & _DATA_OP != op & _DATA_OP or socknumr != socknum:
+            if self._debug >= 1:
+                print("not response", op, socknum, opr, socknumr)
+            raise ValueError("not response")
+        if opr & _DATA_ERROR:
+            raise OSError(lengthr)
+        return lengthr, payloadr
+
     # @Profiler.measure
     def send_cmd_wait_answer(self, cmd, params: list or tuple = (), timeout=1000) -> (
             int, list or tuple):
         if type(params) not in (list, tuple):
             params = (params,)
+        stu = time.ticks_us()
         self.create_and_send_packet(cmd, params=params, is_answer=False)
         cmdr, response_coder, paramsr = self.wait_and_read_message(timeout)
+        self.stats.latency(cmd, time.ticks_diff(time.ticks_us(), stu))
         if self._debug >= 3:
             print("scwa", cmdr, response_coder, paramsr)
         self._is_answer(cmd, cmdr)
         return self.translate_answer(response_coder, paramsr)
 
+    def send_cmd_no_reply(self, cmd, params: list or tuple = ()):
+        """Send a command the host doesn't answer, errors are only counted by the host"""
+        if type(params) not in (list, tuple):
+            params = (params,)
+        num_params = self._create_packet_from(cmd, None, params, 0, False)
+        self._sendbuf[1] |= _FLAG_NO_REPLY
+        self._set_crc(num_params)
+        self._write_packet(num_params)
+
     def create_and_send_packet(self, cmd, response_code: int = None, params: list or tuple = (),
                                is_answer=False):
         if type(params) not in (list, tuple):
             params = [params]
         if self._debug >= 3:
             print("casp", cmd, response_code, params)
-        params = self.create_packet(cmd, response_code, *params, is_answer=is_answer)
-        self._write_packet(len(params), *params)
+        num_params = self._create_packet_from(cmd, response_code, params, 0, is_answer)
+        self._write_packet(num_params)
+
+    def send_response(self, cmd, response_code, args, start=0):
+        """Send an answer with args[start:] as payload. Used by the dispatch loop to not
+        allocate a new tuple for every response."""
+        if start >= len(args):
+            args = _NO_PAYLOAD
+            start = 0
+        num_params = self._create_packet_from(cmd, response_code, args, start, True)
+        self._write_packet(num_params)
 
     @staticmethod
     def _find_exception(exc):
@@ -330,7 +654,8 @@ class Frames:
 
     def translate_answer(self, response_code, params=None):
         if response_code == _RESP_FALSE or response_code == _RESP_TRUE:
-            if params:
+            if params and params is not _NO_PAYLOAD and not (
+                    len(params) == 1 and params[0] is None):  # answer without payload
                 if type(params) in (list, tuple) and len(params) == 1:
                     return params[0]
                 else:
@@ -339,7 +664,7 @@ class Frames:
         elif response_code == _RESP_OSERROR:
             raise OSError(params[0])
         elif response_code == _RESP_EXCEPTION:
-            exc = self._find_exception(int(bytes(params[0])))
+            exc = self._find_exception(params[0])
             raise exc(bytes(params[1]).decode(), True, "Exc from host")
             # e.args[2]=True to be able to distinguish
             # between host exceptions and client exceptions during function call
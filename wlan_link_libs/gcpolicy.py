@@ -0,0 +1,93 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Garbage collection policy for the dispatch loops. A full collection after every frame adds
+# milliseconds of jitter to every reply, so collections only happen when the policy says so.
+
+import gc
+import time
+from micropython import const
+
+GC_EVERY_N = const(0)  # collect after every n handled frames
+GC_THRESHOLD = const(1)  # collect after a frame if mem_free dropped below threshold
+GC_IDLE = const(2)  # collect once the link has been idle for idle_ms
+
+
+class GCPolicy:
+    def __init__(self, mode=GC_THRESHOLD, every_n=16, threshold=8192, idle_ms=20):
+        self.mode = mode
+        self.every_n = every_n
+        self.threshold = threshold
+        self.idle_ms = idle_ms
+        self._cnt = 0  # frames since last collection
+        self._dirty = False  # frames handled since last collection
+        self._alloc_start = 0
+        self._last_frame = time.ticks_ms()
+        # counters, can be read directly
+        self.frames = 0
+        self.alloc_last = 0  # bytes allocated while handling the last frame
+        self.alloc_max = 0
+        self.alloc_total = 0
+        self.alloc_frames = 0  # frames that allocated anything
+        self.collections = 0
+        self.gc_us_last = 0
+        self.gc_us_max = 0
+        self.gc_us_total = 0
+
+    def frame_start(self):
+        self._alloc_start = gc.mem_alloc()
+
+    def frame_end(self):
+        """Call after a frame got handled. Updates counters and collects if the policy says so."""
+        a = gc.mem_alloc() - self._alloc_start
+        if a < 0:  # automatic collection during the frame, allocation unknown
+            a = 0
+        self.alloc_last = a
+        if a:
+            self.alloc_total += a
+            self.alloc_frames += 1
+            if a > self.alloc_max:
+                self.alloc_max = a
+        self.frames += 1
+        self._cnt += 1
+        self._dirty = True
+        self._last_frame = time.ticks_ms()
+        if self.mode == GC_EVERY_N:
+            if self._cnt >= self.every_n:
+                self.collect()
+        elif self.mode == GC_THRESHOLD:
+            if gc.mem_free() < self.threshold:
+                self.collect()
+        # GC_IDLE collects in idle()
+
+    def idle(self):
+        """Call periodically while the link is idle. Collects in GC_IDLE mode and as a fallback
+        if memory runs low in the other modes."""
+        if not self._dirty:
+            return False
+        if self.mode == GC_IDLE:
+            if time.ticks_diff(time.ticks_ms(), self._last_frame) < self.idle_ms:
+                return False
+        elif gc.mem_free() >= self.threshold:
+            return False
+        self.collect()
+        return True
+
+    def collect(self):
+        st = time.ticks_us()
+        gc.collect()
+        d = time.ticks_diff(time.ticks_us(), st)
+        self.collections += 1
+        self.gc_us_last = d
+        self.gc_us_total += d
+        if d > self.gc_us_max:
+            self.gc_us_max = d
+        self._cnt = 0
+        self._dirty = False
+
+    def gc_us_per_frame(self):
+        return self.gc_us_total // self.frames if self.frames else 0
@@ -0,0 +1,82 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Bit packing of the frame header and the param header, used by Frames for every frame.
+# On MicroPython the viper implementation in header_viper is used if the port has the viper
+# emitter, otherwise (and on CPython, e.g. for the tests) these pure Python functions.
+#
+# Header: [cmd, flags|num_params<<2|len_hi, len_lo, response_code<<4, payload, crc_hi, crc_lo]
+# Param header: 2 bytes per param, [type<<2|len_hi, len_lo]
+#
+# The viper emitter only supports 4 arguments, so the flags of header byte 1 are given in
+# bits 8-15 of cmd. The pack functions return 0 or the limit of the first value that is out
+# of range, the caller raises the error.
+
+IMPLEMENTATION = "python"
+
+
+def pack_header(buf, cmd, num_params, len_packet):
+    """Write header bytes 0-2, cmd can contain the flags of byte 1 in bits 8-15"""
+    if cmd < 0 or cmd > 0xFFFF or cmd & 0x3F00:
+        return 255
+    if num_params < 0 or num_params > 15:
+        return 15
+    if len_packet < 0 or len_packet > 1023:
+        return 1023
+    buf[0] = cmd & 0xFF
+    buf[1] = (cmd >> 8) | (num_params << 2) | (len_packet >> 8)
+    buf[2] = len_packet & 0xFF
+    return 0
+
+
+def pack_response(buf, response_code, payload):
+    """Write header bytes 3-4"""
+    if response_code < 0 or response_code > 15:
+        return 15
+    if payload < 0 or payload > 255:
+        return 255
+    buf[3] = response_code << 4
+    buf[4] = payload
+    return 0
+
+
+def unpack_header(buf):
+    """Returns cmd, num_params, len_packet, response_code, payload and crc"""
+    b1 = buf[1]
+    return buf[0], (b1 & 0x3C) >> 2, (b1 & 0x03) << 8 | buf[2], buf[3] >> 4, buf[4], \
+           buf[5] << 8 | buf[6]
+
+
+def pack_param_header(buf, params, types, num_params):
+    """Write the param header of params[:num_params] after the header, returns its length"""
+    p = 7
+    for i in range(num_params):
+        l = len(params[i])
+        buf[p] = (types[i] << 2) & 0x1C | ((l >> 8) & 0x03)
+        buf[p + 1] = l & 0xFF
+        p += 2
+    return num_params * 2
+
+
+def unpack_param_header(head, lengths, types):
+    """Store length and type of every param of head in lengths (array "H") and types
+    (bytearray), returns the number of params"""
+    n = len(head) >> 1
+    for i in range(n):
+        b = head[i * 2]
+        lengths[i] = (b & 0x03) << 8 | head[i * 2 + 1]
+        types[i] = (b & 0x1C) >> 2
+    return n
+
+
+try:
+    from .header_viper import pack_header, pack_response, unpack_header, \
+        pack_param_header, unpack_param_header
+
+    IMPLEMENTATION = "viper"
+except (ImportError, SyntaxError, ValueError):  # no viper emitter, e.g. CPython
+    pass
@@ -0,0 +1,76 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Viper implementation of wlan_link_libs.header, selected there at import time.
+# Same functions and results as the pure Python version, see there for the formats.
+
+import sys
+
+if sys.implementation.name != "micropython":
+    raise ImportError("viper needs MicroPython")
+
+import micropython
+
+
+@micropython.viper
+def pack_header(buf, cmd: int, num_params: int, len_packet: int) -> int:
+    if uint(cmd) > 0xFFFF or cmd & 0x3F00:
+        return 255
+    if uint(num_params) > 15:
+        return 15
+    if uint(len_packet) > 1023:
+        return 1023
+    b = ptr8(buf)
+    b[0] = cmd & 0xFF
+    b[1] = (cmd >> 8) | (num_params << 2) | (len_packet >> 8)
+    b[2] = len_packet & 0xFF
+    return 0
+
+
+@micropython.viper
+def pack_response(buf, response_code: int, payload: int) -> int:
+    if uint(response_code) > 15:
+        return 15
+    if uint(payload) > 255:
+        return 255
+    b = ptr8(buf)
+    b[3] = response_code << 4
+    b[4] = payload
+    return 0
+
+
+@micropython.viper
+def unpack_header(buf):
+    b = ptr8(buf)
+    b1 = b[1]
+    return b[0], (b1 & 0x3C) >> 2, (b1 & 0x03) << 8 | b[2], b[3] >> 4, b[4], b[5] << 8 | b[6]
+
+
+@micropython.viper
+def pack_param_header(buf, params, types, num_params: int) -> int:
+    b = ptr8(buf)
+    t = ptr8(types)
+    p = 7
+    for i in range(num_params):
+        l = int(len(params[i]))
+        b[p] = ((t[i] << 2) & 0x1C) | ((l >> 8) & 0x03)
+        b[p + 1] = l & 0xFF
+        p += 2
+    return num_params * 2
+
+
+@micropython.viper
+def unpack_param_header(head, lengths, types) -> int:
+    h = ptr8(head)
+    ls = ptr16(lengths)
+    t = ptr8(types)
+    n = int(len(head)) >> 1
+    for i in range(n):
+        b = h[i * 2]
+        ls[i] = (b & 0x03) << 8 | h[i * 2 + 1]
+        t[i] = (b & 0x1C) >> 2
+    return n
@@ -2,8 +2,8 @@
 # Copyright Kevin Köck 2021 Released under the MIT license
 # Created on 2021-03-14 
 
-__updated__ = "2021-03-15"
-__version__ = "0.3"
+__updated__ = "2026-10-19"
+__version__ = "0.4"
 
 import time
 
@@ -26,7 +26,7 @@ class Ringbuf:
         else:
             a[:len(mem)] = mem
         self._p_add += len(mem)
-        if self._p_add > self._length:
+        if self._p_add >= self._length:
             self._p_add -= self._length
         return True
 
@@ -38,7 +38,7 @@ class Ringbuf:
 
     def advance_read(self, amount):
         self._p_read += amount
-        if self._p_read > self._length:
+        if self._p_read >= self._length:
             self._p_read -= self._length
         # TODO: activate after having tested ringbuffer
         # if self._p_read == self._p_add:  # buffer empty
@@ -55,6 +55,10 @@ class Ringbuf:
     def any(self):
         return self._length - self._free()
 
+    def space(self):
+        """Bytes that can be appended"""
+        return self._free() - 1
+
     def _get(self, amount=-1, blocking=False, timeout=None, mmview=False):
         """
         Returns given amount of bytes from Ringbuf.
@@ -67,6 +71,7 @@ class Ringbuf:
             amount = self._length - 1
         if blocking and not self.wait_available(amount, timeout=timeout):
             return False
+        amount = min(amount, self.any())  # don't advance past the written data
         a, b = self._full_slices_mmview()
         if amount <= len(a):
             if not mmview:
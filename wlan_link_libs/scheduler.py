@@ -0,0 +1,54 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Priority classes for frames that are sent without a request per frame (e.g. streams).
+# The dispatch loop only sends one of these frames when no received frame is waiting, so
+# commands and their answers preempt bulk transfers at frame boundaries.
+# Jobs of the same class take turns frame by frame, so every socket gets a fair share.
+# Jobs without frames (e.g. writing the send queue of a socket) use the same turns.
+
+from micropython import const
+
+PRIO_CONTROL = const(0)
+PRIO_INTERACTIVE = const(1)
+PRIO_BULK = const(2)
+
+
+class Scheduler:
+    def __init__(self):
+        self._queues = ([], [], [])
+
+    def add(self, job, prio=PRIO_BULK):
+        """
+        job.step() sends at most one frame and returns True if it has more frames to send,
+        False if it is finished or None if it can't send a frame right now
+        (e.g. waiting for data or a credit).
+        """
+        if not PRIO_CONTROL <= prio <= PRIO_BULK:
+            raise ValueError("Unknown priority class {}".format(prio))
+        self._queues[prio].append(job)
+
+    def remove(self, job):
+        for q in self._queues:
+            if job in q:
+                q.remove(job)
+
+    def pending(self) -> bool:
+        return bool(self._queues[0] or self._queues[1] or self._queues[2])
+
+    def step(self) -> bool:
+        """Let the first job of the highest class that can send a frame send one.
+        Returns False if no job could send a frame."""
+        for q in self._queues:
+            for _ in range(len(q)):
+                job = q.pop(0)
+                r = job.step()
+                if r is not False:
+                    q.append(job)  # back of the line, fair share within the class
+                if r is not None:
+                    return True
+        return False
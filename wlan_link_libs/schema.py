@@ -0,0 +1,73 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.2"
+
+# Fixed command signatures like (int, bytes, bool) compiled into a single struct format.
+# Fixed size params and the lengths of all bytes params are packed with one pack_into,
+# the bytes params follow without any per-param header. They are written from the buffers
+# of the caller like the params of the generic encoding, so they don't have to fit into
+# the send buffer.
+# Both sides of the link have to register the same signature for a command.
+
+import struct
+
+_FORMATS = {int: "i", float: "f", bool: "B", bytes: "H", str: "H"}
+
+
+class Schema:
+    def __init__(self, signature: tuple):
+        fmt = "<"
+        var = []
+        bools = []
+        for i, t in enumerate(signature):
+            if t not in _FORMATS:
+                raise TypeError("Type {} not supported in a schema".format(t))
+            fmt += _FORMATS[t]
+            if t in (bytes, str):
+                var.append(i)
+            elif t is bool:
+                bools.append(i)
+        self.fmt = fmt
+        self.size = struct.calcsize(fmt)
+        self.num = len(signature)
+        self._var = tuple(var)
+        self._bools = tuple(bools)
+        self.num_var = len(var)
+        self._vals = [0] * self.num  # reused for every encode
+
+    def encode(self, buf, offset, args, start, data) -> int:
+        """Packs the fixed size part of args[start:start+num] into buf at offset and stores
+        the bytes params in data[:num_var], they follow in this order.
+        Returns the length of all params."""
+        if offset + self.size > len(buf):
+            raise ValueError("Params too long")
+        vals = self._vals
+        for i in range(self.num):
+            vals[i] = args[start + i]
+        l = self.size
+        for j, i in enumerate(self._var):
+            d = vals[i]
+            if type(d) == str:
+                d = d.encode()
+            data[j] = d
+            vals[i] = len(d)
+            l += len(d)
+        struct.pack_into(self.fmt, buf, offset, *vals)
+        return l
+
+    def decode(self, buf: memoryview, offset, end) -> list:
+        """Unpacks params from buf[offset:end], bytes params are memoryviews into buf"""
+        params = list(struct.unpack_from(self.fmt, buf, offset))
+        p = offset + self.size
+        for i in self._var:
+            l = params[i]
+            if p + l > end:
+                raise ValueError("Param length exceeds frame")
+            params[i] = buf[p:p + l]
+            p += l
+        for i in self._bools:
+            params[i] = params[i] == 1
+        return params
@@ -0,0 +1,118 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2021 Released under the MIT license
+# Created on 2026-10-19
+
+__updated__ = "2026-10-19"
+__version__ = "0.1"
+
+# Counters about the link health. Used on host and client, the host sends them in a compact
+# binary format to the client so no json.dumps is needed.
+
+from micropython import const
+import struct
+import array
+
+_VERSION = const(1)
+_NUM_BUCKETS = const(10)  # latency buckets: <128us, <256us, ..., <32ms, >=32ms
+_FRAMES_RX = const(0)
+_BYTES_RX = const(1)
+_FRAMES_TX = const(2)
+_BYTES_TX = const(3)
+_HIST = const(4)
+
+# version, next_cmd, crc_errors, timeouts, broken, resyncs, mem_free, num_sockets,
+# socket_bytes_in, socket_bytes_out, num_records
+_FMT_GLOBAL = "<BBIIIIIHIIB"
+_LEN_GLOBAL = const(33)
+# cmd, frames_rx, bytes_rx, frames_tx, bytes_tx, histogram
+_FMT_RECORD = "<BIIII10H"
+_LEN_RECORD = const(37)
+
+
+def _bucket(us):
+    b = 0
+    us >>= 7
+    while us and b < _NUM_BUCKETS - 1:
+        us >>= 1
+        b += 1
+    return b
+
+
+class LinkStats:
+    def __init__(self):
+        self.crc_errors = 0
+        self.timeouts = 0
+        self.broken = 0  # frames that couldn't be read completely
+        self._cmds = {}  # cmd -> array of counters and latency histogram
+
+    def _get(self, cmd):
+        cmd &= 0x7F  # count requests and answers in the same record
+        c = self._cmds.get(cmd)
+        if c is None:
+            c = array.array("I", [0] * (_HIST + _NUM_BUCKETS))
+            self._cmds[cmd] = c
+        return c
+
+    def rx(self, cmd, length):
+        c = self._get(cmd)
+        c[_FRAMES_RX] += 1
+        c[_BYTES_RX] = (c[_BYTES_RX] + length) & 0xFFFFFFFF
+
+    def tx(self, cmd, length):
+        c = self._get(cmd)
+        c[_FRAMES_TX] += 1
+        c[_BYTES_TX] = (c[_BYTES_TX] + length) & 0xFFFFFFFF
+
+    def latency(self, cmd, us):
+        """Add a handler latency (host) or round trip time (client) to the histogram of cmd"""
+        self._get(cmd)[_HIST + _bucket(us)] += 1
+
+    def reset(self):
+        self.crc_errors = self.timeouts = self.broken = 0
+        self._cmds = {}
+
+    def pack_into(self, buf, start_cmd=0, resyncs=0, mem_free=0, num_sockets=0, bytes_in=0,
+                  bytes_out=0) -> int:
+        """
+        Pack the counters into buf, starting with command start_cmd.
+        Only as many commands as fit into buf are packed, the next command to request is
+        returned in the packet. Returns the length of the packet.
+        """
+        cmds = sorted(c for c in self._cmds if c >= start_cmd)
+        n = (len(buf) - _LEN_GLOBAL) // _LEN_RECORD
+        if n < len(cmds):
+            nxt = cmds[n]
+        else:
+            nxt = 0
+            n = len(cmds)
+        struct.pack_into(_FMT_GLOBAL, buf, 0, _VERSION, nxt, self.crc_errors, self.timeouts,
+                         self.broken, resyncs, mem_free, num_sockets, bytes_in & 0xFFFFFFFF,
+                         bytes_out & 0xFFFFFFFF, n)
+        for i in range(n):
+            c = self._cmds[cmds[i]]
+            h = [min(c[_HIST + j], 0xFFFF) for j in range(_NUM_BUCKETS)]
+            struct.pack_into(_FMT_RECORD, buf, _LEN_GLOBAL + i * _LEN_RECORD, cmds[i],
+                             c[_FRAMES_RX], c[_BYTES_RX], c[_FRAMES_TX], c[_BYTES_TX], *h)
+        return _LEN_GLOBAL + n * _LEN_RECORD
+
+    @staticmethod
+    def unpack(buf, st=None) -> (dict, int):
+        """Unpack a stats packet into dict st. Returns st and the next command to request."""
+        if st is None:
+            st = {"commands": {}}
+        g = struct.unpack_from(_FMT_GLOBAL, buf, 0)
+        if g[0] != _VERSION:
+            raise ValueError("Unknown stats version {}".format(g[0]))
+        st["crc_errors"] = g[2]
+        st["timeouts"] = g[3]
+        st["broken"] = g[4]
+        st["resyncs"] = g[5]
+        st["mem_free"] = g[6]
+        st["num_sockets"] = g[7]
+        st["socket_bytes_in"] = g[8]
+        st["socket_bytes_out"] = g[9]
+        for i in range(g[10]):
+            r = struct.unpack_from(_FMT_RECORD, buf, _LEN_GLOBAL + i * _LEN_RECORD)
+            st["commands"][r[0]] = {"frames_rx": r[1], "bytes_rx": r[2], "frames_tx": r[3],
+                                    "bytes_tx": r[4], "latency": r[5:]}
+        return st, g[1]
@@ -2,13 +2,12 @@
 # Copyright Kevin Köck 2021 Released under the MIT license
 # Created on 2021-02-07 
 
-__updated__ = "2021-02-09"
-__version__ = "0.2"
+__updated__ = "2026-10-19"
+__version__ = "0.3"
 
 import machine
 import uasyncio as asyncio
 import time
-from .profiler import Profiler
 
 
 # from wlan_link_libs.frames import _LEN_HEADER
@@ -19,18 +18,113 @@ class CommError(OSError):
 
 
 class WUart:
-    def __init__(self, uart: machine.UART, debug: int = 0):
+    def __init__(self, uart: machine.UART, debug: int = 0, irq=False, irq_pin=None,
+                 spin_us=300):
+        """
+        Synchronous waits for data poll uart.any() every ms by default. With irq they are
+        woken by the UART RX interrupt or, if the port doesn't support it, by an edge
+        interrupt on irq_pin (e.g. the RX pin, every start bit is a falling edge), which is
+        only armed while waiting.
+        spin_us: poll without sleeping for this long before waiting for the interrupt.
+        """
         self._uart = uart
         self._ustream = asyncio.StreamReader(uart)
         self._debug = debug
+        self.resyncs = 0  # searches for a start byte that had to discard data
+        self.discarded = 0  # bytes discarded while searching for a start byte
+        self.spin_us = spin_us
+        self.wake_mode = "poll"
+        self._flag = False
+        self._irq_pin = None
+        self._irq_us = 0
+        # wake-up latency from the interrupt to the waiting code
+        self.wakes = 0
+        self.wake_us_last = 0
+        self.wake_us_max = 0
+        self.wake_us_total = 0
+        if irq:
+            self.enable_irq(irq_pin)
+
+    def enable_irq(self, pin=None) -> bool:
+        """Wake synchronous waits by an interrupt, returns False if only polling is possible"""
+        U = machine.UART
+        trigger = None
+        for name in ("IRQ_RX", "RX_ANY", "IRQ_RXIDLE"):  # depends on the port
+            trigger = getattr(U, name, None)
+            if trigger is not None:
+                break
+        if trigger is not None:
+            try:
+                self._uart.irq(handler=self._irq, trigger=trigger)
+                self.wake_mode = "uart_irq"
+                return True
+            except (AttributeError, TypeError, ValueError, OSError):
+                pass
+        if pin is None:
+            return False
+        # armed by _idle only while waiting, every received byte is a falling edge
+        self._irq_pin = pin
+        self.wake_mode = "pin_irq"
+        return True
+
+    def _irq(self, _):
+        if not self._flag:
+            self._irq_us = time.ticks_us()
+            self._flag = True
+
+    def _idle(self, poll_us=1000):
+        """Wait until data might have been received"""
+        stu = time.ticks_us()
+        uart = self._uart
+        while not uart.any() and time.ticks_diff(time.ticks_us(), stu) < self.spin_us:
+            pass
+        if uart.any():
+            return
+        if self.wake_mode == "poll":
+            time.sleep_us(poll_us)
+            return
+        # only interrupts during the wait count, bytes read before (e.g. by read_frame) also
+        # fired one
+        st = machine.disable_irq()
+        self._flag = False
+        machine.enable_irq(st)
+        pin = self._irq_pin if self.wake_mode == "pin_irq" else None
+        if pin is not None:
+            pin.irq(handler=self._irq, trigger=machine.Pin.IRQ_FALLING, hard=True)
+        try:
+            if uart.any():  # received before the flag got cleared or the pin got armed
+                return
+            while not self._flag:
+                machine.idle()  # sleeps until the next interrupt, also the system tick
+                if time.ticks_diff(time.ticks_us(), stu) > 1000:
+                    return  # let the caller check the timeout
+        finally:
+            if pin is not None:
+                pin.irq(handler=None)
+        self._flag = False
+        us = time.ticks_diff(time.ticks_us(), self._irq_us)
+        self.wakes += 1
+        self.wake_us_last = us
+        self.wake_us_total += us
+        if us > self.wake_us_max:
+            self.wake_us_max = us
+
+    def wake_stats(self) -> dict:
+        return {"mode": self.wake_mode, "wakes": self.wakes, "us_last": self.wake_us_last,
+                "us_max": self.wake_us_max,
+                "us_avg": self.wake_us_total // self.wakes if self.wakes else 0}
 
     def get_ready(self):
         self._flush_uart()
 
+    def any(self) -> int:
+        return self._uart.any()
+
     async def await_byte(self, b, wait=True):
         stu = time.ticks_us()
         if self._debug >= 3:
             print("Awaiting", b)
+        discarded = 0
         while True:
             data = await self._ustream.read(1)
             if self._debug >= 3:
@@ -38,11 +132,41 @@ class WUart:
             if data[0] == b:
                 if self._debug >= 3:
                     print("Found", data, "waited", time.ticks_diff(time.ticks_us(), stu))
+                self._count_discarded(discarded)
                 return True
             elif not wait:
                 if self._debug >= 1:
                     print("Read", data, "Expected", b)
+                self._count_discarded(discarded + 1)
                 return False
+            discarded += 1
+
+    async def await_any(self, bs):
+        """Wait for any of the bytes in bs, returns the byte found"""
+        discarded = 0
+        while True:
+            data = await self._ustream.read(1)
+            if data[0] in bs:
+                self._count_discarded(discarded)
+                return data[0]
+            discarded += 1
+
+    def wait_any(self, bs, timeout=None):
+        """Wait for any of the bytes in bs, returns the byte found or None on timeout"""
+        st = time.ticks_ms()
+        discarded = 0
+        while True:
+            if self._uart.any():
+                b = self._uart.read(1)[0]
+                if b in bs:
+                    self._count_discarded(discarded)
+                    return b
+                discarded += 1
+            elif timeout and time.ticks_diff(time.ticks_ms(), st) > timeout:
+                self._count_discarded(discarded)
+                return None
+            else:
+                self._idle()
 
     # @Profiler.measure
     def wait_byte(self, b, wait=True, timeout=None):
@@ -50,6 +174,7 @@ class WUart:
         stu = time.ticks_us()
         if self._debug >= 3:
             print("Waiting for", b, "t", timeout)
+        discarded = 0
         while True:
             if self._uart.any():
                 data = self._uart.read(1)
@@ -57,18 +182,27 @@ class WUart:
                     print("Read byte", data[0])
             else:
                 if timeout and time.ticks_diff(time.ticks_ms(), st) > timeout:
+                    self._count_discarded(discarded)
                     return False
-                time.sleep_ms(1)
+                self._idle()
                 continue
             if data[0] == b:
                 if self._debug >= 3:
                     etu = time.ticks_us()
                     print("Found", data, "waited", time.ticks_diff(etu, stu))
+                self._count_discarded(discarded)
                 return True
             elif not wait:
                 if self._debug >= 1:
                     print("Read", data, "Expected", b)
+                self._count_discarded(discarded + 1)
                 return False
+            discarded += 1
+
+    def _count_discarded(self, discarded):
+        if discarded:
+            self.resyncs += 1
+            self.discarded += discarded
 
     def _flush_uart(self):
         while self._uart.any():
@@ -104,16 +238,17 @@ class WUart:
         to_read = length
         st = time.ticks_ms()
         stu = time.ticks_us()
+        mv = memoryview(buffer)
         while to_read and time.ticks_diff(time.ticks_ms(), st) < timeout:
             if self._uart.any():
-                r = self._uart.readinto(buffer, to_read)
+                r = self._uart.readinto(mv[length - to_read:], to_read)
                 if r is None:
                     if self._debug >= 1:
                         print("No more data on uart, expected", length, "got", r, "bytes")
                     raise CommError("Short read on uart")
                 to_read -= r
             else:
-                time.sleep_us(100)
+                self._idle(100)
         if to_read:
             if self._debug >= 1:
                 print("Timeout reading frame")
@@ -121,3 +256,30 @@ class WUart:
         if self._debug >= 3:
             etu = time.ticks_us()
             print("reading frame took", time.ticks_diff(etu, stu))
+
+    async def aread_frame(self, buffer, length, timeout=10):
+        """Like read_frame but waits in the event loop, other tasks keep running meanwhile"""
+        mv = memoryview(buffer)
+        uart = self._uart
+        got = 0
+        st = time.ticks_ms()
+        while got < length:
+            if uart.any():
+                r = uart.readinto(mv[got:length])
+                if r is None:
+                    if self._debug >= 1:
+                        print("No more data on uart, expected", length, "got", got, "bytes")
+                    raise CommError("Short read on uart")
+                got += r
+                continue
+            t = timeout - time.ticks_diff(time.ticks_ms(), st)
+            if t <= 0:
+                if self._debug >= 1:
+                    print("Timeout reading frame")
+                raise CommError("Short read on uart with timeout")
+            try:
+                r = await asyncio.wait_for_ms(self._ustream.readinto(mv[got:length]), t)
+            except asyncio.TimeoutError:
+                continue
+            if r:
+                got += r